@@ -0,0 +1,361 @@
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Iterator, Literal
+
+import boto3
+import duckdb
+import pyarrow as pa
+from chameleon.db import ChameleonDB, Layout
+from chameleon.events import event_batch, event_message
+from chameleon.framing import Framing, parse_messages
+from chameleon.generated.chameleon_pb2 import Metadata
+from chameleon.local_store import LocalS3Client
+from chameleon.pipeline import DecodedObject, day_prefix, decode_messages, write_object
+from chameleon.s3 import ChameleonS3Client
+from chameleon.synthetic import DAY_MS, DEFAULT_MIX, write_objects
+
+"""Type for where the benchmark objects are served from"""
+type Store = Literal["local", "moto"]
+
+BENCHMARK_BUCKET = "chameleon-benchmark"
+
+# readings of all CADs over one day, as in binning.sql
+RANGE_QUERY = """
+    SELECT cad_id, AVG(reading), COUNT(*)
+    FROM power_events
+    WHERE reading_timestamp >= $start
+        AND reading_timestamp < $end
+    GROUP BY cad_id"""
+
+# readings of one CAD over one day
+CAD_QUERY = """
+    SELECT AVG(reading), COUNT(*)
+    FROM power_events
+    WHERE cad_id = $cad_id
+        AND reading_timestamp >= $start
+        AND reading_timestamp < $end"""
+
+PARQUET_RANGE_QUERY = """
+    SELECT cad_id, AVG(reading), COUNT(*)
+    FROM read_parquet($path, hive_partitioning = true)
+    WHERE date = $date
+    GROUP BY cad_id"""
+
+
+@dataclass
+class LayoutResult:
+    """Timings of one layout, in seconds."""
+
+    layout: Layout
+    events: int
+    # the history, one batch per day
+    load_seconds: float
+    # one more day, one batch per file
+    insert_seconds: float
+    # the same files sent again, all events already stored
+    duplicate_insert_seconds: float
+    range_seconds: float
+    cad_seconds: float
+    compacted_range_seconds: float | None = None
+    compacted_cad_seconds: float | None = None
+    parquet_range_seconds: float | None = None
+
+
+def power_batches(
+    start: datetime, days: int, cads: int, period_seconds: int, batch_minutes: int
+) -> Iterator[pa.Table]:
+    """
+    Synthetic power events of `cads` CADs, one every `period_seconds`, in
+    time order. Each batch holds `batch_minutes` of readings of every CAD,
+    like one S3 file.
+    """
+    schema = event_batch([], event_message("power_event")).schema
+    start_ms = int(start.timestamp() * 1000)
+    step = period_seconds * 1000
+    batch_ms = batch_minutes * 60_000
+
+    for batch_start in range(start_ms, start_ms + days * DAY_MS, batch_ms):
+        timestamps = [
+            t
+            for t in range(batch_start, batch_start + batch_ms, step)
+            for _ in range(cads)
+        ]
+        n = len(timestamps)
+        yield pa.table(
+            {
+                "event_id": [str(uuid.uuid4()) for _ in range(n)],
+                "received": timestamps,
+                "cad_id": [f"cad{i:03d}" for i in range(cads)] * (n // cads),
+                "commodity": [0] * n,
+                "reading_timestamp": timestamps,
+                "source": [0] * n,
+                "reading": [i % 3000 for i in range(n)],
+                "ambient": [0] * n,
+                "event_metadata": [[]] * n,
+            },
+            schema=schema,
+        )
+
+
+def best_time(
+    db: duckdb.DuckDBPyConnection,
+    query: str,
+    parameters: dict[str, object],
+    repeat: int = 5,
+) -> float:
+    """Fastest of `repeat` runs of `query`."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        db.execute(query, parameters).fetchall()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def benchmark_layout(
+    layout: Layout,
+    directory: Path,
+    start: datetime,
+    days: int,
+    cads: int,
+    period_seconds: int,
+    batch_minutes: int,
+) -> LayoutResult:
+    """
+    Load `days` of synthetic events into a new database, time inserting one
+    more day file by file, then query a day of the history.
+    """
+    db = ChameleonDB(directory / f"{layout}.duckdb", layout=layout)
+
+    load_start = time.perf_counter()
+    for batch in power_batches(start, days, cads, period_seconds, 24 * 60):
+        db.insert_event_batch("power_event", batch)
+    load_seconds = time.perf_counter() - load_start
+
+    files = list(
+        power_batches(
+            start + timedelta(days=days), 1, cads, period_seconds, batch_minutes
+        )
+    )
+    insert_start = time.perf_counter()
+    for batch in files:
+        db.insert_event_batch("power_event", batch)
+    insert_seconds = time.perf_counter() - insert_start
+
+    duplicate_start = time.perf_counter()
+    for batch in files:
+        db.insert_event_batch("power_event", batch)
+    duplicate_insert_seconds = time.perf_counter() - duplicate_start
+
+    day = start + timedelta(days=days // 2)
+    window = {"start": day, "end": day + timedelta(days=1)}
+    cad = window | {"cad_id": "cad000"}
+
+    result = LayoutResult(
+        layout=layout,
+        events=db.db.execute("SELECT count(*) FROM power_events").fetchone()[0],
+        load_seconds=load_seconds,
+        insert_seconds=insert_seconds,
+        duplicate_insert_seconds=duplicate_insert_seconds,
+        range_seconds=best_time(db.db, RANGE_QUERY, window),
+        cad_seconds=best_time(db.db, CAD_QUERY, cad),
+    )
+
+    if layout == "sorted":
+        db.compact()
+        result.compacted_range_seconds = best_time(db.db, RANGE_QUERY, window)
+        result.compacted_cad_seconds = best_time(db.db, CAD_QUERY, cad)
+
+        db.export_parquet(directory / "parquet")
+        result.parquet_range_seconds = best_time(
+            db.db,
+            PARQUET_RANGE_QUERY,
+            {
+                "path": str(
+                    directory / "parquet" / "power_events" / "**" / "*.parquet"
+                ),
+                "date": day.date(),
+            },
+        )
+
+    db.db.close()
+    return result
+
+
+def benchmark_layouts(
+    start: datetime = datetime(2025, 2, 10),
+    days: int = 14,
+    cads: int = 50,
+    period_seconds: int = 10,
+    batch_minutes: int = 30,
+) -> list[LayoutResult]:
+    """Compare the indexed and sorted layouts on the same synthetic events."""
+    with tempfile.TemporaryDirectory() as directory:
+        return [
+            benchmark_layout(
+                layout,
+                Path(directory),
+                start,
+                days,
+                cads,
+                period_seconds,
+                batch_minutes,
+            )
+            for layout in ("indexed", "sorted")
+        ]
+
+
+@dataclass
+class StageResult:
+    """Time spent in one ingestion stage over all objects."""
+
+    stage: str
+    seconds: float
+    events: int
+    # size of the objects, for every stage
+    bytes: int
+
+    @property
+    def events_per_second(self) -> float:
+        return self.events / self.seconds if self.seconds else 0.0
+
+    @property
+    def mb_per_second(self) -> float:
+        return self.bytes / 1e6 / self.seconds if self.seconds else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.stage:<10} {self.seconds:8.2f}s "
+            f"{self.events_per_second:12,.0f} events/s "
+            f"{self.mb_per_second:8.2f} MB/s"
+        )
+
+
+@contextmanager
+def s3_store(store: Store, root: Path) -> Iterator[Any]:
+    """An S3 client serving the files under `root` as BENCHMARK_BUCKET."""
+    if store == "local":
+        yield LocalS3Client(root)
+        return
+
+    # moto is only needed to benchmark against a mocked S3 API
+    from moto import mock_aws
+
+    with mock_aws():
+        client = boto3.client("s3", region_name="eu-west-2")
+        client.create_bucket(
+            Bucket=BENCHMARK_BUCKET,
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        for path in sorted(root.rglob("*.pb")):
+            client.upload_file(
+                str(path), BENCHMARK_BUCKET, path.relative_to(root).as_posix()
+            )
+        yield client
+
+
+def benchmark_ingest(
+    store: Store = "local",
+    start: datetime = datetime(2025, 2, 10),
+    days: int = 1,
+    files_per_day: int = 48,
+    messages_per_file: int = 10,
+    events_per_message: int = 100,
+    mix: dict[str, float] = DEFAULT_MIX,
+    framing: Framing = "delimited",
+    layout: Layout = "indexed",
+) -> list[StageResult]:
+    """
+    Time each stage of ingesting synthetic objects, one object at a time:
+    fetch (get_object and read), decode (protobuf parsing), transform
+    (grouping events into Arrow batches) and insert (into a new database).
+    The last result, "pipeline", is the whole ingestion as run by
+    `add_entries`, with concurrent downloads, into another new database.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        root = Path(directory) / "objects"
+        write_objects(
+            root,
+            start,
+            days,
+            files_per_day,
+            messages_per_file,
+            events_per_message,
+            mix,
+            framing=framing,
+        )
+        prefixes = [day_prefix(start + timedelta(days=day)) for day in range(days)]
+
+        with s3_store(store, root) as client:
+            s3 = ChameleonS3Client(BENCHMARK_BUCKET, framing=framing, client=client)
+            db = ChameleonDB(Path(directory) / "stages.duckdb", layout=layout)
+            seconds = {"fetch": 0.0, "decode": 0.0, "transform": 0.0, "insert": 0.0}
+            events = 0
+            size = 0
+
+            for prefix in prefixes:
+                for s3_object in s3.list_objects(prefix):
+                    start_time = time.perf_counter()
+                    response = client.get_object(
+                        Bucket=BENCHMARK_BUCKET, Key=s3_object.key
+                    )
+                    data = response["Body"].read()
+                    fetched = time.perf_counter()
+                    messages = list(parse_messages(data, Metadata, framing))
+                    decoded = time.perf_counter()
+                    batches = decode_messages(messages)
+                    transformed = time.perf_counter()
+                    write_object(db, DecodedObject(s3_object, len(messages), batches))
+                    inserted = time.perf_counter()
+
+                    seconds["fetch"] += fetched - start_time
+                    seconds["decode"] += decoded - fetched
+                    seconds["transform"] += transformed - decoded
+                    seconds["insert"] += inserted - transformed
+                    events += sum(batch.num_rows for batch in batches.values())
+                    size += len(data)
+
+            db.db.close()
+
+            pipeline_db = ChameleonDB(
+                Path(directory) / "pipeline.duckdb", layout=layout
+            )
+            pipeline_start = time.perf_counter()
+            for prefix in prefixes:
+                for s3_object, messages in s3.get_objects(prefix):
+                    write_object(
+                        pipeline_db,
+                        DecodedObject(
+                            s3_object, len(messages), decode_messages(messages)
+                        ),
+                    )
+            pipeline_seconds = time.perf_counter() - pipeline_start
+            pipeline_db.db.close()
+
+    return [
+        StageResult(stage, stage_seconds, events, size)
+        for stage, stage_seconds in seconds.items()
+    ] + [StageResult("pipeline", pipeline_seconds, events, size)]
+
+
+if __name__ == "__main__":
+
+    # python -m chameleon.benchmark [ingest|ingest-moto|layouts]
+    benchmark = sys.argv[1] if len(sys.argv) > 1 else "ingest"
+
+    if benchmark == "layouts":
+        for result in benchmark_layouts():
+            print(result)
+    elif benchmark in ("ingest", "ingest-moto"):
+        for result in benchmark_ingest(
+            "moto" if benchmark == "ingest-moto" else "local"
+        ):
+            print(result)
+    else:
+        raise ValueError(f"Unknown benchmark: {benchmark}")
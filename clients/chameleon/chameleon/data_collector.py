@@ -3,57 +3,72 @@ from datetime import datetime, timedelta
 from pprint import pprint
 
 from chameleon.db import ChameleonDB
-from chameleon.generated.chameleon_pb2 import PowerEvent, SensorEvent
-from chameleon.s3 import ChameleonS3Client
+from chameleon.pipeline import (
+    DEFAULT_WORKERS,
+    DecodedObject,
+    IngestStats,
+    day_prefix,
+    decode_messages,
+    ingest_days,
+    write_object,
+)
+from chameleon.s3 import ChameleonS3Client, S3Object
 
 logging.basicConfig(level=logging.INFO)
 
 
-def add_entries(date: datetime) -> None:
+def print_stats(stats: IngestStats) -> None:
+    pprint(dict(stats.event_type_counts))
+    pprint(dict(stats.cad_counts))
 
-    client = ChameleonS3Client()
-    db = ChameleonDB("chameleon.duckdb", read_only=False)
 
-    event_type_counts: dict[str, int] = {}
-    cad_counts: dict[str, int] = {}
+def add_entries(
+    date: datetime,
+    client: ChameleonS3Client | None = None,
+    db: ChameleonDB | None = None,
+    force: bool = False,
+) -> None:
+    """
+    Ingest the files of one day. Files already recorded in the manifest with
+    the same ETag are skipped before download, unless `force` is set. Each
+    file is committed together with its manifest entry, so an interrupted
+    run resumes after the last committed file. Files that cannot be parsed
+    are left out of the manifest and downloaded again by the next run.
+    """
 
-    data_files = client.get_data(date.strftime("%Y/%m/%d"))
+    client = client or ChameleonS3Client()
+    db = db or ChameleonDB("chameleon.duckdb", read_only=False)
 
-    for f in data_files:
-        power_events: list[PowerEvent] = []
-        sensor_events: list[SensorEvent] = []
+    prefix = day_prefix(date)
+    ingested = {} if force else db.get_ingested_objects(prefix)
 
-        for e in f.events:
-            event_type = e.WhichOneof("EventType")
-            event_type_counts[event_type] = event_type_counts.get(event_type, 0) + 1
+    def already_ingested(s3_object: S3Object) -> bool:
+        return ingested.get(s3_object.key) == s3_object.etag
 
-            if event_type == "power_event":
-                power_event = e.power_event
-                cad_id = power_event.cad_id + "_power"
-                cad_counts[cad_id] = cad_counts.get(cad_id, 0) + 1
-                power_events.append(power_event)
-            elif event_type == "sensor_event":
-                sensor_event = e.sensor_event
-                cad_id = sensor_event.cad_id + "_sensor"
-                cad_counts[cad_id] = cad_counts.get(cad_id, 0) + 1
-                sensor_events.append(sensor_event)
-            else:
-                print(f"Unknown event type: {event_type}")
-        print(
-            f"Inserting {len(power_events)} power events and {len(sensor_events)} sensor events"
-        )
+    stats = IngestStats()
 
-        if power_events:
-            db.insert_power_events(power_events)
+    def parse_failed(s3_object: S3Object, error: Exception) -> None:
+        stats.failed_objects[s3_object.key] = str(error)
 
-        if sensor_events:
-            db.insert_sensor_events(sensor_events)
+    for s3_object, messages in client.get_objects(
+        prefix, skip=already_ingested, on_error=parse_failed
+    ):
+        decoded = DecodedObject(s3_object, len(messages), decode_messages(messages))
+        write_object(db, decoded)
+        stats.add(decoded)
 
-    pprint(event_type_counts)
-    pprint(cad_counts)
+    print_stats(stats)
+    if stats.failed_objects:
+        pprint(stats.failed_objects)
 
 
-def collect_data(start_date: datetime, end_date: datetime) -> None:
+def collect_data(
+    start_date: datetime, end_date: datetime, workers: int = DEFAULT_WORKERS
+) -> None:
+    """
+    Ingest the days from `start_date` up to, not including, `end_date`,
+    decoding up to `workers` days in parallel (see `ingest_days`).
+    """
 
     if start_date > end_date:
         raise ValueError("Start date must be before end date")
@@ -62,8 +77,14 @@ def collect_data(start_date: datetime, end_date: datetime) -> None:
         (start_date + timedelta(days=i)) for i in range((end_date - start_date).days)
     ]
 
-    for date in date_list:
-        add_entries(date)
+    db = ChameleonDB("chameleon.duckdb", read_only=False)
+    stats = ingest_days(date_list, db, workers=workers)
+
+    print_stats(stats)
+    if stats.failed_days:
+        pprint(stats.failed_days)
+    if stats.failed_objects:
+        pprint(stats.failed_objects)
 
 
 if __name__ == "__main__":
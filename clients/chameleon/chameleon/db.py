@@ -1,32 +1,43 @@
-from datetime import datetime
+import json
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Iterator, Literal
 
 import duckdb
-from chameleon.generated.chameleon_pb2 import (
-    Ambient,
-    Commodity,
-    DataSource,
-    PowerEvent,
-    SensorEvent,
-    SensorType,
-    SensorUnits,
+import pyarrow as pa
+import pyarrow.compute as pc
+from chameleon.events import (
+    EVENT_TABLES,
+    EventTable,
+    event_batch,
+    event_message,
+    insert_query,
+    new_events_query,
 )
+from chameleon.generated.chameleon_pb2 import PowerEvent, SensorEvent
+from chameleon.rollups import MEASURES, ROLLUPS, Measure, table_measures, update_query
+from google.protobuf.message import Message
 
-type PowerEventRecord = tuple[
-    str, datetime, str, str, datetime, str, float, str, dict[str, str]
-]
-
-type TemperatureRecord = tuple[
-    str, datetime, str, datetime, str, float, str, dict[str, str]
-]
-
-type HumidityRecord = tuple[
-    str, datetime, str, datetime, str, float, str, dict[str, str]
-]
+"""
+Type for how event tables are stored:
+- indexed: a UUID primary key rejects repeated events
+- sorted: no index; events are inserted sorted by CAD and time, and repeated
+  events are found by an anti-join on the time range of each batch
+"""
+type Layout = Literal["indexed", "sorted"]
 
 
 class ChameleonDB:
-    def __init__(self, db_path: str | Path, read_only: bool = False):
+    def __init__(
+        self,
+        db_path: str | Path,
+        read_only: bool = False,
+        layout: Layout | None = None,
+    ):
+        """
+        `layout` is chosen when the database is created (default: indexed);
+        an existing database keeps its own.
+        """
         db_path_exists = Path(db_path).exists()
 
         if read_only and not db_path_exists:
@@ -35,127 +46,236 @@ class ChameleonDB:
             )
 
         self.db = duckdb.connect(db_path, read_only=read_only)
-        if not db_path_exists:
-            with open(Path(__file__).parent / "schema.sql") as f:
-                self.db.execute(f.read())
 
-    def insert_power_events(self, events: list[PowerEvent]) -> None:
+        existing_layout = self.get_layout()
+        if layout is not None and existing_layout not in (None, layout):
+            raise ValueError(f"Database {db_path} has the {existing_layout} layout")
+        self.layout: Layout = existing_layout or layout or "indexed"
 
-        received_timestamps = [
-            datetime.fromtimestamp(e.received / 1000) for e in events
-        ]
-        reading_timestamps = [
-            datetime.fromtimestamp(e.reading_timestamp / 1000) for e in events
-        ]
-
-        values: list[PowerEventRecord] = [
-            (
-                e.event_id,
-                received_timestamps[i],
-                e.cad_id,
-                Commodity.Name(e.commodity),
-                reading_timestamps[i],
-                DataSource.Name(e.source),
-                e.reading,
-                Ambient.Name(e.ambient),
-                dict(e.event_metadata),
-            )
-            for i, e in enumerate(events)
-        ]
+        # the schema only adds what is missing, so databases created by an
+        # earlier version get the new tables on their first write
+        if not read_only:
+            missing_rollups = not self.has_table(ROLLUPS[0].table)
 
-        self.db.executemany(
-            """
-            INSERT OR IGNORE INTO power_events (
-                event_id,
-                received,
-                cad_id,
-                commodity,
-                reading_timestamp,
-                source,
-                reading,
-                ambient,
-                event_metadata                       
-            )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            values,
+            for schema_file in ["schema.sql", "manifest.sql", "rollups.sql"]:
+                with open(Path(__file__).parent / schema_file) as f:
+                    schema = f.read()
+                if self.layout == "sorted":
+                    schema = schema.replace(
+                        "event_id UUID PRIMARY KEY", "event_id UUID"
+                    )
+                self.db.execute(schema)
+
+            # rollups added to a database already holding events
+            if missing_rollups:
+                self.rebuild_rollups()
+
+        # epoch milliseconds to a naive local time, like datetime.fromtimestamp
+        self.db.execute(
+            "CREATE OR REPLACE TEMP MACRO epoch_ms_local(ms) AS "
+            "(epoch_ms(ms::BIGINT) AT TIME ZONE 'UTC')::TIMESTAMP"
         )
 
-    def insert_temperature_events(
+    def has_table(self, table: str) -> bool:
+        return bool(
+            self.db.execute(
+                "SELECT count(*) FROM duckdb_tables() WHERE table_name = ?", [table]
+            ).fetchone()[0]
+        )
+
+    def get_layout(self) -> Layout | None:
+        """The layout of the event tables, None before they are created."""
+        if not self.has_table("power_events"):
+            return None
+        primary_keys = self.db.execute(
+            """
+            SELECT count(*)
+            FROM duckdb_constraints()
+            WHERE table_name = 'power_events' AND constraint_type = 'PRIMARY KEY'"""
+        ).fetchone()[0]
+        return "indexed" if primary_keys else "sorted"
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """Commit everything written in the block at once, or nothing."""
+        self.db.begin()
+        try:
+            yield
+        except BaseException:
+            self.db.rollback()
+            raise
+        self.db.commit()
+
+    def get_ingested_objects(self, prefix: str) -> dict[str, str]:
+        """ETags of the S3 objects under `prefix` that were already ingested."""
+        rows = self.db.execute(
+            "SELECT key, etag FROM s3_objects WHERE starts_with(key, ?)", [prefix]
+        ).fetchall()
+        return dict(rows)
+
+    def record_ingested_object(
         self,
-        values: list[TemperatureRecord],
+        key: str,
+        etag: str,
+        size: int,
+        messages: int,
+        event_counts: dict[str, int],
     ) -> None:
-        self.db.executemany(
+        self.db.execute(
             """
-            INSERT OR IGNORE INTO temperature_events (
-                event_id,
-                cloud_received_timestamp,
-                cad_id,
-                meter_update_timestamp,
-                source,
-                reading,
-                units,
-                event_metadata                    
+            INSERT OR REPLACE INTO s3_objects (
+                key,
+                etag,
+                size,
+                ingested_at,
+                messages,
+                event_counts
             )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-            values,
+            VALUES (?, ?, ?, current_timestamp, ?, ?)""",
+            [key, etag, size, messages, json.dumps(event_counts)],
         )
 
-    def insert_humidity_events(self, values: list[HumidityRecord]) -> None:
+    def insert_batch(
+        self,
+        name: str,
+        batch: pa.Table,
+        query: str,
+        parameters: dict[str, object] | None = None,
+    ) -> None:
+        """Run `query` with the Arrow table `batch` registered as view `name`."""
+        self.db.register(name, batch)
+        try:
+            self.db.execute(query, parameters)
+        finally:
+            self.db.unregister(name)
 
-        self.db.executemany(
-            """
-            INSERT OR IGNORE INTO humidity_events (
-                event_id,
-                cloud_received_timestamp,
-                cad_id,
-                meter_update_timestamp,
-                source,
-                reading,
-                units,
-                event_metadata                    
+    def insert_events(self, event_type: str, events: list[Message]) -> None:
+        """
+        Insert events of one variant of the Event oneof (e.g. power_event)
+        into their tables, as one columnar batch.
+        """
+        message = event_message(event_type)
+        if events:
+            self.insert_event_batch(event_type, event_batch(events, message))
+
+    def insert_event_batch(self, event_type: str, batch: pa.Table) -> None:
+        """Insert an Arrow batch built by `chameleon.events.event_batch`."""
+        batch_name = f"{event_type}_batch"
+        windowed = self.layout == "sorted"
+
+        for event_table in EVENT_TABLES:
+            if event_table.event_type != event_type:
+                continue
+
+            parameters = batch_window(event_table, batch) if windowed else None
+            measures = table_measures(event_table.table)
+            if not measures:
+                self.insert_batch(
+                    batch_name,
+                    batch,
+                    insert_query(event_table, batch_name, windowed),
+                    parameters,
+                )
+                continue
+
+            # keep the new events apart to add them to the rollups
+            self.insert_batch(
+                batch_name,
+                batch,
+                "CREATE OR REPLACE TEMP TABLE new_events AS "
+                + new_events_query(event_table, batch_name, windowed),
+                parameters,
             )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-            values,
-        )
+            try:
+                self.db.execute(
+                    f"INSERT INTO {event_table.table} BY NAME SELECT * FROM new_events"
+                )
+                self.update_rollups(measures, "new_events")
+            finally:
+                self.db.execute("DROP TABLE IF EXISTS new_events")
 
-    def insert_sensor_events(self, events: list[SensorEvent]) -> None:
+    def update_rollups(self, measures: list[Measure], source: str) -> None:
+        """Add the readings of `source`, not counted yet, to every rollup."""
+        for rollup in ROLLUPS:
+            for measure in measures:
+                self.db.execute(
+                    update_query(rollup, measure, source), {"width": rollup.width}
+                )
+
+    def rebuild_rollups(self) -> None:
+        """Recompute the rollups from the event tables."""
+        with self.transaction():
+            for rollup in ROLLUPS:
+                self.db.execute(f"DELETE FROM {rollup.table}")
+            for measure in MEASURES:
+                self.update_rollups([measure], measure.table)
 
-        cloud_received_timestamp = [
-            datetime.fromtimestamp(e.cloud_received_timestamp / 1000) for e in events
-        ]
-        meter_update_timestamp = [
-            datetime.fromtimestamp(e.meter_update_timestamp / 1000) for e in events
-        ]
-
-        temperature_values: list[TemperatureRecord] = [
-            (
-                e.event_id,
-                cloud_received_timestamp[i],
-                e.cad_id,
-                meter_update_timestamp[i],
-                DataSource.Name(e.source),
-                e.reading,
-                SensorUnits.Name(e.units),
-                dict(e.event_metadata),
+    def compact(self) -> None:
+        """
+        Rewrite the event tables of a sorted database ordered by day, CAD
+        and time, so that time range and CAD filters skip most row groups.
+        Batches are only sorted within themselves when inserted.
+        """
+        if self.layout != "sorted":
+            raise ValueError("Only databases with the sorted layout can be compacted")
+
+        for event_table in unique_tables():
+            timestamp = f'"{event_table.timestamp}"'
+            order_by = ", ".join(
+                [f"{timestamp}::DATE"] + [f'"{k}"' for k in event_table.sort_key]
             )
-            for i, e in enumerate(events)
-            if SensorType.Name(e.type) == "temp"
-        ]
-
-        humidity_values: list[HumidityRecord] = [
-            (
-                e.event_id,
-                cloud_received_timestamp[i],
-                e.cad_id,
-                meter_update_timestamp[i],
-                DataSource.Name(e.source),
-                e.reading,
-                SensorUnits.Name(e.units),
-                dict(e.event_metadata),
+            with self.transaction():
+                self.db.execute(
+                    f"""
+                    CREATE OR REPLACE TEMP TABLE compacted AS
+                    SELECT * FROM {event_table.table} ORDER BY {order_by}"""
+                )
+                self.db.execute(f"DELETE FROM {event_table.table}")
+                self.db.execute(
+                    f"INSERT INTO {event_table.table} SELECT * FROM compacted"
+                )
+                self.db.execute("DROP TABLE compacted")
+
+        # reclaim the space of the deleted rows
+        self.db.execute("CHECKPOINT")
+
+    def export_parquet(self, output_dir: str | Path) -> None:
+        """
+        Export each event table to a hive partitioned Parquet dataset
+        `output_dir`/<table>/date=YYYY-MM-DD/, sorted by CAD and time.
+        """
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+        for event_table in unique_tables():
+            timestamp = f'"{event_table.timestamp}"'
+            order_by = ", ".join(f'"{k}"' for k in event_table.sort_key)
+            path = str(Path(output_dir) / event_table.table).replace("'", "''")
+            self.db.execute(
+                f"""
+                COPY (
+                    SELECT *, {timestamp}::DATE AS date
+                    FROM {event_table.table}
+                    ORDER BY {order_by}
+                ) TO '{path}' (FORMAT parquet, PARTITION_BY (date), OVERWRITE)"""
             )
-            for i, e in enumerate(events)
-            if SensorType.Name(e.type) == "humidity"
-        ]
 
-        self.insert_temperature_events(temperature_values)
-        self.insert_humidity_events(humidity_values)
+    def insert_power_events(self, events: list[PowerEvent]) -> None:
+        self.insert_events("power_event", events)
+
+    def insert_sensor_events(self, events: list[SensorEvent]) -> None:
+        self.insert_events("sensor_event", events)
+
+
+def unique_tables() -> list[EventTable]:
+    """One EventTable per table name (all tables have a single timestamp)."""
+    return list(
+        {event_table.table: event_table for event_table in EVENT_TABLES}.values()
+    )
+
+
+def batch_window(event_table: EventTable, batch: pa.Table) -> dict[str, int]:
+    """The range of the timestamps of a batch, as epoch milliseconds."""
+    window = pc.min_max(batch[event_table.timestamp])
+    return {
+        "window_start": window["min"].as_py() or 0,
+        "window_end": window["max"].as_py() or 0,
+    }
@@ -0,0 +1,235 @@
+import json
+from dataclasses import dataclass
+
+import pyarrow as pa
+from chameleon.generated.chameleon_pb2 import Event, SensorType
+from google.protobuf.descriptor import Descriptor, FieldDescriptor
+from google.protobuf.json_format import MessageToDict
+from google.protobuf.message import Message
+
+# epoch milliseconds, stored as TIMESTAMP columns
+TIMESTAMP_FIELDS = {
+    "received",
+    "reading_timestamp",
+    "cloud_received_timestamp",
+    "period_start_timestamp",
+    "meter_update_timestamp",
+    "device_timestamp",
+    "last_boot_timestamp",
+    "rate_start",
+    "rate_valid_until",
+    "previous_reading_timestamp",
+    "current_reading_timestamp",
+    "start",
+    "end",
+}
+
+# proto enums and the SQL enums (schema.sql) they are stored as
+ENUM_TYPES = {
+    "Commodity": "commodity_type",
+    "DataSource": "data_source_type",
+    "Period": "period_type",
+    "SensorType": "sensor_type",
+    "SensorUnits": "sensor_units_type",
+    "Ambient": "ambient_type",
+    "Units": "units_type",
+}
+
+ARROW_TYPES = {
+    FieldDescriptor.CPPTYPE_INT32: pa.int32(),
+    FieldDescriptor.CPPTYPE_INT64: pa.int64(),
+    FieldDescriptor.CPPTYPE_UINT32: pa.uint32(),
+    FieldDescriptor.CPPTYPE_UINT64: pa.uint64(),
+    FieldDescriptor.CPPTYPE_DOUBLE: pa.float64(),
+    FieldDescriptor.CPPTYPE_FLOAT: pa.float32(),
+    FieldDescriptor.CPPTYPE_BOOL: pa.bool_(),
+    FieldDescriptor.CPPTYPE_ENUM: pa.int32(),
+    FieldDescriptor.CPPTYPE_STRING: pa.string(),
+}
+
+
+@dataclass(frozen=True)
+class EventTable:
+    """The table storing one variant of the Event oneof."""
+
+    # name of the oneof field, e.g. power_event
+    event_type: str
+    table: str
+    # time of the reading, the sort key of the sorted layout with cad_id
+    timestamp: str
+    # only events with this field value go to the table; the field is dropped
+    where: tuple[str, int] | None = None
+
+    @property
+    def message(self) -> Descriptor:
+        return event_message(self.event_type)
+
+    @property
+    def columns(self) -> list[FieldDescriptor]:
+        return [
+            field
+            for field in self.message.fields
+            if self.where is None or field.name != self.where[0]
+        ]
+
+    @property
+    def sort_key(self) -> list[str]:
+        names = [field.name for field in self.columns]
+        return [name for name in ("cad_id", self.timestamp) if name in names]
+
+
+EVENT_TABLES = [
+    EventTable("meter_event", "meter_events", "reading_timestamp"),
+    EventTable("power_event", "power_events", "reading_timestamp"),
+    EventTable("cumulative_event", "cumulative_events", "meter_update_timestamp"),
+    EventTable(
+        "sensor_event",
+        "temperature_events",
+        "meter_update_timestamp",
+        where=("type", SensorType.temp),
+    ),
+    EventTable(
+        "sensor_event",
+        "humidity_events",
+        "meter_update_timestamp",
+        where=("type", SensorType.humidity),
+    ),
+    EventTable("status_event", "status_events", "device_timestamp"),
+    EventTable("price_event", "price_events", "cloud_received_timestamp"),
+    EventTable("halfhour_event", "halfhour_events", "period_start_timestamp"),
+    EventTable(
+        "cumulative_history_event",
+        "cumulative_history_events",
+        "period_start_timestamp",
+    ),
+    EventTable("one_minute_event", "one_minute_events", "current_reading_timestamp"),
+    EventTable("tariff_event", "tariff_events", "cloud_received_timestamp"),
+    EventTable(
+        "meter_reading_delta_event",
+        "meter_reading_delta_events",
+        "current_reading_timestamp",
+    ),
+]
+
+
+def event_message(event_type: str) -> Descriptor:
+    """The message of a variant of the Event oneof, e.g. PowerEvent."""
+    if event_type not in Event.DESCRIPTOR.fields_by_name:
+        raise ValueError(f"Unknown event type: {event_type}")
+    return Event.DESCRIPTOR.fields_by_name[event_type].message_type
+
+
+def is_map(field: FieldDescriptor) -> bool:
+    return field.message_type is not None and field.message_type.GetOptions().map_entry
+
+
+def field_array(events: list[Message], field: FieldDescriptor) -> pa.Array:
+    """
+    One field of `events` as an Arrow column. Maps become map columns and
+    repeated messages JSON strings; numbers and enums are kept as is.
+    """
+    values = [getattr(e, field.name) for e in events]
+
+    if is_map(field):
+        return pa.array(
+            [list(v.items()) for v in values], pa.map_(pa.string(), pa.string())
+        )
+
+    if field.cpp_type == FieldDescriptor.CPPTYPE_MESSAGE:
+        return pa.array(
+            [
+                json.dumps(
+                    [MessageToDict(m, preserving_proto_field_name=True) for m in v]
+                    if field.label == FieldDescriptor.LABEL_REPEATED
+                    else MessageToDict(v, preserving_proto_field_name=True)
+                )
+                for v in values
+            ],
+            pa.string(),
+        )
+
+    if field.label == FieldDescriptor.LABEL_REPEATED:
+        return pa.array(
+            [list(v) for v in values], pa.list_(ARROW_TYPES[field.cpp_type])
+        )
+
+    return pa.array(values, ARROW_TYPES[field.cpp_type])
+
+
+def event_batch(events: list[Message], message: Descriptor) -> pa.Table:
+    """All fields of `events` as an Arrow table, one column per field."""
+    return pa.table(
+        {field.name: field_array(events, field) for field in message.fields}
+    )
+
+
+def column_expression(field: FieldDescriptor) -> str:
+    """SQL converting a batch column to the value stored in the table."""
+    name = f'"{field.name}"'
+    if field.name in TIMESTAMP_FIELDS:
+        return f"epoch_ms_local({name})"
+    if field.cpp_type == FieldDescriptor.CPPTYPE_ENUM:
+        # SQL enums list the values in the same order as the proto enums
+        return f"enum_range(NULL::{ENUM_TYPES[field.enum_type.name]})[{name} + 1]"
+    if field.cpp_type == FieldDescriptor.CPPTYPE_MESSAGE:
+        return f"{name}::JSON"
+    if field.name == "event_id":
+        return f"{name}::UUID"
+    return name
+
+
+def new_events_query(
+    event_table: EventTable, batch_name: str, windowed: bool = False
+) -> str:
+    """
+    SELECT of the events of `batch_name` for the table, converted to its
+    columns, skipping events already stored (anti-join) or repeated in the
+    batch.
+
+    If `windowed`, only stored events with a timestamp between the bound
+    parameters $window_start and $window_end (epoch milliseconds, the range
+    of the batch) are compared, and the events are sorted by `sort_key`. A
+    repeated event has the same timestamp, so it still falls in the window,
+    and on a table sorted by time the other row groups are never read.
+    """
+    expressions = ",\n".join(
+        f'{column_expression(field)} AS "{field.name}"' for field in event_table.columns
+    )
+    where = (
+        f'WHERE "{event_table.where[0]}" = {event_table.where[1]}'
+        if event_table.where is not None
+        else ""
+    )
+
+    stored = event_table.table
+    order_by = ""
+    if windowed:
+        timestamp = f'"{event_table.timestamp}"'
+        stored = f"""(
+            SELECT event_id
+            FROM {event_table.table}
+            WHERE {timestamp} BETWEEN epoch_ms_local($window_start)
+                AND epoch_ms_local($window_end)
+        )"""
+        order_by = "ORDER BY " + ", ".join(f'"{k}"' for k in event_table.sort_key)
+
+    return f"""
+        WITH batch AS (
+            SELECT {expressions}
+            FROM {batch_name}
+            {where}
+        )
+        SELECT DISTINCT ON (event_id) batch.*
+        FROM batch
+        ANTI JOIN {stored} USING (event_id)
+        {order_by}"""
+
+
+def insert_query(
+    event_table: EventTable, batch_name: str, windowed: bool = False
+) -> str:
+    """INSERT ... SELECT of the new events of `batch_name` into the table."""
+    names = ", ".join(f'"{field.name}"' for field in event_table.columns)
+    return f"""
+        INSERT INTO {event_table.table} ({names})
+        {new_events_query(event_table, batch_name, windowed)}"""
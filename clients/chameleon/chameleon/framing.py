@@ -0,0 +1,158 @@
+import logging
+from typing import Iterable, Iterator, Literal, Protocol, TypeVar
+
+from google.protobuf.message import DecodeError, Message
+from google.protobuf.unknown_fields import UnknownFieldSet
+
+"""
+Type for how protobuf messages are laid out in an S3 object:
+- delimited: each message is prefixed by its length as a base 128 varint
+- single: the whole object is one message (concatenated messages are merged)
+- auto: single if the object parses cleanly as one message, else delimited
+"""
+Framing = Literal["auto", "delimited", "single"]
+
+# protobuf varints are at most 10 bytes long
+MAX_VARINT_LENGTH = 10
+DEFAULT_READ_SIZE = 1 << 20
+
+M = TypeVar("M", bound=Message)
+
+logger = logging.getLogger(__name__)
+
+
+class Readable(Protocol):
+    """A binary stream, e.g. the `Body` of a boto3 `get_object` response."""
+
+    def read(self, size: int = -1) -> bytes: ...
+
+
+def decode_varint(buffer: memoryview, offset: int) -> tuple[int, int]:
+    """
+    Decode the varint starting at `offset`. Returns the value and the offset
+    just after it. Raises IndexError if the buffer ends inside the varint.
+    """
+    value = 0
+    shift = 0
+    for position in range(offset, offset + MAX_VARINT_LENGTH):
+        byte = buffer[position]
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, position + 1
+        shift += 7
+    raise ValueError(f"Varint longer than {MAX_VARINT_LENGTH} bytes at {offset}")
+
+
+def encode_varint(value: int) -> bytes:
+    """Encode a non-negative integer as a base 128 varint."""
+    encoded = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if not value:
+            encoded.append(byte)
+            return bytes(encoded)
+        encoded.append(byte | 0x80)
+
+
+def serialize_delimited(messages: Iterable[Message]) -> bytes:
+    """Serialize messages with length prefixes, the delimited framing."""
+    frames = []
+    for message in messages:
+        data = message.SerializeToString()
+        frames += [encode_varint(len(data)), data]
+    return b"".join(frames)
+
+
+def iter_frames(buffer: memoryview) -> Iterator[memoryview]:
+    """Yield the length-delimited frames of `buffer` as zero-copy slices."""
+    offset = 0
+    while offset < len(buffer):
+        try:
+            length, start = decode_varint(buffer, offset)
+        except IndexError:
+            raise ValueError(f"Truncated length prefix at {offset}")
+        end = start + length
+        if end > len(buffer):
+            raise ValueError(f"Truncated message at {offset}")
+        yield buffer[start:end]
+        offset = end
+
+
+def iter_delimited_messages(buffer: memoryview, message_type: type[M]) -> Iterator[M]:
+    """Parse length-delimited messages lazily from an in-memory buffer."""
+    for frame in iter_frames(buffer):
+        message = message_type()
+        message.ParseFromString(frame)
+        yield message
+
+
+def read_delimited_messages(
+    stream: Readable,
+    message_type: type[M],
+    read_size: int = DEFAULT_READ_SIZE,
+) -> Iterator[M]:
+    """
+    Parse length-delimited messages lazily from a stream, reading it
+    `read_size` bytes at a time so the object is never fully buffered.
+    """
+    buffer = bytearray()
+    eof = False
+    while not eof:
+        chunk = stream.read(read_size)
+        eof = not chunk
+        buffer += chunk
+
+        # parse every complete frame in the buffer
+        offset = 0
+        view = memoryview(buffer)
+        try:
+            while offset < len(view):
+                try:
+                    length, start = decode_varint(view, offset)
+                except IndexError:
+                    break
+                if start + length > len(view):
+                    break
+                message = message_type()
+                message.ParseFromString(view[start : start + length])
+                yield message
+                offset = start + length
+        finally:
+            view.release()
+
+        # drop the parsed frames, keeping a partial frame for the next read
+        del buffer[:offset]
+
+    if buffer:
+        raise ValueError(f"Stream ended inside a message ({len(buffer)} bytes left)")
+
+
+def parse_messages(
+    data: bytes, message_type: type[M], framing: Framing = "auto"
+) -> Iterator[M]:
+    """Parse the messages of an in-memory object laid out as `framing`."""
+    buffer = memoryview(data)
+    if not buffer:
+        return
+
+    if framing == "auto":
+        # a length prefix is read as an invalid or unknown field
+        message = message_type()
+        try:
+            message.ParseFromString(buffer)
+            if not len(UnknownFieldSet(message)):
+                yield message
+                return
+        except DecodeError:
+            pass
+        logger.debug("Object is not a single message, reading it as delimited")
+        framing = "delimited"
+
+    if framing == "delimited":
+        yield from iter_delimited_messages(buffer, message_type)
+        return
+
+    message = message_type()
+    message.ParseFromString(buffer)
+    yield message
@@ -0,0 +1,58 @@
+from pathlib import Path
+from typing import Any, BinaryIO, Iterator
+
+PAGE_SIZE = 1000
+
+
+class LocalPaginator:
+    """The list_objects_v2 paginator of a `LocalS3Client`."""
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def paginate(self, Bucket: str, Prefix: str = "") -> Iterator[dict[str, Any]]:
+        paths = sorted(
+            path
+            for path in self.root.rglob("*")
+            if path.is_file()
+            and path.relative_to(self.root).as_posix().startswith(Prefix)
+        )
+
+        if not paths:
+            yield {"KeyCount": 0}
+            return
+
+        for start in range(0, len(paths), PAGE_SIZE):
+            contents = []
+            for path in paths[start : start + PAGE_SIZE]:
+                stat = path.stat()
+                contents.append(
+                    {
+                        "Key": path.relative_to(self.root).as_posix(),
+                        "Size": stat.st_size,
+                        # changes whenever the file is rewritten, like an ETag
+                        "ETag": f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"',
+                    }
+                )
+            yield {"KeyCount": len(contents), "Contents": contents}
+
+
+class LocalS3Client:
+    """
+    Serves the files under `root` as the objects of a bucket, keyed by their
+    relative path, for `ChameleonS3Client(client=LocalS3Client(root))`. Only
+    the calls made by ChameleonS3Client are supported; the bucket name is
+    ignored.
+    """
+
+    def __init__(self, root: str | Path):
+        self.root = Path(root)
+
+    def get_paginator(self, operation_name: str) -> LocalPaginator:
+        if operation_name != "list_objects_v2":
+            raise ValueError(f"Unsupported operation: {operation_name}")
+        return LocalPaginator(self.root)
+
+    def get_object(self, Bucket: str, Key: str) -> dict[str, BinaryIO | int]:
+        path = self.root / Key
+        return {"Body": open(path, "rb"), "ContentLength": path.stat().st_size}
@@ -0,0 +1,9 @@
+-- S3 objects already ingested, to skip them on later runs --
+CREATE TABLE IF NOT EXISTS s3_objects (
+    key STRING PRIMARY KEY,
+    etag STRING,
+    size BIGINT,
+    ingested_at TIMESTAMP,
+    messages INTEGER,
+    event_counts JSON
+);
@@ -0,0 +1,228 @@
+import logging
+import multiprocessing
+import os
+import queue
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+from multiprocessing.queues import Queue
+from typing import Callable
+
+import pyarrow as pa
+from chameleon.db import ChameleonDB
+from chameleon.events import event_batch, event_message
+from chameleon.generated.chameleon_pb2 import Metadata
+from chameleon.s3 import ChameleonS3Client, S3Object
+from google.protobuf.message import Message
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+# decoded files waiting for the writer; bounds the memory held by workers
+DEFAULT_QUEUE_SIZE = 32
+# how often the writer checks that the workers are still alive
+POLL_SECONDS = 1.0
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class DecodedObject:
+    """The events of one S3 file as Arrow batches, keyed by event type."""
+
+    s3_object: S3Object
+    messages: int
+    batches: dict[str, pa.Table]
+
+    @property
+    def event_counts(self) -> dict[str, int]:
+        return {
+            event_type: batch.num_rows for event_type, batch in self.batches.items()
+        }
+
+
+@dataclass
+class DayDone:
+    """Sent by a worker once all files under `prefix` are decoded."""
+
+    prefix: str
+    error: str | None = None
+
+
+@dataclass
+class FailedObject:
+    """Sent by a worker for a file that could not be parsed."""
+
+    key: str
+    error: str
+
+
+@dataclass
+class IngestStats:
+    """Counts of the events ingested by a run."""
+
+    files: int = 0
+    event_type_counts: Counter[str] = field(default_factory=Counter)
+    cad_counts: Counter[str] = field(default_factory=Counter)
+    failed_days: dict[str, str] = field(default_factory=dict)
+    # files left out of the manifest, so they are downloaded again next run
+    failed_objects: dict[str, str] = field(default_factory=dict)
+
+    def add(self, decoded: DecodedObject) -> None:
+        self.files += 1
+        for event_type, batch in decoded.batches.items():
+            self.event_type_counts[event_type] += batch.num_rows
+            if "cad_id" in batch.column_names:
+                suffix = event_type.removesuffix("_event")
+                self.cad_counts.update(
+                    f"{cad_id}_{suffix}" for cad_id in batch["cad_id"].to_pylist()
+                )
+
+
+def day_prefix(date: datetime) -> str:
+    return date.strftime("%Y/%m/%d")
+
+
+def decode_messages(messages: list[Metadata]) -> dict[str, pa.Table]:
+    """Group the events of `messages` by oneof variant, as one batch each."""
+    events_by_type: dict[str, list[Message]] = {}
+    for m in messages:
+        for e in m.events:
+            event_type = e.WhichOneof("EventType")
+            if event_type is None:
+                logger.warning("Event without a type")
+                continue
+            events_by_type.setdefault(event_type, []).append(getattr(e, event_type))
+
+    return {
+        event_type: event_batch(events, event_message(event_type))
+        for event_type, events in events_by_type.items()
+    }
+
+
+def write_object(db: ChameleonDB, decoded: DecodedObject) -> None:
+    """Insert the events of a file together with its manifest entry."""
+    logger.info(f"Inserting {decoded.event_counts} events from {decoded.s3_object.key}")
+
+    with db.transaction():
+        for event_type, batch in decoded.batches.items():
+            db.insert_event_batch(event_type, batch)
+
+        db.record_ingested_object(
+            decoded.s3_object.key,
+            decoded.s3_object.etag,
+            decoded.s3_object.size,
+            decoded.messages,
+            decoded.event_counts,
+        )
+
+
+def decode_days(
+    tasks: "Queue[tuple[str, dict[str, str]] | None]",
+    results: "Queue[DecodedObject | FailedObject | DayDone | None]",
+    client_factory: Callable[[], ChameleonS3Client],
+) -> None:
+    """
+    Worker process: take (prefix, ingested ETags) tasks until a None task,
+    and send each file not yet ingested to the writer as Arrow batches, or
+    as a `FailedObject` if it cannot be parsed.
+    """
+    client = client_factory()
+
+    while (task := tasks.get()) is not None:
+        prefix, ingested = task
+
+        def already_ingested(s3_object: S3Object) -> bool:
+            return ingested.get(s3_object.key) == s3_object.etag
+
+        try:
+            for s3_object, messages in client.get_objects(
+                prefix,
+                skip=already_ingested,
+                on_error=lambda s3_object, e: results.put(
+                    FailedObject(s3_object.key, str(e))
+                ),
+            ):
+                results.put(
+                    DecodedObject(s3_object, len(messages), decode_messages(messages))
+                )
+        except Exception as e:
+            results.put(DayDone(prefix, error=str(e)))
+        else:
+            results.put(DayDone(prefix))
+
+    results.put(None)
+
+
+def ingest_days(
+    dates: list[datetime],
+    db: ChameleonDB,
+    workers: int = DEFAULT_WORKERS,
+    client_factory: Callable[[], ChameleonS3Client] = ChameleonS3Client,
+    force: bool = False,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+) -> IngestStats:
+    """
+    Ingest several days in parallel. `workers` processes download and decode
+    one day each at a time, and hand the files over a bounded queue to this
+    process, the only writer of `db`. `client_factory` must be picklable
+    (e.g. a module level function) as it is called in the workers.
+
+    As in `add_entries`, files already in the manifest with the same ETag
+    are skipped unless `force` is set, and each file is committed with its
+    manifest entry. A failing day, or a file that cannot be parsed, is
+    recorded in the stats and does not stop the others.
+    """
+    # spawn rather than fork: the parent may hold DuckDB and boto3 threads
+    context = multiprocessing.get_context("spawn")
+    tasks: Queue[tuple[str, dict[str, str]] | None] = context.Queue()
+    results: Queue[DecodedObject | FailedObject | DayDone | None] = context.Queue(
+        queue_size
+    )
+
+    for date in dates:
+        prefix = day_prefix(date)
+        tasks.put((prefix, {} if force else db.get_ingested_objects(prefix)))
+
+    workers = max(1, min(workers, len(dates)))
+    for _ in range(workers):
+        tasks.put(None)
+
+    processes = [
+        context.Process(
+            target=decode_days, args=(tasks, results, client_factory), daemon=True
+        )
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    stats = IngestStats()
+    running = workers
+    try:
+        while running:
+            try:
+                item = results.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes):
+                    raise RuntimeError("Ingestion workers exited unexpectedly")
+                continue
+
+            if item is None:
+                running -= 1
+            elif isinstance(item, DayDone):
+                if item.error is None:
+                    logger.info(f"Ingested {item.prefix}")
+                else:
+                    logger.error(f"Failed to ingest {item.prefix}: {item.error}")
+                    stats.failed_days[item.prefix] = item.error
+            elif isinstance(item, FailedObject):
+                stats.failed_objects[item.key] = item.error
+            else:
+                write_object(db, item)
+                stats.add(item)
+    finally:
+        for process in processes:
+            if running:
+                process.terminate()
+            process.join()
+
+    return stats
@@ -1,61 +1,205 @@
-from datetime import datetime
+import math
+from datetime import datetime, timedelta
 from pathlib import Path
+from typing import Iterable, Literal
 
 from chameleon.db import ChameleonDB
+from chameleon.rollups import covering_rollup
 
+"""Type for the file format of a report"""
+ReportFormat = Literal["csv", "parquet"]
 
-def generate_report(
-    start_time: datetime,
-    end_time: datetime,
-    interval: str,
-    output_file: Path,
-    chameleon_db: ChameleonDB,
-) -> None:
+INTERVAL_MINUTES = {"minute": 1, "minutes": 1, "hour": 60, "hours": 60}
+
+
+def read_sql(name: str) -> str:
+    with open(Path(__file__).parent / name) as f:
+        return f.read()
 
-    if start_time > end_time:
-        raise ValueError("Start time must be before end time")
 
+def parse_interval(interval: str) -> timedelta:
+    """Parse an interval such as "15 minutes" or "1 hour"."""
     words = interval.split()
 
     if len(words) != 2:
         raise ValueError(f"Invalid interval... {interval}")
 
-    if words[-1].lower() not in ["minute", "hour", "minutes", "hours"]:
+    if words[-1].lower() not in INTERVAL_MINUTES:
         raise ValueError(
             f"Invalid interval. Must be in minutes or hours, Got {words[-1].lower()}"
         )
 
-    if not interval.split()[-2].isdigit():
+    if not words[-2].isdigit() or int(words[-2]) == 0:
         raise ValueError(
-            f"Invalid interval... The first part of the interval must be a number. {interval.split()[-2]}"
+            f"Invalid interval... The first part of the interval must be a number. {words[-2]}"
         )
 
-    with open("binning.sql") as f:
-        query = f.read().format(
-            start_time=start_time.strftime("%Y-%m-%d"),
-            end_time=end_time.strftime("%Y-%m-%d"),
-            interval=interval,
-            output_file=str(output_file),
+    return timedelta(minutes=int(words[-2]) * INTERVAL_MINUTES[words[-1].lower()])
+
+
+def bucket_width(intervals: Iterable[timedelta]) -> timedelta:
+    """The widest bucket that every interval is a whole number of."""
+    return timedelta(
+        minutes=math.gcd(*(int(i.total_seconds()) // 60 for i in intervals))
+    )
+
+
+def report_path(output_dir: Path, interval: str, format: ReportFormat) -> Path:
+    """Output of one interval: a file, or a directory when partitioned."""
+    return output_dir / f"output_{interval}.{format}"
+
+
+def midnight_offset(time: datetime) -> timedelta:
+    return time - time.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def bin_events(
+    start_time: datetime,
+    end_time: datetime,
+    bucket: timedelta,
+    chameleon_db: ChameleonDB,
+    use_rollups: bool = True,
+) -> None:
+    """
+    Sum, count, minimum and maximum of the readings between `start_time`
+    (included) and `end_time` (excluded), per `bucket` and CAD, into the
+    temporary table report_buckets. Buckets are read from the coarsest
+    rollup they are made of, if the bounds are aligned to it, and from a
+    single scan of the event tables otherwise.
+    """
+    parameters = {"start_time": start_time, "end_time": end_time}
+    rollup = covering_rollup(
+        bucket, midnight_offset(start_time), midnight_offset(end_time)
+    )
+
+    if use_rollups and rollup is not None:
+        chameleon_db.db.execute(
+            f"""
+            CREATE OR REPLACE TEMP TABLE report_buckets AS
+            SELECT *
+            FROM {rollup.table}
+            WHERE bucket >= $start_time
+                AND bucket < $end_time""",
+            parameters,
+        )
+    else:
+        chameleon_db.db.execute(
+            read_sql("binning.sql"), parameters | {"bucket": bucket}
         )
 
-    chameleon_db.db.execute(query)
+
+def write_report(
+    interval: timedelta,
+    output_path: Path,
+    format: ReportFormat,
+    partition_by_day: bool,
+    chameleon_db: ChameleonDB,
+) -> None:
+    """
+    Roll report_buckets up to `interval` and write it to `output_path`. With
+    `partition_by_day`, `output_path` is a directory of day=YYYY-MM-DD
+    partitions.
+    """
+    query = read_sql("report_rollup.sql")
+    options = [f"FORMAT {format}"]
+    if format == "csv":
+        options.append("HEADER")
+    if partition_by_day:
+        query = f"SELECT *, bucket::DATE AS day FROM ({query})"
+        options += ["PARTITION_BY (day)", "OVERWRITE"]
+
+    path = str(output_path).replace("'", "''")
+    chameleon_db.db.execute(
+        f"COPY ({query}) TO '{path}' ({', '.join(options)})", {"interval": interval}
+    )
+
+
+def generate_reports(
+    start_time: datetime,
+    end_time: datetime,
+    intervals: list[str],
+    output_dir: Path,
+    chameleon_db: ChameleonDB,
+    format: ReportFormat = "csv",
+    partition_by_day: bool = False,
+    use_rollups: bool = True,
+) -> dict[str, Path]:
+    """
+    Write one report per interval, all from a single pass: readings are
+    binned once to the widest common bucket (see `bin_events`), which each
+    report rolls up. Set `use_rollups` to False to scan the event tables
+    even when a rollup covers the reports. Returns the output path of each
+    interval.
+    """
+
+    if start_time > end_time:
+        raise ValueError("Start time must be before end time")
+
+    widths = {interval: parse_interval(interval) for interval in intervals}
+    if not widths:
+        return {}
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output_paths = {
+        interval: report_path(output_dir, interval, format) for interval in intervals
+    }
+
+    bin_events(
+        start_time,
+        end_time,
+        bucket_width(widths.values()),
+        chameleon_db,
+        use_rollups,
+    )
+    try:
+        for interval, width in widths.items():
+            write_report(
+                width,
+                output_paths[interval],
+                format,
+                partition_by_day,
+                chameleon_db,
+            )
+    finally:
+        chameleon_db.db.execute("DROP TABLE IF EXISTS report_buckets")
+
+    return output_paths
+
+
+def generate_report(
+    start_time: datetime,
+    end_time: datetime,
+    interval: str,
+    output_file: Path,
+    chameleon_db: ChameleonDB,
+    format: ReportFormat | None = None,
+    partition_by_day: bool = False,
+    use_rollups: bool = True,
+) -> None:
+    """
+    Write the report of a single interval to `output_file`, as Parquet if it
+    ends in .parquet and CSV otherwise, unless `format` is given.
+    """
+
+    if start_time > end_time:
+        raise ValueError("Start time must be before end time")
+
+    width = parse_interval(interval)
+    format = format or ("parquet" if output_file.suffix == ".parquet" else "csv")
+
+    bin_events(start_time, end_time, width, chameleon_db, use_rollups)
+    try:
+        write_report(width, output_file, format, partition_by_day, chameleon_db)
+    finally:
+        chameleon_db.db.execute("DROP TABLE IF EXISTS report_buckets")
 
 
 if __name__ == "__main__":
 
-    for interval in [
-        "1 minute",
-        "5 minutes",
-        "15 minutes",
-        "30 minutes",
-    ]:
-
-        out_file = Path(f"output_{interval}.csv")
-
-        generate_report(
-            datetime(2021, 1, 1),
-            datetime(2029, 1, 2),
-            interval,
-            out_file,
-            ChameleonDB("chameleon.duckdb"),
-        )
+    generate_reports(
+        datetime(2021, 1, 1),
+        datetime(2029, 1, 2),
+        ["1 minute", "5 minutes", "15 minutes", "30 minutes"],
+        Path("."),
+        ChameleonDB("chameleon.duckdb"),
+    )
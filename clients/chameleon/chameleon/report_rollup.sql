@@ -0,0 +1,20 @@
+SELECT time_bucket($interval, bucket) AS bucket,
+    cad_id,
+    ROUND(SUM(power_sum) / SUM(power_event_count), 3) AS power_avg,
+    ROUND(SUM(temperature_sum) / SUM(temperature_event_count), 3) AS temperature_avg,
+    ROUND(SUM(humidity_sum) / SUM(humidity_event_count), 3) AS humidity_avg,
+    SUM(power_event_count)::BIGINT AS power_event_count,
+    SUM(temperature_event_count)::BIGINT AS temperature_event_count,
+    SUM(humidity_event_count)::BIGINT AS humidity_event_count,
+    MIN(power_min) AS power_min,
+    MIN(temperature_min) AS temperature_min,
+    MIN(humidity_min) AS humidity_min,
+    MAX(power_max) AS power_max,
+    MAX(temperature_max) AS temperature_max,
+    MAX(humidity_max) AS humidity_max
+FROM report_buckets
+GROUP BY 1,
+    cad_id
+HAVING SUM(power_event_count) > 0
+ORDER BY bucket,
+    cad_id
@@ -0,0 +1,98 @@
+from dataclasses import dataclass
+from datetime import timedelta
+
+
+@dataclass(frozen=True)
+class Measure:
+    """Readings of an event table aggregated into the rollups."""
+
+    # prefix of the rollup columns, e.g. power_sum
+    name: str
+    table: str
+    timestamp: str
+    where: str | None = None
+
+
+@dataclass(frozen=True)
+class Rollup:
+    """A table of readings per time bucket and CAD (see rollups.sql)."""
+
+    table: str
+    width: timedelta
+
+
+MEASURES = [
+    Measure("power", "power_events", "reading_timestamp", "commodity = 'elec'"),
+    Measure("temperature", "temperature_events", "meter_update_timestamp"),
+    Measure("humidity", "humidity_events", "meter_update_timestamp"),
+]
+
+# finest first
+ROLLUPS = [
+    Rollup("readings_1m", timedelta(minutes=1)),
+    Rollup("readings_30m", timedelta(minutes=30)),
+]
+
+
+def table_measures(table: str) -> list[Measure]:
+    return [measure for measure in MEASURES if measure.table == table]
+
+
+def aggregate_query(measure: Measure, source: str) -> str:
+    """
+    SELECT of the sum, count, minimum and maximum of the readings of
+    `source` (the measure's table, or new rows of it) per $width bucket.
+    """
+    where = f"AND {measure.where}" if measure.where is not None else ""
+    return f"""
+        SELECT time_bucket($width, {measure.timestamp}) AS bucket,
+            cad_id,
+            SUM(reading)::DOUBLE AS {measure.name}_sum,
+            COUNT(*) AS {measure.name}_event_count,
+            MIN(reading) AS {measure.name}_min,
+            MAX(reading) AS {measure.name}_max
+        FROM {source}
+        WHERE {measure.timestamp} IS NOT NULL
+            AND cad_id IS NOT NULL
+            {where}
+        GROUP BY ALL"""
+
+
+def update_query(rollup: Rollup, measure: Measure, source: str) -> str:
+    """
+    Add the readings of `source` to the rollup, merging them into existing
+    buckets. `source` must only hold rows not yet counted.
+    """
+    name = measure.name
+    return f"""
+        INSERT INTO {rollup.table} (
+            bucket, cad_id, {name}_sum, {name}_event_count, {name}_min, {name}_max
+        )
+        {aggregate_query(measure, source)}
+        ON CONFLICT (bucket, cad_id) DO UPDATE SET
+            {name}_sum = COALESCE({name}_sum, 0) + EXCLUDED.{name}_sum,
+            {name}_event_count = COALESCE({name}_event_count, 0) + EXCLUDED.{name}_event_count,
+            {name}_min = LEAST({name}_min, EXCLUDED.{name}_min),
+            {name}_max = GREATEST({name}_max, EXCLUDED.{name}_max)"""
+
+
+def covering_rollup(width: timedelta, *bounds: timedelta) -> Rollup | None:
+    """
+    The coarsest rollup that buckets of `width` starting at offsets
+    `bounds` (from midnight) are made of, if any.
+    """
+    for rollup in reversed(ROLLUPS):
+        if all(t % rollup.width == timedelta(0) for t in (width, *bounds)):
+            return rollup
+    return None
+
+
+if __name__ == "__main__":
+    import sys
+
+    from chameleon.db import ChameleonDB
+
+    # rebuild the rollups from the event tables, e.g. if they drifted
+    ChameleonDB(
+        sys.argv[1] if len(sys.argv) > 1 else "chameleon.duckdb"
+    ).rebuild_rollups()
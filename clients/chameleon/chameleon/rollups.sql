@@ -0,0 +1,35 @@
+-- power (electricity only), temperature and humidity readings per time bucket and CAD, kept up to date on insert --
+CREATE TABLE IF NOT EXISTS readings_1m (
+    bucket TIMESTAMP,
+    cad_id STRING,
+    power_sum DOUBLE,
+    power_event_count BIGINT,
+    power_min FLOAT,
+    power_max FLOAT,
+    temperature_sum DOUBLE,
+    temperature_event_count BIGINT,
+    temperature_min INTEGER,
+    temperature_max INTEGER,
+    humidity_sum DOUBLE,
+    humidity_event_count BIGINT,
+    humidity_min INTEGER,
+    humidity_max INTEGER,
+    PRIMARY KEY (bucket, cad_id)
+);
+CREATE TABLE IF NOT EXISTS readings_30m (
+    bucket TIMESTAMP,
+    cad_id STRING,
+    power_sum DOUBLE,
+    power_event_count BIGINT,
+    power_min FLOAT,
+    power_max FLOAT,
+    temperature_sum DOUBLE,
+    temperature_event_count BIGINT,
+    temperature_min INTEGER,
+    temperature_max INTEGER,
+    humidity_sum DOUBLE,
+    humidity_event_count BIGINT,
+    humidity_min INTEGER,
+    humidity_max INTEGER,
+    PRIMARY KEY (bucket, cad_id)
+);
@@ -1,43 +1,86 @@
 import logging
 import os
-from typing import Generator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, Generator, Iterator
 
 import boto3
 import boto3.s3
+from botocore.config import Config
+from chameleon.framing import Framing, parse_messages, read_delimited_messages
 from chameleon.generated.chameleon_pb2 import Metadata
+from google.protobuf.message import DecodeError
+
+if TYPE_CHECKING:
+    from types_boto3_s3.client import S3Client
 
 DEFAULT_AWS_BUCKET = "edol-chameleon-pilot-bucket"
+DEFAULT_MAX_WORKERS = 16
+DEFAULT_MAX_IN_FLIGHT_BYTES = 64 * 1024 * 1024
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class S3Object:
+    """A listed file. The ETag changes whenever the file is rewritten."""
+
+    key: str
+    size: int
+    etag: str
+
+
 class ChameleonS3Client:
-    def __init__(self, bucket: str = os.getenv("AWS_BUCKET", DEFAULT_AWS_BUCKET)):
-        self.client = boto3.client("s3", region_name="eu-west-2")
+    def __init__(
+        self,
+        bucket: str = os.getenv("AWS_BUCKET", DEFAULT_AWS_BUCKET),
+        framing: Framing = "auto",
+        client: "S3Client | None" = None,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        max_in_flight_bytes: int = DEFAULT_MAX_IN_FLIGHT_BYTES,
+    ):
+        """
+        Use `client` to read from another S3 compatible store, or from a
+        stand-in such as moto's mock.
+        """
+        # one pooled connection per download thread; botocore keeps 10 by
+        # default, so more workers would wait for a connection
+        self.client = (
+            client
+            if client is not None
+            else boto3.client(
+                "s3",
+                region_name="eu-west-2",
+                config=Config(max_pool_connections=max_workers),
+            )
+        )
         self.bucket_name = bucket
+        self.framing = framing
+        self.max_workers = max_workers
+        self.max_in_flight_bytes = max_in_flight_bytes
 
-    def parse_protobuf(self, s3_file_path: str) -> list[Metadata]:
+    def parse_protobuf(self, s3_file_path: str) -> Iterator[Metadata]:
+        """
+        Lazily parse the Metadata messages of an S3 object. Delimited objects
+        are streamed from S3 and never fully buffered; "auto" framing has to
+        read the whole object to detect its layout. A corrupt or truncated
+        object raises DecodeError or ValueError, possibly after some messages.
+        """
         response = self.client.get_object(Bucket=self.bucket_name, Key=s3_file_path)
-        raw_bytes = response["Body"].read()
 
-        messages = []
-        while raw_bytes:
-            metadata = Metadata()
-            try:
-                # ParseFromString returns the number of bytes read for this message
-                bytes_read = metadata.ParseFromString(raw_bytes)
-                messages.append(metadata)
-                raw_bytes = raw_bytes[
-                    bytes_read:
-                ]  # Move to the next message in the buffer
-            except Exception as e:
-                print(f"Failed to parse protobuf message: {e}")
-                break
-
-        return messages
+        try:
+            if self.framing == "delimited":
+                yield from read_delimited_messages(response["Body"], Metadata)
+            else:
+                yield from parse_messages(
+                    response["Body"].read(), Metadata, framing=self.framing
+                )
+        except (DecodeError, ValueError) as e:
+            logger.error(f"Failed to parse protobuf message in {s3_file_path}: {e}")
+            raise
 
-    def get_data(
+    def list_objects(
         self, prefix: str, extension: str = ".pb"
-    ) -> Generator[Metadata, None, None]:
+    ) -> Generator[S3Object, None, None]:
         """
         List all files in the bucket with the given prefix and extension. Use empty string as extension to list all files.
         """
@@ -51,7 +94,97 @@ class ChameleonS3Client:
 
             for file in page["Contents"]:
                 if file["Key"].endswith(extension):
-                    for metadata in self.parse_protobuf(file["Key"]):
-                        yield metadata
-                else:
+                    yield S3Object(
+                        key=file["Key"], size=file["Size"], etag=file["ETag"]
+                    )
+
+    def fetch_protobuf(self, s3_file_path: str) -> list[Metadata]:
+        """Download and parse one file. Runs in the prefetching threads."""
+        return list(self.parse_protobuf(s3_file_path))
+
+    def get_objects(
+        self,
+        prefix: str,
+        extension: str = ".pb",
+        ordered: bool = True,
+        skip: Callable[[S3Object], bool] | None = None,
+        on_error: Callable[[S3Object, Exception], None] | None = None,
+    ) -> Generator[tuple[S3Object, list[Metadata]], None, None]:
+        """
+        Download and parse all files in the bucket with the given prefix and extension, yielding each file with its messages. Files for which `skip` returns True are not downloaded.
+
+        A file that fails to parse raises, unless `on_error` is given: it is
+        then passed to `on_error` with the error and not yielded, and the
+        other files are still downloaded.
+
+        Files are downloaded `max_workers` at a time, while the total size of
+        the files downloaded but not yet consumed stays under
+        `max_in_flight_bytes` (a single larger file is still fetched on its
+        own). Files are yielded in key order, or in the order downloads
+        complete if `ordered` is False.
+        """
+        pending: list[tuple[S3Object, Future[list[Metadata]]]] = []
+        in_flight_bytes = 0
+        skipped = 0
+
+        def next_done() -> tuple[S3Object, Future[list[Metadata]]]:
+            if ordered:
+                return pending.pop(0)
+            done, _ = wait(
+                [future for _, future in pending], return_when=FIRST_COMPLETED
+            )
+            index = next(i for i, (_, future) in enumerate(pending) if future in done)
+            return pending.pop(index)
+
+        def result(
+            s3_object: S3Object, future: Future[list[Metadata]]
+        ) -> Iterator[tuple[S3Object, list[Metadata]]]:
+            try:
+                messages = future.result()
+            except (DecodeError, ValueError) as e:
+                if on_error is None:
+                    raise
+                on_error(s3_object, e)
+                return
+            yield s3_object, messages
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            for s3_object in self.list_objects(prefix, extension):
+                if skip is not None and skip(s3_object):
+                    skipped += 1
                     continue
+
+                # wait for room in the byte budget and the queue
+                while pending and (
+                    in_flight_bytes + s3_object.size > self.max_in_flight_bytes
+                    or len(pending) >= 2 * self.max_workers
+                ):
+                    done_object, future = next_done()
+                    in_flight_bytes -= done_object.size
+                    yield from result(done_object, future)
+
+                future = executor.submit(self.fetch_protobuf, s3_object.key)
+                pending.append((s3_object, future))
+                in_flight_bytes += s3_object.size
+
+            while pending:
+                yield from result(*next_done())
+        finally:
+            # stop downloading if the consumer stops early
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        if skipped:
+            logger.info(f"Skipped {skipped} files under {prefix}")
+
+    def get_data(
+        self, prefix: str, extension: str = ".pb", ordered: bool = True
+    ) -> Generator[Metadata, None, None]:
+        """
+        Parse all files in the bucket with the given prefix and extension. Use empty string as extension to list all files.
+
+        Messages are yielded in key order, or in the order downloads complete
+        if `ordered` is False (see `get_objects`).
+        """
+        for _, messages in self.get_objects(prefix, extension, ordered=ordered):
+            yield from messages
@@ -1,10 +1,11 @@
 -- ENUMS --
-CREATE TYPE commodity_type AS ENUM ('elec', 'gas');
-CREATE TYPE data_source_type AS ENUM ('cad', 'dcc', 'amr');
-CREATE TYPE period_type AS ENUM ('day', 'week', 'month');
-CREATE TYPE sensor_type AS ENUM ('temp', 'humidity');
-CREATE TYPE sensor_units_type AS ENUM ('degc', 'percent');
-CREATE TYPE ambient_type AS ENUM ('none', 'red', 'amber', 'green');
+CREATE TYPE IF NOT EXISTS commodity_type AS ENUM ('elec', 'gas');
+CREATE TYPE IF NOT EXISTS data_source_type AS ENUM ('cad', 'dcc', 'amr');
+CREATE TYPE IF NOT EXISTS period_type AS ENUM ('day', 'week', 'month');
+CREATE TYPE IF NOT EXISTS sensor_type AS ENUM ('temp', 'humidity');
+CREATE TYPE IF NOT EXISTS sensor_units_type AS ENUM ('degc', 'percent');
+CREATE TYPE IF NOT EXISTS ambient_type AS ENUM ('none', 'red', 'amber', 'green');
+CREATE TYPE IF NOT EXISTS units_type AS ENUM ('Wh', 'l');
 -- TABLES --
 CREATE TABLE IF NOT EXISTS power_events (
     event_id UUID PRIMARY KEY,
@@ -36,4 +37,137 @@ CREATE TABLE IF NOT EXISTS humidity_events (
     reading INTEGER,
     units sensor_units_type,
     event_metadata JSON
-);
\ No newline at end of file
+);
+CREATE TABLE IF NOT EXISTS meter_events (
+    event_id UUID PRIMARY KEY,
+    received TIMESTAMP_MS,
+    cad_id STRING,
+    commodity commodity_type,
+    reading_timestamp TIMESTAMP,
+    source data_source_type,
+    units units_type,
+    reading UBIGINT,
+    event_metadata JSON
+);
+CREATE TABLE IF NOT EXISTS cumulative_events (
+    event_id UUID PRIMARY KEY,
+    cloud_received_timestamp TIMESTAMP,
+    cad_id STRING,
+    period_start_timestamp TIMESTAMP,
+    meter_update_timestamp TIMESTAMP,
+    period period_type,
+    source data_source_type,
+    commodity commodity_type,
+    consumption INTEGER,
+    consumption_units units_type,
+    cost INTEGER,
+    cost_exponent INTEGER,
+    currency UINTEGER,
+    event_metadata JSON
+);
+CREATE TABLE IF NOT EXISTS cumulative_history_events (
+    event_id UUID PRIMARY KEY,
+    cloud_received_timestamp TIMESTAMP,
+    cad_id STRING,
+    period_start_timestamp TIMESTAMP,
+    period period_type,
+    source data_source_type,
+    commodity commodity_type,
+    consumption INTEGER,
+    consumption_units units_type,
+    cost INTEGER,
+    cost_exponent INTEGER,
+    currency UINTEGER,
+    event_metadata JSON
+);
+CREATE TABLE IF NOT EXISTS status_events (
+    event_id UUID PRIMARY KEY,
+    cloud_received_timestamp TIMESTAMP,
+    feature_flags UINTEGER,
+    device_timestamp TIMESTAMP,
+    last_boot_timestamp TIMESTAMP,
+    elec_import_site_id STRING,
+    gas_import_site_id STRING,
+    elec_connected BOOLEAN,
+    gas_connected BOOLEAN,
+    han_connected BOOLEAN,
+    cloud_connected BOOLEAN,
+    event_metadata JSON
+);
+CREATE TABLE IF NOT EXISTS price_events (
+    event_id UUID PRIMARY KEY,
+    cloud_received_timestamp TIMESTAMP,
+    cad_id STRING,
+    rate_start TIMESTAMP,
+    rate_valid_until TIMESTAMP,
+    commodity commodity_type,
+    source data_source_type,
+    rate INTEGER,
+    rate_exponent INTEGER,
+    standing_charge_applied STRING,
+    standing_charge INTEGER,
+    standing_charge_exponent INTEGER,
+    currency UINTEGER,
+    event_metadata JSON
+);
+CREATE TABLE IF NOT EXISTS halfhour_events (
+    event_id UUID PRIMARY KEY,
+    cloud_received_timestamp TIMESTAMP,
+    device_id STRING,
+    period_start_timestamp TIMESTAMP,
+    commodity commodity_type,
+    source data_source_type,
+    consumption UINTEGER,
+    units units_type,
+    cost INTEGER,
+    cost_exponent INTEGER,
+    currency UINTEGER,
+    event_metadata JSON
+);
+CREATE TABLE IF NOT EXISTS one_minute_events (
+    event_id UUID PRIMARY KEY,
+    cloud_received_timestamp TIMESTAMP,
+    device_id STRING,
+    previous_reading_timestamp TIMESTAMP,
+    current_reading_timestamp TIMESTAMP,
+    commodity commodity_type,
+    source data_source_type,
+    consumption UINTEGER,
+    units units_type,
+    cost INTEGER,
+    cost_exponent INTEGER,
+    currency UINTEGER,
+    event_metadata JSON
+);
+CREATE TABLE IF NOT EXISTS meter_reading_delta_events (
+    event_id UUID PRIMARY KEY,
+    device_id STRING,
+    previous_reading_timestamp TIMESTAMP,
+    current_reading_timestamp TIMESTAMP,
+    commodity commodity_type,
+    source data_source_type,
+    consumption UINTEGER,
+    units units_type,
+    event_metadata JSON
+);
+CREATE TABLE IF NOT EXISTS tariff_events (
+    event_id UUID PRIMARY KEY,
+    cloud_received_timestamp TIMESTAMP,
+    device_id STRING,
+    source data_source_type,
+    tariff_name STRING,
+    supplier_name STRING,
+    commodity commodity_type,
+    "start" TIMESTAMP,
+    "end" TIMESTAMP,
+    currency UINTEGER,
+    price_exponent UINTEGER,
+    time_zone STRING,
+    standing_charge_applied STRING,
+    standing_charge UINTEGER,
+    price_bands JSON,
+    time_of_use_rates JSON,
+    special_days JSON,
+    block_rates JSON,
+    event_metadata JSON
+);
@@ -0,0 +1,170 @@
+import random
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+from chameleon.events import TIMESTAMP_FIELDS, is_map
+from chameleon.framing import Framing, serialize_delimited
+from chameleon.generated.chameleon_pb2 import Event, Metadata
+from google.protobuf.descriptor import FieldDescriptor
+from google.protobuf.message import Message
+
+DAY_MS = 86_400_000
+
+# share of each event type, roughly as sent by the pilot CADs
+DEFAULT_MIX = {
+    "power_event": 0.55,
+    "sensor_event": 0.2,
+    "cumulative_event": 0.08,
+    "meter_event": 0.06,
+    "status_event": 0.03,
+    "one_minute_event": 0.03,
+    "halfhour_event": 0.02,
+    "price_event": 0.01,
+    "cumulative_history_event": 0.01,
+    "meter_reading_delta_event": 0.005,
+    "tariff_event": 0.005,
+}
+
+# string fields identifying a device
+DEVICE_FIELDS = {"cad_id", "device_id", "elec_import_site_id", "gas_import_site_id"}
+
+
+def fill_message(
+    message: Message, rng: random.Random, timestamp_ms: int, device_id: str
+) -> None:
+    """
+    Set every field of `message` to a plausible value: timestamps around
+    `timestamp_ms`, ids of `device_id`, random enums, numbers and words.
+    """
+    for field in message.DESCRIPTOR.fields:
+        name = field.name
+
+        if is_map(field):
+            getattr(message, name).update(
+                {"firmware": f"1.{rng.randrange(10)}.{rng.randrange(10)}"}
+            )
+        elif field.cpp_type == FieldDescriptor.CPPTYPE_MESSAGE:
+            if field.label == FieldDescriptor.LABEL_REPEATED:
+                for _ in range(rng.randint(1, 3)):
+                    fill_message(
+                        getattr(message, name).add(), rng, timestamp_ms, device_id
+                    )
+            else:
+                fill_message(getattr(message, name), rng, timestamp_ms, device_id)
+        elif field.label == FieldDescriptor.LABEL_REPEATED:
+            getattr(message, name).extend(
+                random_scalar(field, rng) for _ in range(rng.randint(1, 4))
+            )
+        elif name == "event_id":
+            setattr(message, name, str(uuid.UUID(int=rng.getrandbits(128), version=4)))
+        elif name in DEVICE_FIELDS:
+            setattr(message, name, device_id)
+        elif name in TIMESTAMP_FIELDS:
+            # received a few seconds after the reading
+            offset = rng.randrange(5_000) if "received" in name else 0
+            setattr(message, name, timestamp_ms + offset)
+        else:
+            setattr(message, name, random_scalar(field, rng))
+
+
+def random_scalar(field: FieldDescriptor, rng: random.Random) -> object:
+    if field.cpp_type == FieldDescriptor.CPPTYPE_ENUM:
+        return rng.choice(field.enum_type.values).number
+    if field.cpp_type == FieldDescriptor.CPPTYPE_STRING:
+        return rng.choice(["GBP", "standard", "economy7", "Europe/London", "s1"])
+    if field.cpp_type == FieldDescriptor.CPPTYPE_BOOL:
+        return rng.random() < 0.5
+    if field.cpp_type in (
+        FieldDescriptor.CPPTYPE_DOUBLE,
+        FieldDescriptor.CPPTYPE_FLOAT,
+    ):
+        return rng.uniform(0, 100)
+    if field.cpp_type in (FieldDescriptor.CPPTYPE_INT32, FieldDescriptor.CPPTYPE_INT64):
+        return rng.randrange(-10, 5_000)
+    return rng.randrange(5_000)
+
+
+def synthetic_metadata(
+    rng: random.Random,
+    start_ms: int,
+    span_ms: int,
+    events: int,
+    mix: dict[str, float] = DEFAULT_MIX,
+    cads: int = 50,
+) -> Metadata:
+    """
+    A Metadata message of `events` events, their types drawn from `mix` and
+    their times from [start_ms, start_ms + span_ms).
+    """
+    metadata = Metadata(message_id=str(uuid.UUID(int=rng.getrandbits(128))))
+    metadata.sent = start_ms + span_ms
+
+    event_types = rng.choices(list(mix), weights=list(mix.values()), k=events)
+    for event_type in event_types:
+        event = metadata.events.add()
+        fill_message(
+            getattr(event, event_type),
+            rng,
+            start_ms + rng.randrange(span_ms),
+            f"cad{rng.randrange(cads):03d}",
+        )
+    return metadata
+
+
+def write_objects(
+    directory: str | Path,
+    start: datetime,
+    days: int = 1,
+    files_per_day: int = 48,
+    messages_per_file: int = 10,
+    events_per_message: int = 100,
+    mix: dict[str, float] = DEFAULT_MIX,
+    cads: int = 50,
+    framing: Framing = "delimited",
+    seed: int = 0,
+) -> list[Path]:
+    """
+    Write synthetic objects under `directory`, keyed YYYY/MM/DD/NNNN.pb like
+    the Chameleon bucket, each covering an equal slice of its day. With
+    "single" framing, each file is one message of all its events.
+    """
+    if any(event_type not in Event.DESCRIPTOR.fields_by_name for event_type in mix):
+        raise ValueError(f"Unknown event type in {list(mix)}")
+
+    rng = random.Random(seed)
+    start_ms = int(start.timestamp() * 1000)
+    span_ms = DAY_MS // files_per_day
+
+    paths = []
+    for day in range(days):
+        day_ms = start_ms + day * DAY_MS
+        day_dir = Path(directory) / datetime.fromtimestamp(day_ms / 1000).strftime(
+            "%Y/%m/%d"
+        )
+        day_dir.mkdir(parents=True, exist_ok=True)
+
+        for i in range(files_per_day):
+            file_ms = day_ms + i * span_ms
+            if framing == "single":
+                data = synthetic_metadata(
+                    rng,
+                    file_ms,
+                    span_ms,
+                    events_per_message * messages_per_file,
+                    mix,
+                    cads,
+                ).SerializeToString()
+            else:
+                data = serialize_delimited(
+                    synthetic_metadata(
+                        rng, file_ms, span_ms, events_per_message, mix, cads
+                    )
+                    for _ in range(messages_per_file)
+                )
+
+            path = day_dir / f"{i:04d}.pb"
+            path.write_bytes(data)
+            paths.append(path)
+
+    return paths
@@ -0,0 +1,49 @@
+from datetime import datetime
+
+import boto3
+import pytest
+from chameleon.data_collector import add_entries
+from chameleon.db import ChameleonDB
+from chameleon.framing import serialize_delimited
+from chameleon.generated.chameleon_pb2 import Metadata
+from chameleon.s3 import ChameleonS3Client
+from moto import mock_aws
+
+BUCKET = "chameleon-test"
+KEYS = [f"2025/02/10/{i:04d}.pb" for i in range(3)]
+
+
+@pytest.fixture
+def s3_client():
+    with mock_aws():
+        client = boto3.client("s3", region_name="eu-west-2")
+        client.create_bucket(
+            Bucket=BUCKET,
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        for key in KEYS:
+            data = serialize_delimited([Metadata(message_id=key, sent=1)])
+            if key == KEYS[1]:
+                # truncated object
+                data = data[:-2]
+            client.put_object(Bucket=BUCKET, Key=key, Body=data)
+        yield client
+
+
+def test_corrupt_object_is_not_recorded(s3_client, tmp_path):
+    db = ChameleonDB(tmp_path / "chameleon.duckdb")
+    client = ChameleonS3Client(BUCKET, framing="delimited", client=s3_client)
+
+    add_entries(datetime(2025, 2, 10), client=client, db=db)
+
+    assert sorted(db.get_ingested_objects("2025/02/10")) == [KEYS[0], KEYS[2]]
+
+    # the corrupt object is downloaded again once fixed
+    s3_client.put_object(
+        Bucket=BUCKET,
+        Key=KEYS[1],
+        Body=serialize_delimited([Metadata(message_id=KEYS[1], sent=1)]),
+    )
+    add_entries(datetime(2025, 2, 10), client=client, db=db)
+
+    assert sorted(db.get_ingested_objects("2025/02/10")) == KEYS
@@ -0,0 +1,215 @@
+import threading
+import time
+
+import boto3
+import pytest
+from chameleon.framing import serialize_delimited
+from chameleon.generated.chameleon_pb2 import Metadata
+from chameleon.s3 import ChameleonS3Client
+from moto import mock_aws
+
+BUCKET = "chameleon-test"
+
+
+def metadata(message_id: str) -> Metadata:
+    return Metadata(message_id=message_id, sent=1_739_145_600_000)
+
+
+def object_data(key: str, messages: int = 2) -> bytes:
+    return serialize_delimited(metadata(f"{key}/{i}") for i in range(messages))
+
+
+@pytest.fixture
+def s3_client():
+    with mock_aws():
+        client = boto3.client("s3", region_name="eu-west-2")
+        client.create_bucket(
+            Bucket=BUCKET,
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        yield client
+
+
+@pytest.fixture
+def keys(s3_client) -> list[str]:
+    keys = [f"2025/02/10/{i:04d}.pb" for i in range(6)]
+    for key in keys:
+        s3_client.put_object(Bucket=BUCKET, Key=key, Body=object_data(key))
+    s3_client.put_object(Bucket=BUCKET, Key="2025/02/10/notes.txt", Body=b"notes")
+    s3_client.put_object(
+        Bucket=BUCKET, Key="2025/02/11/0000.pb", Body=object_data("2025/02/11")
+    )
+    return keys
+
+
+def chameleon_client(s3_client, **kwargs) -> ChameleonS3Client:
+    return ChameleonS3Client(BUCKET, framing="delimited", client=s3_client, **kwargs)
+
+
+def test_list_objects(s3_client, keys):
+    s3 = chameleon_client(s3_client)
+
+    objects = list(s3.list_objects("2025/02/10/"))
+
+    assert [o.key for o in objects] == keys
+    assert all(o.size == len(object_data(o.key)) for o in objects)
+    assert all(o.etag for o in objects)
+
+
+def test_list_objects_any_extension(s3_client, keys):
+    s3 = chameleon_client(s3_client)
+
+    objects = list(s3.list_objects("2025/02/10/", extension=""))
+
+    assert [o.key for o in objects] == sorted(keys + ["2025/02/10/notes.txt"])
+
+
+def test_list_objects_empty_prefix(s3_client, keys):
+    assert list(chameleon_client(s3_client).list_objects("2024/")) == []
+
+
+def test_fetch_protobuf(s3_client, keys):
+    s3 = chameleon_client(s3_client)
+
+    messages = s3.fetch_protobuf(keys[0])
+
+    assert [m.message_id for m in messages] == [f"{keys[0]}/0", f"{keys[0]}/1"]
+
+
+def test_fetch_protobuf_single_message(s3_client):
+    s3_client.put_object(
+        Bucket=BUCKET, Key="single.pb", Body=metadata("one").SerializeToString()
+    )
+    s3 = ChameleonS3Client(BUCKET, framing="auto", client=s3_client)
+
+    assert [m.message_id for m in s3.fetch_protobuf("single.pb")] == ["one"]
+
+
+def test_get_objects_ordered(s3_client, keys):
+    s3 = chameleon_client(s3_client, max_workers=4)
+
+    results = list(s3.get_objects("2025/02/10/"))
+
+    assert [o.key for o, _ in results] == keys
+    for s3_object, messages in results:
+        assert [m.message_id for m in messages] == [
+            f"{s3_object.key}/0",
+            f"{s3_object.key}/1",
+        ]
+
+
+def test_get_objects_unordered(s3_client, keys, monkeypatch):
+    s3 = chameleon_client(s3_client, max_workers=len(keys))
+    fetch = s3.fetch_protobuf
+
+    def slow_first(key: str):
+        # the first key completes last
+        if key == keys[0]:
+            time.sleep(0.5)
+        return fetch(key)
+
+    monkeypatch.setattr(s3, "fetch_protobuf", slow_first)
+
+    results = list(s3.get_objects("2025/02/10/", ordered=False))
+
+    assert sorted(o.key for o, _ in results) == keys
+    assert results[-1][0].key == keys[0]
+
+
+def test_get_objects_byte_budget(s3_client, keys, monkeypatch):
+    size = len(object_data(keys[0]))
+    # room for two objects at a time
+    s3 = chameleon_client(s3_client, max_workers=8, max_in_flight_bytes=2 * size)
+    fetch = s3.fetch_protobuf
+    started: list[str] = []
+    lock = threading.Lock()
+
+    def tracked(key: str):
+        with lock:
+            started.append(key)
+        time.sleep(0.05)
+        return fetch(key)
+
+    monkeypatch.setattr(s3, "fetch_protobuf", tracked)
+
+    consumed = 0
+    for s3_object, _ in s3.get_objects("2025/02/10/"):
+        consumed += 1
+        with lock:
+            # downloads started but not yet consumed, this one included
+            assert len(started) - consumed + 1 <= 2
+
+    assert consumed == len(keys)
+
+
+def test_get_objects_larger_than_budget(s3_client, keys):
+    s3 = chameleon_client(s3_client, max_in_flight_bytes=1)
+
+    results = list(s3.get_objects("2025/02/10/"))
+
+    assert [o.key for o, _ in results] == keys
+
+
+def test_get_objects_skip(s3_client, keys, monkeypatch):
+    s3 = chameleon_client(s3_client)
+    fetch = s3.fetch_protobuf
+    fetched: list[str] = []
+
+    def tracked(key: str):
+        fetched.append(key)
+        return fetch(key)
+
+    monkeypatch.setattr(s3, "fetch_protobuf", tracked)
+    skipped = set(keys[::2])
+
+    results = list(s3.get_objects("2025/02/10/", skip=lambda o: o.key in skipped))
+
+    assert [o.key for o, _ in results] == keys[1::2]
+    assert sorted(fetched) == keys[1::2]
+
+
+def test_get_data(s3_client, keys):
+    s3 = chameleon_client(s3_client)
+
+    messages = list(s3.get_data("2025/02/11/"))
+
+    assert [m.message_id for m in messages] == ["2025/02/11/0", "2025/02/11/1"]
+
+
+@pytest.fixture
+def corrupt_key(s3_client, keys) -> str:
+    key = keys[2]
+    # a length prefix promising more bytes than the object holds
+    s3_client.put_object(Bucket=BUCKET, Key=key, Body=object_data(key)[:-3])
+    return key
+
+
+def test_fetch_protobuf_corrupt(s3_client, corrupt_key):
+    s3 = chameleon_client(s3_client)
+
+    with pytest.raises(ValueError):
+        s3.fetch_protobuf(corrupt_key)
+
+
+def test_get_objects_corrupt_raises(s3_client, corrupt_key):
+    s3 = chameleon_client(s3_client)
+
+    with pytest.raises(ValueError):
+        list(s3.get_objects("2025/02/10/"))
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+def test_get_objects_on_error(s3_client, keys, corrupt_key, ordered):
+    s3 = chameleon_client(s3_client)
+    failed: list[str] = []
+
+    results = list(
+        s3.get_objects(
+            "2025/02/10/",
+            ordered=ordered,
+            on_error=lambda s3_object, e: failed.append(s3_object.key),
+        )
+    )
+
+    assert sorted(o.key for o, _ in results) == [k for k in keys if k != corrupt_key]
+    assert failed == [corrupt_key]
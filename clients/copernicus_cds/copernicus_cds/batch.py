@@ -0,0 +1,97 @@
+import glob
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+
+from copernicus_cds.netcdf_utils import NetCDFProcessor, ProcessingConfig
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BatchResult:
+    """Outcome of processing one zip file of a batch."""
+
+    input_path: Path
+    output_path: Path
+    seconds: float
+    error: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def find_zip_files(pattern: str | Path) -> list[Path]:
+    """Zip files in a directory, or matching a glob pattern, sorted by name."""
+    path = Path(pattern)
+    if path.is_dir():
+        return sorted(path.glob("*.zip"))
+    return sorted(Path(p) for p in glob.glob(str(pattern)) if p.endswith(".zip"))
+
+
+def batch_output_path(
+    input_path: Path, output_dir: Path, config: ProcessingConfig
+) -> Path:
+    """
+    Output of one input file. Partitioned outputs of every file share the
+    dataset in `output_dir`; other outputs get one file per input.
+    """
+    if config.partition_by:
+        return output_dir
+    return output_dir / f"{input_path.stem}.{config.output_format or 'csv'}"
+
+
+def process_one(
+    config: ProcessingConfig, input_path: Path, output_path: Path
+) -> BatchResult:
+    """Process a single zip file with its own processor, in a worker process."""
+    start = time.perf_counter()
+    try:
+        NetCDFProcessor(config).process_zip_file(input_path, output_path)
+    except Exception as e:
+        return BatchResult(
+            input_path, output_path, time.perf_counter() - start, error=str(e)
+        )
+    return BatchResult(input_path, output_path, time.perf_counter() - start)
+
+
+def process_zip_files(
+    input_paths: list[Path],
+    output_dir: Path,
+    config: ProcessingConfig,
+    max_workers: int | None = None,
+) -> list[BatchResult]:
+    """
+    Process zip files in a pool of `max_workers` processes (default: one per
+    CPU) and return the result of each file, in input order. A failing file
+    does not stop the others.
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    results: dict[Path, BatchResult] = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(
+                process_one,
+                config,
+                input_path,
+                batch_output_path(input_path, output_dir, config),
+            )
+            for input_path in input_paths
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            results[result.input_path] = result
+            if result.ok:
+                logger.info(
+                    f"Processed {result.input_path.name} in {result.seconds:.1f}s"
+                )
+            else:
+                logger.error(
+                    f"Failed to process {result.input_path.name}: {result.error}"
+                )
+
+    return [results[input_path] for input_path in input_paths]
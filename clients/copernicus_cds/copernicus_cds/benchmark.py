@@ -0,0 +1,121 @@
+"""
+Benchmark the ways NetCDFProcessor can combine the per-variable members of a
+CDS archive, on a synthetic month of hourly ERA5-like data over the UK.
+
+Run with:
+
+    python -m copernicus_cds.benchmark --days 31
+"""
+
+import argparse
+import time
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+from copernicus_cds.netcdf_utils import NetCDFProcessor, ProcessingConfig
+from copernicus_cds.request import UK_BOUNDING_BOX
+from copernicus_cds.schemas import Default_CDS_Request_Variables
+
+MERGE_KEYS = ["valid_time", "grid_cell", "analysis_date", "date_time"]
+
+
+def synthetic_member(
+    variable: str, days: int, area: tuple[float, float, float, float], seed: int
+) -> xr.Dataset:
+    """One per-variable dataset shaped like a CDS NetCDF member (0.25° grid)."""
+    north, west, south, east = area
+    valid_time = pd.date_range("2024-01-01", periods=24 * days, freq="h")
+    latitude = np.arange(north, south - 0.125, -0.25)
+    longitude = np.arange(west, east + 0.125, 0.25)
+
+    rng = np.random.default_rng(seed)
+    data = rng.random((len(valid_time), len(latitude), len(longitude)))
+
+    return xr.Dataset(
+        {variable: (("valid_time", "latitude", "longitude"), data.astype(np.float32))},
+        coords={
+            "valid_time": valid_time,
+            "latitude": latitude,
+            "longitude": longitude,
+            "number": 0,
+            "expver": ("valid_time", np.full(len(valid_time), "0001")),
+        },
+    )
+
+
+def merge_with_pandas(
+    processor: NetCDFProcessor, members: list[xr.Dataset]
+) -> pd.DataFrame:
+    """The previous approach: tabulate every member and chain outer pd.merge."""
+    dataframe = None
+    for i, ds in enumerate(members):
+        df = processor.process_dataset(ds)
+        if dataframe is None:
+            dataframe = df
+        else:
+            dataframe = pd.merge(
+                dataframe, df, on=MERGE_KEYS, how="outer", suffixes=("", f"_{i}")
+            )
+    assert dataframe is not None
+    return dataframe
+
+
+def merge_with_xarray(
+    processor: NetCDFProcessor, members: list[xr.Dataset]
+) -> pd.DataFrame:
+    """The current approach: merge on the native dimensions, tabulate once."""
+    prepared = [processor.prepare_dataset(ds) for ds in members]
+    return processor.dataset_to_df(processor.merge_datasets(prepared))
+
+
+def run(
+    name: str,
+    merge: Callable[[NetCDFProcessor, list[xr.Dataset]], pd.DataFrame],
+    processor: NetCDFProcessor,
+    members: list[xr.Dataset],
+) -> pd.DataFrame:
+    start = time.perf_counter()
+    df = merge(processor, members)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<8} {elapsed:8.2f}s  {len(df):>10} rows  {len(df.columns):>3} cols")
+    return df
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--days", type=int, default=31, help="Days in the month")
+    parser.add_argument(
+        "--variables",
+        type=int,
+        default=len(Default_CDS_Request_Variables),
+        help="Number of per-variable members",
+    )
+    args = parser.parse_args()
+
+    variables = Default_CDS_Request_Variables[: args.variables]
+    members = [
+        synthetic_member(variable, args.days, UK_BOUNDING_BOX, seed)
+        for seed, variable in enumerate(variables)
+    ]
+    processor = NetCDFProcessor(
+        ProcessingConfig(
+            output_columns=["grid_cell", "analysis_date", "date_time", *variables]
+        )
+    )
+
+    print(f"{len(members)} members, {args.days} days")
+    expected = run("pandas", merge_with_pandas, processor, members)
+    actual = run("xarray", merge_with_xarray, processor, members)
+
+    sort_keys = ["grid_cell", "date_time"]
+    pd.testing.assert_frame_equal(
+        expected.sort_values(sort_keys).reset_index(drop=True),
+        actual[expected.columns].sort_values(sort_keys).reset_index(drop=True),
+    )
+    print("outputs match")
+
+
+if __name__ == "__main__":
+    main()
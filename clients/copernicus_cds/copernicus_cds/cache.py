@@ -0,0 +1,311 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+from copernicus_cds.schemas import Default_CDS_Request_Variable_NetCDF_Names
+
+MANIFEST_SUFFIX = ".json"
+
+logger = logging.getLogger(__name__)
+
+
+def canonical_request(request: dict) -> dict:
+    """
+    Normalise a CDS request dict so that equivalent requests compare equal:
+    list values are sorted, days/months are zero padded and the area is a
+    list of floats.
+    """
+    canonical: dict = {}
+    for key, value in request.items():
+        if key == "area":
+            canonical[key] = [float(v) for v in value]
+        elif key in ("day", "month"):
+            values = value if isinstance(value, (list, tuple)) else [value]
+            canonical[key] = sorted(f"{int(v):02d}" for v in values)
+        elif key == "year":
+            values = value if isinstance(value, (list, tuple)) else [value]
+            canonical[key] = sorted(str(int(v)) for v in values)
+        elif isinstance(value, (list, tuple)):
+            canonical[key] = sorted(str(v) for v in value)
+        else:
+            canonical[key] = value
+    return canonical
+
+
+def request_key(request: dict) -> str:
+    """Content address of a request: sha256 of its canonical JSON form."""
+    payload = json.dumps(canonical_request(request), sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def file_sha256(path: Path) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def link_or_copy(source: Path, target: Path) -> None:
+    """Hard link `source` to `target`, copying when linking is not possible."""
+    target.parent.mkdir(parents=True, exist_ok=True)
+    if target.exists():
+        target.unlink()
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+@dataclass
+class CacheEntry:
+    """Manifest of one cached download, stored next to the file."""
+
+    key: str
+    file_name: str
+    request: dict
+    size: int
+    sha256: str
+    created_at: float
+    last_used_at: float
+
+    def covers(self, request: dict) -> bool:
+        """True if this download contains everything `request` asks for."""
+        mine = self.request
+        other = canonical_request(request)
+
+        for key in set(mine) | set(other):
+            if key in ("variable", "day", "time"):
+                if not set(other.get(key, [])) <= set(mine.get(key, [])):
+                    return False
+            elif key == "area":
+                north, west, south, east = mine[key]
+                o_north, o_west, o_south, o_east = other[key]
+                if not (
+                    o_north <= north
+                    and o_south >= south
+                    and o_west >= west
+                    and o_east <= east
+                ):
+                    return False
+            elif mine.get(key) != other.get(key):
+                return False
+        return True
+
+
+class DownloadCache:
+    """
+    Content-addressed cache of CDS downloads.
+
+    Each download is stored as `<key>.zip` (or `.nc`) where the key is the
+    hash of its canonical request, with a `<key>.json` manifest holding the
+    request, size, checksum and timestamps. A request is served from an
+    identical cached download, or by subsetting a cached download that
+    covers it. The least recently used downloads are evicted once the cache
+    grows over `max_size_bytes`.
+    """
+
+    def __init__(self, directory: Path, max_size_bytes: int | None = None):
+        self.directory = directory
+        self.max_size_bytes = max_size_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+
+    def _manifest_path(self, key: str) -> Path:
+        return self.directory / f"{key}{MANIFEST_SUFFIX}"
+
+    def _write_manifest(self, entry: CacheEntry) -> None:
+        tmp_path = self._manifest_path(entry.key).with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(asdict(entry), f, indent=2)
+        os.replace(tmp_path, self._manifest_path(entry.key))
+
+    def entries(self) -> list[CacheEntry]:
+        entries = []
+        for manifest_path in self.directory.glob(f"*{MANIFEST_SUFFIX}"):
+            with open(manifest_path) as f:
+                entry = CacheEntry(**json.load(f))
+            if (self.directory / entry.file_name).exists():
+                entries.append(entry)
+        return entries
+
+    def size(self) -> int:
+        return sum(entry.size for entry in self.entries())
+
+    def _touch(self, entry: CacheEntry) -> None:
+        entry.last_used_at = time.time()
+        self._write_manifest(entry)
+
+    def get(self, request: dict) -> Path | None:
+        """Path of the cached download for exactly this request, if any."""
+        key = request_key(request)
+        with self._lock:
+            manifest_path = self._manifest_path(key)
+            if not manifest_path.exists():
+                return None
+            with open(manifest_path) as f:
+                entry = CacheEntry(**json.load(f))
+            path = self.directory / entry.file_name
+            if not path.exists():
+                return None
+            self._touch(entry)
+            return path
+
+    def find_covering(self, request: dict) -> CacheEntry | None:
+        """The smallest cached download that covers `request`, if any."""
+        with self._lock:
+            covering = [entry for entry in self.entries() if entry.covers(request)]
+            if not covering:
+                return None
+            entry = min(covering, key=lambda e: e.size)
+            self._touch(entry)
+            return entry
+
+    def put(self, request: dict, path: Path) -> Path:
+        """Add the download at `path` for `request` to the cache."""
+        key = request_key(request)
+        suffix = ".zip" if zipfile.is_zipfile(path) else ".nc"
+        cached_path = self.directory / f"{key}{suffix}"
+
+        with self._lock:
+            link_or_copy(path, cached_path)
+            now = time.time()
+            self._write_manifest(
+                CacheEntry(
+                    key=key,
+                    file_name=cached_path.name,
+                    request=canonical_request(request),
+                    size=cached_path.stat().st_size,
+                    sha256=file_sha256(cached_path),
+                    created_at=now,
+                    last_used_at=now,
+                )
+            )
+            logger.debug(f"Cached {path} as {cached_path.name}")
+            self.evict()
+        return cached_path
+
+    def fetch(self, request: dict, target: Path) -> bool:
+        """
+        Serve `request` from the cache into `target`. Returns False on a miss.
+        """
+        cached_path = self.get(request)
+        if cached_path is not None:
+            logger.info(f"Serving {target.name} from cache")
+            link_or_copy(cached_path, target)
+            return True
+
+        entry = self.find_covering(request)
+        if entry is not None:
+            logger.info(f"Serving {target.name} from a subset of {entry.file_name}")
+            try:
+                subset_download(self.directory / entry.file_name, request, target)
+            except ValueError as e:
+                logger.warning(f"Cannot serve {target.name} from the cache: {e}")
+                return False
+            return True
+
+        return False
+
+    def evict(self) -> None:
+        """Remove least recently used downloads until under `max_size_bytes`."""
+        if self.max_size_bytes is None:
+            return
+
+        with self._lock:
+            entries = sorted(self.entries(), key=lambda e: e.last_used_at)
+            total = sum(entry.size for entry in entries)
+            for entry in entries:
+                if total <= self.max_size_bytes:
+                    break
+                logger.debug(f"Evicting {entry.file_name} from the cache")
+                (self.directory / entry.file_name).unlink(missing_ok=True)
+                self._manifest_path(entry.key).unlink(missing_ok=True)
+                total -= entry.size
+
+
+def subset_dataset(ds: xr.Dataset, request: dict) -> xr.Dataset | None:
+    """
+    Select the variables, days, hours and area of `request` from a dataset
+    downloaded for a covering request. Returns None if none of the requested
+    variables, times or grid points are in `ds`.
+    """
+    request = canonical_request(request)
+
+    names = {
+        Default_CDS_Request_Variable_NetCDF_Names.get(variable, variable)
+        for variable in request["variable"]
+    }
+    keep = [name for name in ds.data_vars if name in names]
+    if not keep:
+        return None
+    ds = ds[keep]
+
+    valid_time = pd.DatetimeIndex(ds["valid_time"].values)
+    days = [int(d) for d in request["day"]]
+    hours = [int(t.split(":")[0]) for t in request["time"]]
+    ds = ds.isel(
+        valid_time=np.nonzero(valid_time.day.isin(days) & valid_time.hour.isin(hours))[
+            0
+        ]
+    )
+
+    north, west, south, east = request["area"]
+    latitude = ds["latitude"].values
+    longitude = ds["longitude"].values
+    ds = ds.isel(
+        latitude=np.nonzero((latitude <= north) & (latitude >= south))[0],
+        longitude=np.nonzero((longitude >= west) & (longitude <= east))[0],
+    )
+    if 0 in ds.sizes.values():
+        return None
+    return ds
+
+
+def subset_download(source: Path, request: dict, target: Path) -> None:
+    """
+    Write the part of a cached download covering `request` to `target`.
+    Raises ValueError, leaving no `target`, if none of it is in the download.
+    """
+    target.parent.mkdir(parents=True, exist_ok=True)
+
+    if not zipfile.is_zipfile(source):
+        with xr.open_dataset(source) as ds:
+            subset = subset_dataset(ds, request)
+            if subset is None:
+                raise ValueError(f"{source} has none of the requested data")
+            subset.to_netcdf(target)
+        return
+
+    with (
+        zipfile.ZipFile(source) as source_zip,
+        tempfile.TemporaryDirectory() as scratch_dir,
+        zipfile.ZipFile(target, "w") as target_zip,
+    ):
+        written = 0
+        for member in source_zip.namelist():
+            if not member.endswith(".nc"):
+                continue
+            with xr.open_dataset(source_zip.extract(member, scratch_dir)) as ds:
+                subset = subset_dataset(ds, request)
+                if subset is None:
+                    continue
+                subset_path = Path(scratch_dir) / f"subset_{Path(member).name}"
+                subset.to_netcdf(subset_path)
+            target_zip.write(subset_path, member)
+            written += 1
+
+    if not written:
+        target.unlink()
+        raise ValueError(f"{source} has none of the requested data")
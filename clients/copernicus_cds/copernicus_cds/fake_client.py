@@ -0,0 +1,95 @@
+import logging
+import tempfile
+import threading
+import zipfile
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+from copernicus_cds.schemas import Default_CDS_Request_Variable_NetCDF_Names
+
+# spacing of the ERA5 single levels grid, in degrees
+ERA5_GRID_STEP = 0.25
+FAKE_MEMBER_NAME = "data_stream-oper_stepType-instant.nc"
+
+logger = logging.getLogger(__name__)
+
+
+class FakeCdsError(Exception):
+    """A request failed on purpose by `FakeCdsClient`."""
+
+
+def fake_era5_dataset(request: dict, seed: int = 0) -> xr.Dataset:
+    """
+    An ERA5-like dataset for a request dict: every requested variable, at
+    every requested day and hour, on the 0.25 degree grid of its area.
+    """
+    north, west, south, east = (float(v) for v in request["area"])
+    latitude = np.arange(north, south - ERA5_GRID_STEP / 2, -ERA5_GRID_STEP)
+    longitude = np.arange(west, east + ERA5_GRID_STEP / 2, ERA5_GRID_STEP)
+    valid_time = pd.DatetimeIndex(
+        [
+            pd.Timestamp(
+                f"{int(request['year'])}-{int(request['month']):02d}-{int(day):02d} {time}"
+            )
+            for day in request["day"]
+            for time in request["time"]
+        ]
+    ).sort_values()
+
+    rng = np.random.default_rng(seed)
+    shape = (len(valid_time), len(latitude), len(longitude))
+    return xr.Dataset(
+        {
+            Default_CDS_Request_Variable_NetCDF_Names.get(variable, variable): (
+                ("valid_time", "latitude", "longitude"),
+                rng.random(shape, dtype=np.float32),
+            )
+            for variable in request["variable"]
+        },
+        coords={
+            "valid_time": valid_time,
+            "latitude": latitude,
+            "longitude": longitude,
+        },
+    )
+
+
+class FakeCdsClient:
+    """
+    Offline stand-in for `cdsapi.Client`, to exercise planning, retries and
+    resume without the CDS. `retrieve` writes a zip holding one NetCDF member
+    built by `fake_era5_dataset`.
+
+    The first `fail_first` calls raise `FakeCdsError`, like transient CDS
+    errors, and requests saved to a file named in `fail_targets` always do.
+    Every request is recorded in `requests`. One instance can be shared by
+    concurrent downloads: pass `client_factory=lambda: client`.
+    """
+
+    def __init__(self, fail_first: int = 0, fail_targets: Iterable[str] = ()):
+        self.fail_first = fail_first
+        self.fail_targets = set(fail_targets)
+        self.requests: list[dict] = []
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def retrieve(self, name: str, request: dict, target: str | Path) -> Path:
+        target = Path(target)
+        with self._lock:
+            self.requests.append(request)
+            if self.failures < self.fail_first or target.name in self.fail_targets:
+                self.failures += 1
+                raise FakeCdsError(f"Failed {name} request for {target.name}")
+
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.TemporaryDirectory() as scratch_dir:
+            member_path = Path(scratch_dir) / FAKE_MEMBER_NAME
+            fake_era5_dataset(request).to_netcdf(member_path)
+            with zipfile.ZipFile(target, "w") as target_zip:
+                target_zip.write(member_path, FAKE_MEMBER_NAME)
+
+        logger.debug(f"Wrote fake {name} download {target}")
+        return target
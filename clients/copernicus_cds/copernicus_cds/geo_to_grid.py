@@ -1,6 +1,13 @@
 import math
 from dataclasses import dataclass
 
+import numpy as np
+import numpy.typing as npt
+
+# (intercept, slope, minimum_value) used to map coordinates onto the EDOL grid
+LATITUDE_GRID_TRANSFORM = (44, -4, 50)
+LONGITUDE_GRID_TRANSFORM = (0, 4, -8)
+
 
 def magic_transform_coorinates_to_grid(
     coordinate_value: float,
@@ -12,6 +19,52 @@ def magic_transform_coorinates_to_grid(
     return math.ceil(intercept + slope * diff_from_min_lat)
 
 
+def magic_transform_coordinates_to_grid_array(
+    coordinate_values: npt.ArrayLike,
+    intercept: int,
+    slope: int,
+    minimum_value: int,
+) -> npt.NDArray[np.int64]:
+    """
+    Vectorised version of `magic_transform_coorinates_to_grid`.
+
+    The input dtype is preserved (no upcast to float64) so that the result is
+    identical to calling the scalar version on every element.
+    """
+    diff_from_min = np.asarray(coordinate_values) - minimum_value
+    return np.ceil(intercept + slope * diff_from_min).astype(np.int64)
+
+
+def coordinates_to_grid_indices(
+    latitudes: npt.ArrayLike, longitudes: npt.ArrayLike
+) -> tuple[npt.NDArray[np.int64], npt.NDArray[np.int64]]:
+    """
+    Compute the xx (latitude) and yy (longitude) grid indices for whole
+    1-D coordinate vectors at once.
+    """
+    xx = magic_transform_coordinates_to_grid_array(latitudes, *LATITUDE_GRID_TRANSFORM)
+    yy = magic_transform_coordinates_to_grid_array(
+        longitudes, *LONGITUDE_GRID_TRANSFORM
+    )
+    return xx, yy
+
+
+def grid_cell_labels(
+    latitudes: npt.ArrayLike, longitudes: npt.ArrayLike
+) -> npt.NDArray[np.object_]:
+    """
+    Return the `xx_yy` grid cell labels for the outer product of the 1-D
+    latitude and longitude vectors, with shape (len(latitudes), len(longitudes)).
+
+    Only len(latitudes) + len(longitudes) strings are formatted; the labels
+    are identical to `str(EdolGridCell.from_coordinates(lat, lon))`.
+    """
+    xx, yy = coordinates_to_grid_indices(latitudes, longitudes)
+    xx_labels = np.array([f"{x:02d}_" for x in xx.tolist()], dtype=object)
+    yy_labels = np.array([f"{y:02d}" for y in yy.tolist()], dtype=object)
+    return xx_labels[:, np.newaxis] + yy_labels[np.newaxis, :]
+
+
 class EdolGridCell:
     """
     The grid_cell variable is in the format xx_yy where xx indicates latitude and yy indicates longitude such that 00_00 refers
@@ -52,6 +105,6 @@ class EdolGridCell:
         # [cdinu] - I have no idea what these values are
         # I just copied them from @cceamik (Daniel)'s original code,
         # which is itself a copy of Ed's original code
-        xx = magic_transform_coorinates_to_grid(lat, 44, -4, 50)
-        yy = magic_transform_coorinates_to_grid(lon, 0, 4, -8)
+        xx = magic_transform_coorinates_to_grid(lat, *LATITUDE_GRID_TRANSFORM)
+        yy = magic_transform_coorinates_to_grid(lon, *LONGITUDE_GRID_TRANSFORM)
         return EdolGridCell(xx, yy)
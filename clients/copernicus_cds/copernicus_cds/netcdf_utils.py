@@ -1,14 +1,26 @@
 import logging
+import tempfile
 import zipfile
+from contextlib import contextmanager
 from dataclasses import dataclass
 from pathlib import Path
-from typing import IO
+from typing import IO, Iterator, Literal
 
+import numpy as np
+import numpy.typing as npt
 import pandas as pd
 import xarray as xr
-from copernicus_cds.geo_to_grid import EdolGridCell
+from copernicus_cds.geo_to_grid import grid_cell_labels
+from copernicus_cds.writers import (
+    OutputFormat,
+    PartitionColumn,
+    TableWriter,
+    open_writer,
+)
 
 REQUIRED_COLUMNS = {"latitude", "longitude", "valid_time"}
+GRID_POINT_DIM = "grid_point"
+GRID_CELLS_ATTR = "grid_cells"
 
 logger = logging.getLogger(__name__)
 
@@ -21,13 +33,23 @@ class ProcessingConfig:
     netcdf_field_mapping: dict[str, str] | None = None
     grid_cells_of_interest: list[str] | None = None
     debug: bool = False
+    # write the output chunk by chunk instead of building one DataFrame
+    streaming: bool = False
+    stream_group_by: Literal["grid_cell", "day"] = "grid_cell"
+    # number of grid cells or days per chunk
+    stream_chunk_size: int = 32
+    # inferred from the output file suffix when not set
+    output_format: OutputFormat | None = None
+    # write a hive-partitioned parquet dataset (a directory)
+    partition_by: list[PartitionColumn] | None = None
+    # open members lazily with dask, in chunks of this many time steps
+    dask_chunk_size: int | None = None
 
 
 class NetCDFProcessor:
-    """Handles processing of NetCDF files to CSV format."""
+    """Handles processing of NetCDF files to CSV, parquet or Arrow format."""
 
     def __init__(self, config: ProcessingConfig = ProcessingConfig()):
-        self.dataframe = None
         self.config = config
 
     def validate_dataset(self, ds: xr.Dataset) -> None:
@@ -36,8 +58,36 @@ class NetCDFProcessor:
         if missing_cols:
             raise ValueError(f"Missing required columns: {missing_cols}")
 
-    def process_dataset(self, ds: xr.Dataset) -> pd.DataFrame:
-        """Process xarray Dataset into pandas DataFrame."""
+    def select_grid_cells(
+        self,
+        ds: xr.Dataset,
+        labels: npt.NDArray[np.object_],
+        grid_cells: list[str],
+    ) -> tuple[xr.Dataset, npt.NDArray[np.object_]]:
+        """
+        Select the (latitude, longitude) points of `ds` whose grid cell label is
+        in `grid_cells`. The points are stacked along a new `grid_point`
+        dimension; the labels of the selected points are returned alongside.
+        """
+        lat_idx, lon_idx = np.nonzero(np.isin(labels, grid_cells))
+        ds = ds.isel(
+            {
+                ds["latitude"].dims[0]: xr.DataArray(lat_idx, dims=GRID_POINT_DIM),
+                ds["longitude"].dims[0]: xr.DataArray(lon_idx, dims=GRID_POINT_DIM),
+            }
+        )
+        return ds, labels[lat_idx, lon_idx]
+
+    def prepare_dataset(
+        self, ds: xr.Dataset, stack_grid_points: bool = False
+    ) -> xr.Dataset:
+        """
+        Rename variables and attach the grid_cell variable, filtering the grid
+        cells of interest if configured. Nothing is loaded besides coordinates.
+
+        With `stack_grid_points` the (latitude, longitude) points are always
+        stacked along the `grid_point` dimension, even when no filter is set.
+        """
         # Rename columns according to mapping
         if self.config.netcdf_field_mapping:
             ds = ds.rename(
@@ -48,15 +98,37 @@ class NetCDFProcessor:
                 }
             )
 
-        # Add grid cell information
-        ds["grid_cell"] = xr.apply_ufunc(
-            lambda lat, lon: str(EdolGridCell.from_coordinates(lat, lon)),
-            ds["latitude"],
-            ds["longitude"],
-            vectorize=True,
+        # Grid cell labels are computed on the 1-D coordinates only
+        labels = grid_cell_labels(ds["latitude"].values, ds["longitude"].values)
+        grid_cell_dims = ds["latitude"].dims + ds["longitude"].dims
+
+        # Filter grid cells of interest in coordinate space, before anything is
+        # loaded, by picking the matching (latitude, longitude) points
+        if self.config.grid_cells_of_interest or stack_grid_points:
+            grid_cells_of_interest = self.config.grid_cells_of_interest or list(
+                np.unique(labels)
+            )
+            logger.debug(
+                f"Selecting {len(grid_cells_of_interest)} grid cells of interest"
+            )
+            ds, labels = self.select_grid_cells(ds, labels, grid_cells_of_interest)
+            grid_cell_dims = (GRID_POINT_DIM,)
+
+        # Store grid_cell as integer codes into the sorted list of labels
+        grid_cells, codes = np.unique(labels, return_inverse=True)
+        ds["grid_cell"] = (
+            grid_cell_dims,
+            codes.reshape(labels.shape).astype(np.int32),
+            {GRID_CELLS_ATTR: list(grid_cells)},
         )
 
-        # Add analysis date and preserve original datetime
+        return ds
+
+    def dataset_to_df(self, ds: xr.Dataset) -> pd.DataFrame:
+        """Convert a prepared Dataset into a pandas DataFrame."""
+        # Add analysis date and preserve original datetime. Loading computes
+        # all dask chunks of a lazily opened dataset in one parallel pass
+        ds = ds.copy().load()
         ds["date_time"] = ds["valid_time"]
         ds["analysis_date"] = xr.apply_ufunc(
             lambda valid_time: pd.to_datetime(valid_time).date(),
@@ -65,13 +137,21 @@ class NetCDFProcessor:
         )
         df = ds.to_dataframe().reset_index()
 
-        # filter grid cells of interest
-        # i tried to do it with the ds xarray, but it crashed the process
-        if self.config.grid_cells_of_interest:
-            logger.debug(
-                f"Filtering {len(self.config.grid_cells_of_interest)} grid cells of interest"
-            )
-            df = df[df["grid_cell"].isin(self.config.grid_cells_of_interest)]
+        if GRID_POINT_DIM in df.columns:
+            # keep the same column layout as the unfiltered dataframe
+            df = df[
+                ["valid_time", "latitude", "longitude"]
+                + [
+                    col
+                    for col in df.columns
+                    if col
+                    not in {"valid_time", "latitude", "longitude", GRID_POINT_DIM}
+                ]
+            ]
+
+        df["grid_cell"] = pd.Categorical.from_codes(
+            df["grid_cell"], categories=ds["grid_cell"].attrs[GRID_CELLS_ATTR]
+        )
 
         # drop columns that are not in the default output columns
         if self.config.output_columns:
@@ -83,14 +163,172 @@ class NetCDFProcessor:
 
         return df
 
-    def netcdf_to_df(self, netcdf_fd: IO[bytes]) -> pd.DataFrame:
-        """Convert NetCDF file to DataFrame."""
+    def process_dataset(self, ds: xr.Dataset) -> pd.DataFrame:
+        """Process xarray Dataset into pandas DataFrame."""
+        return self.dataset_to_df(self.prepare_dataset(ds))
+
+    def merge_datasets(self, datasets: list[xr.Dataset]) -> xr.Dataset:
+        """
+        Align prepared per-variable datasets on valid_time and on (latitude,
+        longitude), or on `grid_point` once grid cells are selected, and merge
+        them into one. Shared coordinates and the grid_cell variable are taken
+        from the first dataset.
+
+        Along `grid_point` the datasets are aligned by position, so they must
+        hold the same points in the same order; ValueError is raised otherwise.
+        """
+        if any(GRID_POINT_DIM in ds.dims for ds in datasets):
+            first = datasets[0]
+            for ds in datasets[1:]:
+                for coordinate in ("latitude", "longitude"):
+                    if ds[coordinate].dims != first[coordinate].dims or not (
+                        np.array_equal(ds[coordinate].values, first[coordinate].values)
+                    ):
+                        raise ValueError(
+                            f"Cannot merge datasets with different {GRID_POINT_DIM} "
+                            f"{coordinate} values"
+                        )
+
+        return xr.merge(
+            datasets, join="outer", compat="override", combine_attrs="override"
+        )
+
+    def iter_chunks(self, ds: xr.Dataset) -> Iterator[xr.Dataset]:
+        """
+        Split a merged dataset with a `grid_point` dimension into chunks of
+        `stream_chunk_size` grid cells or days, in output order.
+        """
+        chunk_size = self.config.stream_chunk_size
+
+        if self.config.stream_group_by == "day":
+            days = pd.DatetimeIndex(ds["valid_time"].values).normalize()
+            unique_days = days.unique().sort_values()
+            for i in range(0, len(unique_days), chunk_size):
+                positions = np.nonzero(days.isin(unique_days[i : i + chunk_size]))[0]
+                yield ds.isel(valid_time=positions)
+        else:
+            codes = ds["grid_cell"].values
+            unique_codes = np.unique(codes)
+            for i in range(0, len(unique_codes), chunk_size):
+                positions = np.nonzero(
+                    np.isin(codes, unique_codes[i : i + chunk_size])
+                )[0]
+                yield ds.isel({GRID_POINT_DIM: positions})
+
+    def netcdf_to_dataset(self, netcdf_fd: IO[bytes]) -> xr.Dataset:
+        """Open a NetCDF file and load its prepared Dataset into memory."""
         with xr.open_dataset(netcdf_fd) as ds:
             self.validate_dataset(ds)
-            return self.process_dataset(ds)
+            return self.prepare_dataset(ds).load()
+
+    def netcdf_to_df(self, netcdf_fd: IO[bytes]) -> pd.DataFrame:
+        """Convert NetCDF file to DataFrame."""
+        return self.dataset_to_df(self.netcdf_to_dataset(netcdf_fd))
+
+    def open_netcdf(self, path: Path) -> xr.Dataset:
+        """
+        Open a NetCDF file lazily, with dask chunks along valid_time if
+        `dask_chunk_size` is configured.
+        """
+        chunks = (
+            {"valid_time": self.config.dask_chunk_size}
+            if self.config.dask_chunk_size
+            else None
+        )
+        return xr.open_dataset(path, chunks=chunks)
+
+    @contextmanager
+    def open_zip_members(
+        self,
+        zip_ref: zipfile.ZipFile,
+        netcdf_files: list[str],
+        scratch_dir: str,
+        stack_grid_points: bool = False,
+    ) -> Iterator[list[xr.Dataset]]:
+        """
+        Extract the NetCDF members of an archive to `scratch_dir` and open
+        them lazily, yielding the prepared datasets. The files are closed on
+        exit.
+        """
+        opened: list[xr.Dataset] = []
+        try:
+            prepared = []
+            for file_name in netcdf_files:
+                logger.debug(f"Opening {file_name}...")
+                ds = self.open_netcdf(Path(zip_ref.extract(file_name, scratch_dir)))
+                opened.append(ds)
+                self.validate_dataset(ds)
+                prepared.append(
+                    self.prepare_dataset(ds, stack_grid_points=stack_grid_points)
+                )
+            yield prepared
+        finally:
+            for ds in opened:
+                ds.close()
+
+    def open_writer(self, input_path: Path, output_path: Path) -> TableWriter:
+        """Open the configured writer for `output_path`."""
+        return open_writer(
+            output_path,
+            output_format=self.config.output_format,
+            partition_by=self.config.partition_by,
+            basename=input_path.stem,
+        )
+
+    def process_zip_file_streaming(self, input_path: Path, output_path: Path) -> None:
+        """
+        Process compressed NetCDF files chunk by chunk and append each chunk to
+        the output, so that peak memory is bounded by the chunk size.
+
+        The archive members are extracted to a scratch directory and opened
+        lazily (with dask if `dask_chunk_size` is set); only one chunk of grid
+        cells (or days) is loaded at a time.
+        """
+        try:
+            with (
+                zipfile.ZipFile(input_path, "r") as zip_ref,
+                tempfile.TemporaryDirectory() as scratch_dir,
+            ):
+                netcdf_files = [f for f in zip_ref.namelist() if f.endswith(".nc")]
+                if not netcdf_files:
+                    raise ValueError("No NetCDF files found in archive")
+
+                with self.open_zip_members(
+                    zip_ref, netcdf_files, scratch_dir, stack_grid_points=True
+                ) as prepared:
+                    merged = self.merge_datasets(prepared)
+
+                    with self.open_writer(input_path, output_path) as writer:
+                        for chunk in self.iter_chunks(merged):
+                            df = self.dataset_to_df(chunk)
+                            if self.config.output_columns:
+                                df = df[self.config.output_columns]
+
+                            # stable sort keeps the time order within each group
+                            df = df.sort_values(
+                                by=(
+                                    ["grid_cell", "analysis_date"]
+                                    if self.config.stream_group_by == "grid_cell"
+                                    else ["analysis_date", "grid_cell"]
+                                ),
+                                kind="stable",
+                            )
+                            writer.write(df)
+
+        except zipfile.BadZipFile:
+            raise ValueError(f"Invalid or corrupted zip file: {input_path}")
+        except Exception as e:
+            logger.debug(f"Error processing zip file: {e}", exc_info=True)
+            raise e
 
     def process_zip_file(self, input_path: Path, output_path: Path) -> None:
-        """Process compressed NetCDF files and save to a single CSV."""
+        """
+        Process compressed NetCDF files and save them to a single output.
+        The format is CSV, parquet or Arrow IPC (see `copernicus_cds.writers`).
+        """
+        if self.config.streaming:
+            return self.process_zip_file_streaming(input_path, output_path)
+
         try:
             with zipfile.ZipFile(input_path, "r") as zip_ref:
                 file_list = zip_ref.namelist()
@@ -100,49 +338,41 @@ class NetCDFProcessor:
                 if not netcdf_files:
                     raise ValueError("No NetCDF files found in archive")
 
-                # Process each NC file
-                for file_name in netcdf_files:
-                    logger.debug(f"Processing {file_name}...")
-                    with zip_ref.open(file_name) as nc_file:
-                        df = self.netcdf_to_df(nc_file)
-                        logger.debug(
-                            f"Processed {file_name}, columns: {list(df.columns)}"
-                        )
-                        if self.dataframe is None:
-                            self.dataframe = df
-                        else:
-                            logger.debug(f"Merging {file_name} with existing data...")
-
-                            # merge with suffix to avoid column name conflicts
-                            self.dataframe = pd.merge(
-                                self.dataframe,
-                                df,
-                                on=[
-                                    "valid_time",
-                                    "grid_cell",
-                                    "analysis_date",
-                                    "date_time",
-                                ],
-                                how="outer",
-                                suffixes=("", file_name),
+                if self.config.dask_chunk_size:
+                    # Open the members out-of-core; the merge and conversion
+                    # run on dask chunks in parallel
+                    with (
+                        tempfile.TemporaryDirectory() as scratch_dir,
+                        self.open_zip_members(
+                            zip_ref, netcdf_files, scratch_dir
+                        ) as datasets,
+                    ):
+                        logger.debug(f"Merging {len(datasets)} datasets...")
+                        df = self.dataset_to_df(self.merge_datasets(datasets))
+                else:
+                    # Prepare each NC file, then align and merge them on their
+                    # native dimensions so that the data is tabulated only once
+                    datasets = []
+                    for file_name in netcdf_files:
+                        logger.debug(f"Processing {file_name}...")
+                        with zip_ref.open(file_name) as nc_file:
+                            ds = self.netcdf_to_dataset(nc_file)
+                            logger.debug(
+                                f"Processed {file_name}, variables: {list(ds.data_vars)}"
                             )
+                            datasets.append(ds)
 
-                # Combine all dataframes
-                if self.dataframe is None:
-                    raise ValueError("No data processed from NC files")
+                    logger.debug(f"Merging {len(datasets)} datasets...")
+                    df = self.dataset_to_df(self.merge_datasets(datasets))
 
                 if self.config.output_columns:
-                    self.dataframe = self.dataframe[self.config.output_columns]
+                    df = df[self.config.output_columns]
 
                 # sort by "grid_cell","analysis_date" ascending
-                self.dataframe.sort_values(
-                    by=["grid_cell", "analysis_date"], inplace=True
-                )
+                df = df.sort_values(by=["grid_cell", "analysis_date"])
 
-                # isodates with T and Z
-                self.dataframe.to_csv(
-                    output_path, index=False, date_format="%Y-%m-%dT%H:%M:%SZ"
-                )
+                with self.open_writer(input_path, output_path) as writer:
+                    writer.write(df)
                 logger.debug(f"Saved combined data to {output_path}")
 
         except zipfile.BadZipFile:
@@ -1,13 +1,36 @@
 import datetime
+import logging
 from calendar import monthrange
+from dataclasses import dataclass, field, replace
 from pathlib import Path
-from typing import List, Tuple, get_args
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Iterator,
+    List,
+    Protocol,
+    Tuple,
+    get_args,
+)
 
 import cdsapi
 from copernicus_cds.schemas import Default_CDS_Request_Variables
 
+if TYPE_CHECKING:
+    from copernicus_cds.cache import CacheEntry, DownloadCache
+
 UK_BOUNDING_BOX = (61, -8, 49.9, 2)
 
+ERA5_HOURS = [f"{hour:02d}:00" for hour in range(24)]
+
+# the CDS rejects requests with more fields (variables x days x hours) than this
+DEFAULT_MAX_FIELDS = 120_000
+# time a request spends in the CDS queue, as an equivalent number of fields
+DEFAULT_REQUEST_OVERHEAD_FIELDS = 20_000
+
+logger = logging.getLogger(__name__)
+
 
 def get_month_days(year: int, month: int) -> List[str]:
     """Get all days in a given month as formatted strings."""
@@ -44,6 +67,7 @@ def get_era5_request_dict(
     day: List[str] | int | None = None,
     area: Tuple[float, float, float, float] = UK_BOUNDING_BOX,
     variables: list[str] = Default_CDS_Request_Variables,
+    times: List[str] | None = None,
 ) -> dict:
     """
     Returns a dictionary to be used as the request body
@@ -82,6 +106,17 @@ def get_era5_request_dict(
     else:
         raise ValueError("Day should be an integer or a list of integers or None")
 
+    if times is None:
+        # default to every hour of the day
+        time_list = list(ERA5_HOURS)
+    else:
+        for t in times:
+            if t not in ERA5_HOURS:
+                raise ValueError(
+                    f"Time {t} should be a whole hour between 00:00 and 23:00"
+                )
+        time_list = list(times)
+
     return {
         "product_type": ["reanalysis"],
         "data_format": "netcdf",
@@ -90,36 +125,17 @@ def get_era5_request_dict(
         "year": year,
         "month": month,
         "day": day_list,
-        "time": [
-            "00:00",
-            "01:00",
-            "02:00",
-            "03:00",
-            "04:00",
-            "05:00",
-            "06:00",
-            "07:00",
-            "08:00",
-            "09:00",
-            "10:00",
-            "11:00",
-            "12:00",
-            "13:00",
-            "14:00",
-            "15:00",
-            "16:00",
-            "17:00",
-            "18:00",
-            "19:00",
-            "20:00",
-            "21:00",
-            "22:00",
-            "23:00",
-        ],
+        "time": time_list,
         "area": area,
     }
 
 
+class CdsClient(Protocol):
+    """The subset of `cdsapi.Client` used to download files."""
+
+    def retrieve(self, name: str, request: dict, target: str | Path) -> Any: ...
+
+
 def request_era5_files(
     path: Path,
     year: int,
@@ -127,6 +143,9 @@ def request_era5_files(
     day: List[str] | int | None = None,
     area: Tuple[float, float, float, float] = UK_BOUNDING_BOX,
     variables: list[str] = Default_CDS_Request_Variables,
+    times: List[str] | None = None,
+    cache: "DownloadCache | None" = None,
+    client_factory: Callable[[], CdsClient] = cdsapi.Client,
 ) -> None:
     """
     Request ERA5 monthly files from the Copernicus Climate Data Store API
@@ -139,11 +158,273 @@ def request_era5_files(
     day (List[str] | int | None): List of days to request data for. Default is None which means all days in the month
     area (Tuple[float, float, float, float]): Bounding box for the data retrieval in the format 'lon_min,lat_min,lon_max,lat_max'. Default is UK
     variables (list[str]): List of parameters to retrieve from the CDS API. Default is the list of default variables in the copernicus_cds.schemas module
+    times (List[str] | None): Hours of the day to request, e.g. '06:00'. Default is None which means all 24 hours
+    cache (DownloadCache | None): Cache of previous downloads. When given, the request is served from the cache if possible and new downloads are added to it
+    client_factory (Callable[[], CdsClient]): Builds the client used on a cache miss. Default is cdsapi.Client
     """
 
-    c = cdsapi.Client()
-
     request_dict = get_era5_request_dict(
-        year=year, month=month, day=day, area=area, variables=variables
+        year=year,
+        month=month,
+        day=day,
+        area=area,
+        variables=variables,
+        times=times,
     )
+
+    if cache is not None and cache.fetch(request_dict, path):
+        return
+
+    c = client_factory()
     c.retrieve("reanalysis-era5-single-levels", request_dict, path)
+
+    if cache is not None:
+        cache.put(request_dict, path)
+
+
+@dataclass
+class Demand:
+    """Variables needed at the given hours of every day from `start` to `end`."""
+
+    start: datetime.date
+    end: datetime.date
+    area: Tuple[float, float, float, float] = UK_BOUNDING_BOX
+    variables: list[str] = field(
+        default_factory=lambda: list(Default_CDS_Request_Variables)
+    )
+    times: list[str] = field(default_factory=lambda: list(ERA5_HOURS))
+
+    def __post_init__(self):
+        # datetimes (e.g. parsed from the command line) are truncated to dates
+        if isinstance(self.start, datetime.datetime):
+            self.start = self.start.date()
+        if isinstance(self.end, datetime.datetime):
+            self.end = self.end.date()
+
+        for t in self.times:
+            if t not in ERA5_HOURS:
+                raise ValueError(
+                    f"Time {t} should be a whole hour between 00:00 and 23:00"
+                )
+
+
+@dataclass
+class PlannedRequest:
+    """One request of a plan, for some days of a single month."""
+
+    year: int
+    month: int
+    days: list[int]
+    area: Tuple[float, float, float, float]
+    variables: list[str]
+    times: list[str]
+    # served entirely from the download cache
+    cached: bool = False
+
+    @property
+    def fields(self) -> int:
+        return len(self.days) * len(self.times) * len(self.variables)
+
+    def to_request_dict(self) -> dict:
+        return get_era5_request_dict(
+            year=self.year,
+            month=self.month,
+            day=self.days,
+            area=self.area,
+            variables=self.variables,
+            times=self.times,
+        )
+
+    def day_runs(self) -> list[tuple[int, int]]:
+        """First and last day of each run of consecutive days."""
+        runs: list[tuple[int, int]] = []
+        for day in self.days:
+            if runs and runs[-1][1] == day - 1:
+                runs[-1] = (runs[-1][0], day)
+            else:
+                runs.append((day, day))
+        return runs
+
+    def file_name(self, prefix: str = "era5") -> str:
+        """
+        Name of the downloaded file, e.g. era5_<bbox>_2024-01_01-03+20-22_<key>.zip
+        for days 1 to 3 and 20 to 22. It ends with the start of the request
+        key, so requests for the same days and other variables get their own
+        file and a request is saved under the same name on every run.
+        """
+        # cache.py pulls in xarray, which planning does not need otherwise
+        from copernicus_cds.cache import request_key
+
+        bbox_str = "_".join(map(str, self.area))
+        days = "+".join(
+            f"{first:02d}" if first == last else f"{first:02d}-{last:02d}"
+            for first, last in self.day_runs()
+        )
+        key = request_key(self.to_request_dict())[:12]
+        return f"{prefix}_{bbox_str}_{self.year}-{self.month:02d}_{days}_{key}.zip"
+
+    def can_merge(self, other: "PlannedRequest") -> bool:
+        return (
+            not self.cached
+            and not other.cached
+            and (self.year, self.month) == (other.year, other.month)
+            and tuple(self.area) == tuple(other.area)
+            and self.times == other.times
+        )
+
+    def merge(self, other: "PlannedRequest") -> "PlannedRequest":
+        return replace(
+            self,
+            days=sorted(set(self.days) | set(other.days)),
+            variables=self.variables
+            + [v for v in other.variables if v not in self.variables],
+        )
+
+
+def split_by_month(demand: Demand) -> Iterator[PlannedRequest]:
+    """Split a demand into one request per calendar month."""
+    if demand.end < demand.start:
+        raise ValueError("End date should be after start date")
+
+    day = demand.start
+    while day <= demand.end:
+        month_end = day.replace(day=monthrange(day.year, day.month)[1])
+        last = min(demand.end, month_end)
+        yield PlannedRequest(
+            year=day.year,
+            month=day.month,
+            days=list(range(day.day, last.day + 1)),
+            area=demand.area,
+            variables=list(demand.variables),
+            times=list(demand.times),
+        )
+        day = last + datetime.timedelta(days=1)
+
+
+def split_cached(
+    request: PlannedRequest, entries: list["CacheEntry"]
+) -> list[PlannedRequest]:
+    """
+    Split a request into runs of consecutive days that are either covered by
+    the same cached download, or missing from the cache.
+    """
+
+    def covering_key(day: int) -> str | None:
+        day_request = replace(request, days=[day]).to_request_dict()
+        covering = [entry for entry in entries if entry.covers(day_request)]
+        return min(covering, key=lambda e: e.size).key if covering else None
+
+    runs: list[tuple[str | None, list[int]]] = []
+    for day in request.days:
+        key = covering_key(day)
+        if runs and runs[-1][0] == key and runs[-1][1][-1] == day - 1:
+            runs[-1][1].append(day)
+        else:
+            runs.append((key, [day]))
+
+    return [replace(request, days=days, cached=key is not None) for key, days in runs]
+
+
+def merge_requests(
+    requests: list[PlannedRequest],
+    max_fields: int = DEFAULT_MAX_FIELDS,
+    request_overhead_fields: int = DEFAULT_REQUEST_OVERHEAD_FIELDS,
+) -> list[PlannedRequest]:
+    """
+    Greedily merge requests for the same month and area when one request for
+    the union of their days and variables costs less than both, counting
+    `request_overhead_fields` per request for the time spent in the queue.
+    """
+
+    def cost(request: PlannedRequest) -> int:
+        return request_overhead_fields + request.fields
+
+    merged: list[PlannedRequest] = []
+    for request in sorted(requests, key=lambda r: (r.year, r.month, r.days[0])):
+        best: tuple[int, int, PlannedRequest] | None = None
+        for i, candidate in enumerate(merged):
+            if not candidate.can_merge(request):
+                continue
+            combined = candidate.merge(request)
+            saving = cost(candidate) + cost(request) - cost(combined)
+            if combined.fields <= max_fields and saving > 0:
+                if best is None or saving > best[0]:
+                    best = (saving, i, combined)
+
+        if best is None:
+            merged.append(request)
+        else:
+            merged[best[1]] = best[2]
+
+    return merged
+
+
+def split_request(
+    request: PlannedRequest, max_fields: int = DEFAULT_MAX_FIELDS
+) -> list[PlannedRequest]:
+    """Split a request by days, and by variables if needed, to fit `max_fields`."""
+    if request.fields <= max_fields:
+        return [request]
+
+    fields_per_day = len(request.times) * len(request.variables)
+    if fields_per_day > max_fields:
+        variables_per_request = max_fields // len(request.times)
+        if variables_per_request == 0:
+            raise ValueError(
+                f"{len(request.times)} hours of one variable exceed {max_fields} fields"
+            )
+        return [
+            part
+            for i in range(0, len(request.variables), variables_per_request)
+            for part in split_request(
+                replace(
+                    request,
+                    variables=request.variables[i : i + variables_per_request],
+                ),
+                max_fields,
+            )
+        ]
+
+    days_per_request = max_fields // fields_per_day
+    return [
+        replace(request, days=request.days[i : i + days_per_request])
+        for i in range(0, len(request.days), days_per_request)
+    ]
+
+
+def plan_requests(
+    demands: list[Demand],
+    max_fields: int = DEFAULT_MAX_FIELDS,
+    request_overhead_fields: int = DEFAULT_REQUEST_OVERHEAD_FIELDS,
+    cache: "DownloadCache | None" = None,
+) -> list[PlannedRequest]:
+    """
+    Plan the CDS requests for a list of demands.
+
+    Demands are cut at month boundaries, days already in `cache` are split off
+    as cached requests, and the missing pieces are merged when cheaper and
+    split to stay under `max_fields`. Cached requests are served from the
+    cache by `request_era5_files` without reaching the CDS.
+    """
+    pieces = [piece for demand in demands for piece in split_by_month(demand)]
+
+    if cache is not None:
+        entries = cache.entries()
+        pieces = [part for piece in pieces for part in split_cached(piece, entries)]
+
+    cached = [piece for piece in pieces if piece.cached]
+    missing = [
+        part
+        for request in merge_requests(
+            [piece for piece in pieces if not piece.cached],
+            max_fields=max_fields,
+            request_overhead_fields=request_overhead_fields,
+        )
+        for part in split_request(request, max_fields)
+    ]
+    logger.info(
+        f"Planned {len(missing)} requests ({sum(r.fields for r in missing)} fields), "
+        f"{len(cached)} served from the cache"
+    )
+
+    return sorted(cached + missing, key=lambda r: (r.year, r.month, r.days[0]))
@@ -0,0 +1,177 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable, Literal, Tuple
+
+import cdsapi
+from copernicus_cds.cache import DownloadCache
+from copernicus_cds.request import UK_BOUNDING_BOX, CdsClient, request_era5_files
+from copernicus_cds.schemas import Default_CDS_Request_Variables
+
+"""
+Type for the state of a download job.
+"""
+JobState = Literal["pending", "running", "done", "failed"]
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class DownloadJob:
+    """One `request_era5_files` call and its progress."""
+
+    path: Path
+    year: int
+    month: int
+    day: list[int] | None = None
+    area: Tuple[float, float, float, float] = UK_BOUNDING_BOX
+    variables: list[str] = field(
+        default_factory=lambda: list(Default_CDS_Request_Variables)
+    )
+    times: list[str] | None = None
+    state: JobState = "pending"
+    attempts: int = 0
+    error: str | None = None
+
+    @property
+    def key(self) -> str:
+        """Jobs are identified by their output file."""
+        return str(self.path)
+
+    def to_dict(self) -> dict:
+        d = asdict(self)
+        d["path"] = str(self.path)
+        d["area"] = list(self.area)
+        return d
+
+
+class DownloadScheduler:
+    """
+    Runs download jobs with bounded concurrency, retrying failed jobs with
+    exponential backoff.
+
+    The state of every job is saved to `state_path` after each change, so an
+    interrupted run can be resumed: jobs already marked as done (and whose
+    file still exists) are skipped.
+
+    Downloads go through `cache` when given, so cached months never reach
+    the network. `client_factory` builds one client per download; pass a
+    `FakeCdsClient` (see `copernicus_cds.fake_client`) to run the scheduler
+    offline.
+    """
+
+    def __init__(
+        self,
+        jobs: list[DownloadJob],
+        max_workers: int = 4,
+        max_retries: int = 3,
+        backoff_seconds: float = 30.0,
+        state_path: Path | None = None,
+        cache: DownloadCache | None = None,
+        client_factory: Callable[[], CdsClient] = cdsapi.Client,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        if max_workers < 1:
+            raise ValueError("max_workers should be at least 1")
+
+        self.jobs = jobs
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.state_path = state_path
+        self.cache = cache
+        self.client_factory = client_factory
+        self.sleep = sleep
+        self._lock = threading.Lock()
+
+    def load_state(self) -> None:
+        """Mark jobs completed by a previous run as done."""
+        if self.state_path is None or not self.state_path.exists():
+            return
+
+        with open(self.state_path) as f:
+            previous = {job["path"]: job for job in json.load(f)["jobs"]}
+
+        for job in self.jobs:
+            saved = previous.get(job.key)
+            if saved and saved["state"] == "done" and job.path.exists():
+                job.state = "done"
+                job.attempts = saved["attempts"]
+
+    def save_state(self) -> None:
+        if self.state_path is None:
+            return
+
+        with self._lock:
+            state = {"jobs": [job.to_dict() for job in self.jobs]}
+            tmp_path = self.state_path.with_suffix(".tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(state, f, indent=2)
+            os.replace(tmp_path, self.state_path)
+
+    def backoff(self, attempt: int) -> float:
+        """Exponential backoff with jitter, in seconds, after `attempt` failures."""
+        delay: float = self.backoff_seconds * 2 ** (attempt - 1)
+        return delay * random.uniform(0.5, 1.0)
+
+    def run_job(self, job: DownloadJob) -> DownloadJob:
+        while True:
+            job.state = "running"
+            job.attempts += 1
+            self.save_state()
+            logger.info(f"Requesting {job.path.name} (attempt {job.attempts})")
+
+            try:
+                request_era5_files(
+                    path=job.path,
+                    year=job.year,
+                    month=job.month,
+                    day=job.day,
+                    area=job.area,
+                    variables=job.variables,
+                    times=job.times,
+                    cache=self.cache,
+                    client_factory=self.client_factory,
+                )
+            except Exception as e:
+                job.error = str(e)
+                if job.attempts > self.max_retries:
+                    job.state = "failed"
+                    self.save_state()
+                    logger.error(f"Giving up on {job.path.name}: {e}")
+                    return job
+
+                delay = self.backoff(job.attempts)
+                job.state = "pending"
+                self.save_state()
+                logger.warning(
+                    f"Request for {job.path.name} failed: {e}. Retrying in {delay:.0f}s"
+                )
+                self.sleep(delay)
+                continue
+
+            job.state = "done"
+            job.error = None
+            self.save_state()
+            logger.info(f"Saved {job.path}")
+            return job
+
+    def run(self) -> list[DownloadJob]:
+        """Run all jobs that are not done yet and return every job."""
+        self.load_state()
+        todo = [job for job in self.jobs if job.state != "done"]
+        logger.info(
+            f"{len(self.jobs) - len(todo)} of {len(self.jobs)} jobs already done, "
+            f"running {len(todo)} with {self.max_workers} workers"
+        )
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            list(executor.map(self.run_job, todo))
+
+        return self.jobs
@@ -39,3 +39,34 @@ Default_CDS_Request_Variable_List = List[Default_CDS_Request_Variable]
 The list of default variables to request from the CDS API.
 """
 Default_CDS_Request_Variables = list(get_args(Default_CDS_Request_Variable))
+
+"""
+The short name under which each default variable appears in the NetCDF files
+returned by the CDS API.
+"""
+Default_CDS_Request_Variable_NetCDF_Names: dict[str, str] = {
+    "mean_total_precipitation_rate": "mtpr",
+    "precipitation_type": "ptype",
+    "surface_pressure": "sp",
+    "surface_solar_radiation_downwards": "ssrd",
+    "total_cloud_cover": "tcc",
+    "10m_wind_gust_since_previous_post_processing": "fg10",
+    "2m_dewpoint_temperature": "d2m",
+    "2m_temperature": "t2m",
+    "clear_sky_direct_solar_radiation_at_surface": "cdir",
+    "instantaneous_10m_wind_gust": "i10fg",
+    "large_scale_snowfall_rate_water_equivalent": "lssfr",
+    "maximum_2m_temperature_since_previous_post_processing": "mx2t",
+    "snow_depth": "sd",
+    "snowfall": "sf",
+    "soil_temperature_level_1": "stl1",
+    "total_precipitation": "tp",
+    "total_sky_direct_solar_radiation_at_surface": "fdir",
+    "large_scale_rain_rate": "lsrr",
+    "large_scale_precipitation": "lsp",
+    "mean_sea_level_pressure": "msl",
+    "minimum_2m_temperature_since_previous_post_processing": "mn2t",
+    "skin_temperature": "skt",
+    "10m_u_component_of_wind": "u10",
+    "10m_v_component_of_wind": "v10",
+}
@@ -0,0 +1,190 @@
+import logging
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Literal, get_args
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+"""
+Type for an output format of the SERL report.
+"""
+OutputFormat = Literal["csv", "parquet", "arrow"]
+
+"""
+Type for a column the parquet output can be partitioned by.
+"""
+PartitionColumn = Literal["month", "grid_cell"]
+
+OUTPUT_FORMATS = list(get_args(OutputFormat))
+PARTITION_COLUMNS = list(get_args(PartitionColumn))
+
+OUTPUT_FORMAT_SUFFIXES: dict[str, OutputFormat] = {
+    ".csv": "csv",
+    ".parquet": "parquet",
+    ".pq": "parquet",
+    ".arrow": "arrow",
+    ".feather": "arrow",
+    ".ipc": "arrow",
+}
+
+# isodates with T and Z
+CSV_DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+logger = logging.getLogger(__name__)
+
+
+def output_format_from_path(path: Path) -> OutputFormat:
+    """Infer the output format from the file suffix, defaulting to CSV."""
+    return OUTPUT_FORMAT_SUFFIXES.get(path.suffix.lower(), "csv")
+
+
+class TableWriter(ABC):
+    """Writes DataFrames to a single output, one chunk at a time."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.rows_written = 0
+
+    def write(self, df: pd.DataFrame) -> None:
+        self._write(df)
+        self.rows_written += len(df)
+        logger.debug(f"Wrote {len(df)} rows to {self.path}")
+
+    @abstractmethod
+    def _write(self, df: pd.DataFrame) -> None: ...
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> "TableWriter":
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+
+class CsvWriter(TableWriter):
+    def _write(self, df: pd.DataFrame) -> None:
+        first_chunk = self.rows_written == 0
+        df.to_csv(
+            self.path,
+            index=False,
+            mode="w" if first_chunk else "a",
+            header=first_chunk,
+            date_format=CSV_DATE_FORMAT,
+        )
+
+
+class _ArrowTableWriter(TableWriter):
+    """Converts chunks to Arrow tables sharing the schema of the first chunk."""
+
+    def __init__(self, path: Path):
+        super().__init__(path)
+        self._schema: pa.Schema | None = None
+
+    def _to_table(self, df: pd.DataFrame) -> pa.Table:
+        # categorical columns (grid_cell) become dictionary encoded columns
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if self._schema is None:
+            self._schema = table.schema
+        return table.cast(self._schema)
+
+
+class ParquetWriter(_ArrowTableWriter):
+    def __init__(self, path: Path):
+        super().__init__(path)
+        self._writer: pq.ParquetWriter | None = None
+
+    def _write(self, df: pd.DataFrame) -> None:
+        table = self._to_table(df)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.path, table.schema)
+        self._writer.write_table(table)
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+
+
+class ArrowWriter(_ArrowTableWriter):
+    """Writes an Arrow IPC (Feather v2) file."""
+
+    def __init__(self, path: Path):
+        super().__init__(path)
+        self._sink: pa.NativeFile | None = None
+        self._writer: pa.ipc.RecordBatchFileWriter | None = None
+
+    def _write(self, df: pd.DataFrame) -> None:
+        table = self._to_table(df)
+        if self._writer is None:
+            self._sink = pa.OSFile(str(self.path), "wb")
+            self._writer = pa.ipc.new_file(self._sink, table.schema)
+        self._writer.write_table(table)
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        if self._sink is not None:
+            self._sink.close()
+
+
+class PartitionedParquetWriter(_ArrowTableWriter):
+    """
+    Writes a hive-partitioned parquet dataset under `path`, e.g.
+    `path/month=2024-01/grid_cell=14_20/part-0-0.parquet`.
+
+    Files are named after `basename` and the chunk number, so re-running the
+    same input overwrites its own files and several inputs can share a dataset.
+    """
+
+    def __init__(
+        self, path: Path, partition_by: list[PartitionColumn], basename: str = "part"
+    ):
+        super().__init__(path)
+        self.partition_by = partition_by
+        self.basename = basename
+        self._chunk = 0
+
+    def _write(self, df: pd.DataFrame) -> None:
+        if "month" in self.partition_by:
+            if "analysis_date" not in df.columns:
+                raise ValueError("Partitioning by month requires analysis_date")
+            df = df.assign(
+                month=pd.to_datetime(df["analysis_date"]).dt.strftime("%Y-%m")
+            )
+
+        pq.write_to_dataset(
+            self._to_table(df),
+            root_path=self.path,
+            partition_cols=list(self.partition_by),
+            basename_template=f"{self.basename}-{self._chunk}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+        )
+        self._chunk += 1
+
+
+def open_writer(
+    path: Path,
+    output_format: OutputFormat | None = None,
+    partition_by: list[PartitionColumn] | None = None,
+    basename: str = "part",
+) -> TableWriter:
+    """
+    Open a writer for `path`. The format is inferred from the suffix when not
+    given; partitioned output is a directory and is only supported for parquet.
+    """
+    if output_format is None:
+        output_format = "parquet" if partition_by else output_format_from_path(path)
+
+    if partition_by:
+        if output_format != "parquet":
+            raise ValueError("Partitioning is only supported for parquet output")
+        return PartitionedParquetWriter(path, partition_by, basename=basename)
+
+    if output_format == "parquet":
+        return ParquetWriter(path)
+    if output_format == "arrow":
+        return ArrowWriter(path)
+    return CsvWriter(path)
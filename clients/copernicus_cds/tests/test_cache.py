@@ -0,0 +1,69 @@
+import zipfile
+
+import pytest
+from copernicus_cds.cache import DownloadCache, subset_download
+from copernicus_cds.fake_client import FakeCdsClient
+from copernicus_cds.request import get_era5_request_dict, request_era5_files
+
+AREA = (52.0, -1.0, 51.5, -0.5)
+
+
+def request(days: list[int], variables: list[str]) -> dict:
+    return get_era5_request_dict(
+        year=2024,
+        month=1,
+        day=days,
+        area=AREA,
+        variables=variables,
+        times=["00:00", "12:00"],
+    )
+
+
+def download(path, request_dict: dict) -> None:
+    FakeCdsClient().retrieve("reanalysis-era5-single-levels", request_dict, path)
+
+
+def test_subset_download(tmp_path):
+    source = tmp_path / "source.zip"
+    download(source, request([1, 2], ["2m_temperature", "total_precipitation"]))
+    target = tmp_path / "target.zip"
+
+    subset_download(source, request([2], ["2m_temperature"]), target)
+
+    with zipfile.ZipFile(target) as subset:
+        assert len(subset.namelist()) == 1
+
+
+def test_subset_download_without_data_raises(tmp_path):
+    source = tmp_path / "source.zip"
+    download(source, request([1, 2], ["2m_temperature"]))
+    target = tmp_path / "target.zip"
+
+    with pytest.raises(ValueError):
+        subset_download(source, request([2], ["total_precipitation"]), target)
+    assert not target.exists()
+
+
+def test_empty_subset_falls_back_to_a_download(tmp_path):
+    cache = DownloadCache(tmp_path / "cache")
+    source = tmp_path / "source.zip"
+    download(source, request([1, 2], ["2m_temperature"]))
+    # a manifest promising a variable that the file does not hold
+    cache.put(request([1, 2], ["2m_temperature", "total_precipitation"]), source)
+
+    client = FakeCdsClient()
+    target = tmp_path / "target.zip"
+    request_era5_files(
+        target,
+        2024,
+        1,
+        day=[2],
+        area=AREA,
+        variables=["total_precipitation"],
+        times=["00:00", "12:00"],
+        cache=cache,
+        client_factory=lambda: client,
+    )
+
+    assert len(client.requests) == 1
+    assert zipfile.is_zipfile(target)
@@ -0,0 +1,61 @@
+import pytest
+from copernicus_cds.fake_client import fake_era5_dataset
+from copernicus_cds.netcdf_utils import GRID_POINT_DIM, NetCDFProcessor
+from copernicus_cds.request import get_era5_request_dict
+
+
+def dataset(variable: str, area: tuple[float, float, float, float]):
+    return fake_era5_dataset(
+        get_era5_request_dict(
+            year=2024,
+            month=1,
+            day=[1],
+            area=area,
+            variables=[variable],
+            times=["00:00", "12:00"],
+        )
+    )
+
+
+def test_merge_stacked_datasets():
+    processor = NetCDFProcessor()
+    area = (52.0, -1.0, 51.0, 0.0)
+    prepared = [
+        processor.prepare_dataset(dataset(variable, area), stack_grid_points=True)
+        for variable in ["2m_temperature", "total_precipitation"]
+    ]
+
+    merged = processor.merge_datasets(prepared)
+
+    assert set(merged.data_vars) >= {"t2m", "tp", "grid_cell"}
+    assert merged.sizes[GRID_POINT_DIM] == prepared[0].sizes[GRID_POINT_DIM]
+
+
+def test_merge_stacked_datasets_with_other_points_raises():
+    processor = NetCDFProcessor()
+    prepared = [
+        processor.prepare_dataset(
+            dataset("2m_temperature", (52.0, -1.0, 51.0, 0.0)), stack_grid_points=True
+        ),
+        processor.prepare_dataset(
+            dataset("total_precipitation", (52.0, -0.75, 51.0, 0.25)),
+            stack_grid_points=True,
+        ),
+    ]
+
+    with pytest.raises(ValueError):
+        processor.merge_datasets(prepared)
+
+
+def test_merge_gridded_datasets_aligns_on_coordinates():
+    processor = NetCDFProcessor()
+    prepared = [
+        processor.prepare_dataset(dataset("2m_temperature", (52.0, -1.0, 51.0, 0.0))),
+        processor.prepare_dataset(
+            dataset("total_precipitation", (52.0, -0.75, 51.0, 0.25))
+        ),
+    ]
+
+    merged = processor.merge_datasets(prepared)
+
+    assert merged.sizes["longitude"] == 6
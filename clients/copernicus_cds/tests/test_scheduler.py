@@ -0,0 +1,156 @@
+import json
+import zipfile
+from pathlib import Path
+
+import pytest
+import xarray as xr
+from copernicus_cds.cache import DownloadCache
+from copernicus_cds.fake_client import FAKE_MEMBER_NAME, FakeCdsClient
+from copernicus_cds.scheduler import DownloadJob, DownloadScheduler
+
+# a few grid points and hours keep the fake downloads small
+AREA = (52.0, -1.0, 51.5, -0.5)
+VARIABLES = ["2m_temperature", "total_precipitation"]
+TIMES = ["00:00", "12:00"]
+
+
+def job(path: Path, days: list[int]) -> DownloadJob:
+    return DownloadJob(
+        path=path,
+        year=2024,
+        month=1,
+        day=days,
+        area=AREA,
+        variables=list(VARIABLES),
+        times=list(TIMES),
+    )
+
+
+def scheduler(
+    jobs: list[DownloadJob],
+    client: FakeCdsClient,
+    sleeps: list[float],
+    state_path: Path | None = None,
+    **kwargs,
+) -> DownloadScheduler:
+    return DownloadScheduler(
+        jobs,
+        max_workers=2,
+        backoff_seconds=10.0,
+        state_path=state_path,
+        client_factory=lambda: client,
+        sleep=sleeps.append,
+        **kwargs,
+    )
+
+
+def saved_states(state_path: Path) -> dict[str, str]:
+    jobs = json.loads(state_path.read_text())["jobs"]
+    return {Path(job["path"]).name: job["state"] for job in jobs}
+
+
+def test_fake_client_writes_era5_zip(tmp_path):
+    path = tmp_path / "jan.zip"
+    client = FakeCdsClient()
+
+    scheduler([job(path, [1, 2])], client, []).run()
+
+    with zipfile.ZipFile(path) as download:
+        assert download.namelist() == [FAKE_MEMBER_NAME]
+        download.extract(FAKE_MEMBER_NAME, tmp_path)
+    with xr.open_dataset(tmp_path / FAKE_MEMBER_NAME) as ds:
+        assert set(ds.data_vars) == {"t2m", "tp"}
+        assert ds.sizes == {"valid_time": 4, "latitude": 3, "longitude": 3}
+    assert len(client.requests) == 1
+
+
+def test_retries_with_backoff(tmp_path):
+    client = FakeCdsClient(fail_first=2)
+    sleeps: list[float] = []
+
+    jobs = scheduler([job(tmp_path / "jan.zip", [1])], client, sleeps).run()
+
+    assert jobs[0].state == "done"
+    assert jobs[0].attempts == 3
+    assert jobs[0].error is None
+    assert len(client.requests) == 3
+    # exponential backoff with jitter: 10s then 20s, each scaled by 0.5 to 1
+    assert 5.0 <= sleeps[0] <= 10.0
+    assert 10.0 <= sleeps[1] <= 20.0
+
+
+def test_gives_up_after_max_retries(tmp_path):
+    client = FakeCdsClient(fail_targets=["jan.zip"])
+    sleeps: list[float] = []
+    state_path = tmp_path / "fetch_state.json"
+
+    jobs = scheduler(
+        [job(tmp_path / "jan.zip", [1])],
+        client,
+        sleeps,
+        state_path=state_path,
+        max_retries=2,
+    ).run()
+
+    assert jobs[0].state == "failed"
+    assert jobs[0].attempts == 3
+    assert "jan.zip" in jobs[0].error
+    assert len(sleeps) == 2
+    assert not jobs[0].path.exists()
+    assert saved_states(state_path) == {"jan.zip": "failed"}
+
+
+def test_resumes_after_partial_run(tmp_path):
+    state_path = tmp_path / "fetch_state.json"
+
+    def jobs() -> list[DownloadJob]:
+        return [
+            job(tmp_path / "jan_01.zip", [1]),
+            job(tmp_path / "jan_02.zip", [2]),
+            job(tmp_path / "jan_03.zip", [3]),
+        ]
+
+    first_client = FakeCdsClient(fail_targets=["jan_02.zip"])
+    scheduler(jobs(), first_client, [], state_path=state_path, max_retries=0).run()
+    assert saved_states(state_path) == {
+        "jan_01.zip": "done",
+        "jan_02.zip": "failed",
+        "jan_03.zip": "done",
+    }
+
+    second_client = FakeCdsClient()
+    resumed = scheduler(jobs(), second_client, [], state_path=state_path).run()
+
+    assert [job.state for job in resumed] == ["done", "done", "done"]
+    assert [request["day"] for request in second_client.requests] == [["02"]]
+    assert set(saved_states(state_path).values()) == {"done"}
+
+
+def test_resume_downloads_missing_files_again(tmp_path):
+    state_path = tmp_path / "fetch_state.json"
+    path = tmp_path / "jan.zip"
+    scheduler([job(path, [1])], FakeCdsClient(), [], state_path=state_path).run()
+    path.unlink()
+
+    client = FakeCdsClient()
+    resumed = scheduler([job(path, [1])], client, [], state_path=state_path).run()
+
+    assert resumed[0].state == "done"
+    assert path.exists()
+    assert len(client.requests) == 1
+
+
+@pytest.mark.parametrize("days", [[1, 2], [2]])
+def test_cached_downloads_skip_the_client(tmp_path, days):
+    cache = DownloadCache(tmp_path / "cache")
+    scheduler(
+        [job(tmp_path / "first.zip", [1, 2])], FakeCdsClient(), [], cache=cache
+    ).run()
+
+    client = FakeCdsClient(fail_first=1)
+    jobs = scheduler(
+        [job(tmp_path / "second.zip", days)], client, [], cache=cache
+    ).run()
+
+    assert jobs[0].state == "done"
+    assert client.requests == []
@@ -1,20 +1,26 @@
+import asyncio
 import base64
+import email.utils
+import importlib.util
 import json
 import logging
 import os
-from datetime import datetime, timedelta
-from typing import List, Literal
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import List, Literal, TypeVar
 
 import dotenv
-import requests
+import httpx
 import toml
 from pydantic import BaseModel
 from vaillant.schemas import (
-    SystemSettingsResponse,
+    SystemComponentsConsumption,
+    SystemConsumption,
     TokenErrorResponse,
     TokenResponse,
     VaillantApiException,
 )
+from vaillant.token_cache import TokenCache
 
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
@@ -25,6 +31,13 @@ VAILLANT_API_ENDPOINT_ROOT = os.getenv(
     "VAILLANT_API_ENDPOINT_ROOT", "https://api.vaillant-group.com"
 )
 
+# HTTP/2 needs the h2 package (httpx[http2]); HTTP/1.1 keep-alive otherwise
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_MAX_CONNECTIONS = 20
+
+M = TypeVar("M", bound=BaseModel)
+
 
 class VaillantApiConfig(BaseModel):
     token_endpoint: str = f"{VAILLANT_API_ENDPOINT_ROOT}/uaa/oauth/token"
@@ -77,8 +90,18 @@ class VaillantApiConfig(BaseModel):
                 )
 
 
-class VaillantApi:
-    def __init__(self, config: VaillantApiConfig, serials: List[str]) -> None:
+class BaseVaillantApi:
+    """
+    What the sync and async clients share: validation, request building and
+    token handling. Subclasses only send the requests.
+    """
+
+    def __init__(
+        self,
+        config: VaillantApiConfig,
+        serials: List[str],
+        token_cache: TokenCache | None = None,
+    ) -> None:
         if not isinstance(config, VaillantApiConfig):
             raise TypeError("config must be an instance of VaillantApiConfig")
 
@@ -91,12 +114,24 @@ class VaillantApi:
         self._config = config
         self._serials: List[str] = serials
         self._token = None
+        # shared with other processes, so that each doesn't request a token
+        self._token_cache = token_cache or TokenCache()
+
+    @staticmethod
+    def _client_options(max_connections: int) -> dict:
+        """Options of the pooled httpx client, kept open between requests."""
+        return {
+            "http2": HTTP2_AVAILABLE,
+            "timeout": DEFAULT_TIMEOUT,
+            "limits": httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+        }
 
-    def _request(
-        self, url: str, method: Literal["GET", "POST"] = "GET", data: dict = None
-    ) -> requests.Response:
-        token = self.get_token()
-
+    def _request_params(
+        self, token: str, url: str, method: Literal["GET", "POST"], data: dict | None
+    ) -> dict:
         headers = {
             "Content-Type": (
                 "application/json"
@@ -107,50 +142,85 @@ class VaillantApi:
             "Ocp-Apim-Subscription-Key": self._config.subscription_key,
         }
 
-        request_params = {
+        return {
             "method": method,
             "url": url,
             "headers": headers,
-            "data": json.dumps(data) if method == "POST" else None,
+            "content": json.dumps(data) if method == "POST" else None,
         }
 
+    @staticmethod
+    def _retry_after(response: httpx.Response) -> float | None:
+        """The Retry-After header in seconds, given as seconds or as a date."""
+        value = response.headers.get("Retry-After")
+        if value is None:
+            return None
         try:
-            response = requests.request(**request_params)
-            response.raise_for_status()
-            return response
-        except requests.RequestException as e:
-            logger.debug(response.text)
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            retry_at = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+    @classmethod
+    def _request_failed(cls, e: httpx.HTTPError) -> VaillantApiException:
+        error = TokenErrorResponse(error="request_failed", error_description=str(e))
+        if not isinstance(e, httpx.HTTPStatusError):
+            return VaillantApiException(error)
+
+        logger.debug(e.response.text)
+        return VaillantApiException(
+            error,
+            status_code=e.response.status_code,
+            retry_after=cls._retry_after(e.response),
+        )
 
+    @staticmethod
+    def _parse(model: type[M], response: httpx.Response) -> M:
+        try:
+            return model.model_validate(response.json())
+        except ValueError as e:
             raise VaillantApiException(
-                TokenErrorResponse(error="request_failed", error_description=str(e))
+                TokenErrorResponse(error="invalid_response", error_description=str(e)),
+                status_code=response.status_code,
             )
 
-    def get_token(self) -> str:
+    @staticmethod
+    def _contract_serials(systems: list | dict) -> List[str]:
         """
-        Get the access token for the API
-        Documentation here: https://developer.vaillant-group.com/api-specs#api=authorization_server&operation=create-access-token
-
+        Serial numbers in a contract systems response: a list of systems, or
+        an object listing them under "systems".
         """
-        # FIXME: this is insecure; remove it later
-        if os.path.exists("access_token.txt"):
-            last_modified = os.path.getmtime("access_token.txt")
-            if datetime.now().timestamp() - last_modified < 3600:
-                logger.debug("Token in the file is still valid")
-                logger.warning("Using the token from the file")
-                with open("cache/access_token.txt", "r") as f:
-                    return f.read()
-
-        if self._token and self._token.expires_at > datetime.now().timestamp():
+        if isinstance(systems, dict):
+            systems = systems.get("systems", [])
+        return [
+            system["serialNumber"] for system in systems if "serialNumber" in system
+        ]
+
+    def _cached_token(self) -> str | None:
+        if self._token_cache.is_valid(self._token):
             logger.debug("Token is still valid")
             return self._token.access_token
 
+        token = self._token_cache.get(self._config.client_id)
+        if token is not None:
+            logger.debug("Using the token from the cache")
+            self._token = token
+            return token.access_token
+
+        return None
+
+    def _token_request_params(self) -> dict:
         # FIXME: refresh token in't used because the documentation doesn't mention it
 
         b64encoded_user_pass = base64.b64encode(
             f"{self._config.client_id}:{self._config.client_secret}".encode()
         ).decode()
 
-        request_params = {
+        return {
             "method": "POST",
             "url": self._config.token_endpoint,
             "headers": {
@@ -163,16 +233,13 @@ class VaillantApi:
             },
         }
 
-        response = requests.request(**request_params)
+    def _store_token(self, response: httpx.Response) -> str:
         try:
             token = TokenResponse(**response.json())
-            token.expires_at = token.expires_in + datetime.now().timestamp()
+            token.expires_at = int(token.expires_in + datetime.now().timestamp())
 
             self._token = token
-
-            # FIXME: remove this insecure code
-            with open("cache/access_token.txt", "w") as f:
-                f.write(token.access_token)
+            self._token_cache.put(self._config.client_id, token)
 
             return token.access_token
         except Exception as e:
@@ -182,125 +249,320 @@ class VaillantApi:
                 )
             )
 
+    def _consumption_url(
+        self,
+        serial: str,
+        resource: str,
+        scale: Literal["hourly", "daily", "monthly"],
+        from_datetime: datetime | None,
+        to_datetime: datetime | None,
+    ) -> str:
+        # the last day by default, as of the call
+        to_datetime = to_datetime or datetime.now()
+        from_datetime = from_datetime or to_datetime - timedelta(days=1)
+        timestamp_from = int(from_datetime.replace(microsecond=0).timestamp())
+        timestamp_to = int(to_datetime.replace(microsecond=0).timestamp())
+
+        return f"{self._config.consumption_endpoint}/{serial}/{resource}?scale={scale}&from={timestamp_from}&to={timestamp_to}"
+
+    def _settings_url(self, system_id: str, include_metadata: bool) -> str:
+        return f"{self._config.settings_endpoint}/{system_id}?includeMetadata={str(include_metadata).lower()}"
+
+    def _topology_url(self, serial: str) -> str:
+        return f"{self._config.topology_endpoint}/{serial}"
+
+    def _contract_systems_url(self) -> str:
+        contract_number = self._config.contract_number
+        return f"{self._config.contract_systems_endpoint}/{contract_number}/systems"
+
+    @staticmethod
+    def _save(path: str, response: httpx.Response) -> None:
+        """Keep the raw response of the endpoints that aren't parsed yet."""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as f:
+            f.write(response.text)
+
+
+class VaillantApi(BaseVaillantApi):
+    """
+    Requests go through one pooled httpx client, so connections (and TLS
+    sessions) are reused across calls, over HTTP/2 if h2 is installed. Close
+    the client with `close()` or by using the API as a context manager.
+    """
+
+    def __init__(
+        self,
+        config: VaillantApiConfig,
+        serials: List[str],
+        client: httpx.Client | None = None,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        token_cache: TokenCache | None = None,
+    ) -> None:
+        super().__init__(config, serials, token_cache)
+        self._client = client or httpx.Client(**self._client_options(max_connections))
+
+    def close(self) -> None:
+        self._client.close()
+
+    def __enter__(self) -> "VaillantApi":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def _request(
+        self, url: str, method: Literal["GET", "POST"] = "GET", data: dict = None
+    ) -> httpx.Response:
+        token = self.get_token()
+
+        try:
+            response = self._client.request(
+                **self._request_params(token, url, method, data)
+            )
+            response.raise_for_status()
+            return response
+        except httpx.HTTPError as e:
+            raise self._request_failed(e)
+
+    def get_token(self) -> str:
+        """
+        Get the access token for the API
+        Documentation here: https://developer.vaillant-group.com/api-specs#api=authorization_server&operation=create-access-token
+
+        """
+        token = self._cached_token()
+        if token is not None:
+            return token
+
+        with self._token_cache.locked():
+            # another process may have refreshed it while this one waited
+            token = self._cached_token()
+            if token is not None:
+                return token
+
+            response = self._client.request(**self._token_request_params())
+            return self._store_token(response)
+
     def get_components_consumption(
         self,
         serial: str,
         scale: Literal["hourly", "daily", "monthly"] = "hourly",
-        from_datetime: datetime = datetime.now() - timedelta(days=1),
-        to_datetime: datetime = datetime.now(),
-    ) -> None:
+        from_datetime: datetime | None = None,
+        to_datetime: datetime | None = None,
+    ) -> SystemComponentsConsumption:
         """
         Get consumption data of all system components in a system
         Shows for the selected time period the total consumption and the consumptions, fanned out for all known components (e.g. heat pump, boiler) within a system.
 
         Confer with consumption explanation in Endpoint `Get consumption data of a system`.
+        Covers the last day unless a window is given.
         https://developer.vaillant-group.com/api-specs#api=consumption_api&operation=get-consumption-for-system-components
         """
-        timestamp_from = int(from_datetime.replace(microsecond=0).timestamp())
-        timestamp_to = int(to_datetime.replace(microsecond=0).timestamp())
-
-        url = f"{self._config.consumption_endpoint}/{serial}/system-components/consumption?scale={scale}&from={timestamp_from}&to={timestamp_to}"
+        url = self._consumption_url(
+            serial, "system-components/consumption", scale, from_datetime, to_datetime
+        )
         response = self._request(url, method="GET")
-        with open(f"cache/sys_cons_{serial}.json", "w") as f:
-            f.write(response.text)
+        return self._parse(SystemComponentsConsumption, response)
 
     def get_single_consumption(
         self,
         serial: str,
         scale: Literal["hourly", "daily", "monthly"] = "hourly",
-        from_datetime: datetime = datetime.now() - timedelta(days=1),
-        to_datetime: datetime = datetime.now(),
-    ) -> None:
+        from_datetime: datetime | None = None,
+        to_datetime: datetime | None = None,
+    ) -> SystemConsumption:
         """
         Get consumption data of a system.
 
         Shows consumptions for the selected time period for central heating, cooling, hot water and solar yield in relation to the entire system.
+        Covers the last day unless a window is given.
 
 
         https://developer.vaillant-group.com/api-specs#api=consumption_api&operation=get-consumption-for-system
         """
-        timestamp_from = int(from_datetime.replace(microsecond=0).timestamp())
-        timestamp_to = int(to_datetime.replace(microsecond=0).timestamp())
-
-        url = f"{self._config.consumption_endpoint}/{serial}/consumption?scale={scale}&from={timestamp_from}&to={timestamp_to}"
-        response = self._request(url, method="GET")
-
-        # FIXME: impelement the response parsing
-        with open(f"cache/single_cons_{serial}.json", "w") as f:
-            f.write(response.text)
-
-    def get_components_consumption(
-        self,
-        serial: str,
-        scale: Literal["hourly", "daily", "monthly"] = "hourly",
-        from_datetime: datetime = datetime.now() - timedelta(days=1),
-        to_datetime: datetime = datetime.now(),
-    ) -> None:
-        """
-        Get the consumption for the given serial
-        "https://api.vaillant-group.com/service-connected-control/consumption-api/v1/systems/${serialNumber}/system-components/consumption?scale=hourly[&from][&to]"
-        """
-        timestamp_from = int(from_datetime.replace(microsecond=0).timestamp())
-        timestamp_to = int(to_datetime.replace(microsecond=0).timestamp())
-
-        url = f"{self._config.consumption_endpoint}/{serial}/system-components/consumption?scale={scale}&from={timestamp_from}&to={timestamp_to}"
+        url = self._consumption_url(
+            serial, "consumption", scale, from_datetime, to_datetime
+        )
         response = self._request(url, method="GET")
-        # FIXME: impelement the response parsing
-        with open(f"cache/sys_cons_{serial}.json", "w") as f:
-            f.write(response.text)
+        return self._parse(SystemConsumption, response)
 
     def get_system_settings(
         self, system_id: str, include_metadata: bool = True
-    ) -> SystemSettingsResponse:
+    ) -> None:
         """
         Get system settings for the given system ID.
         """
-        url = f"{self._config.settings_endpoint}/{system_id}?includeMetadata={str(include_metadata).lower()}"
+        url = self._settings_url(system_id, include_metadata)
         response = self._request(url, method="GET")
 
-        # FIXME: impelement the response parsing
         # e.g. SystemSettingsResponse(**response.json())
-        with open(f"cache/sys_set_{system_id}.json", "w") as f:
-            f.write(response.text)
+        self._save(f"cache/sys_set_{system_id}.json", response)
 
     def get_topology(self, serial: str) -> None:
         """
         Get the topology for the given serial
         https://developer.vaillant-group.com/api-specs#api=systems-api-v2&operation=get-hvac-system-topology
         """
-        url = f"{self._config.topology_endpoint}/{serial}"
-        response = self._request(url, method="GET")
-        # FIXME: impelement the response parsing
-        with open(f"cache/topology_{serial}.json", "w") as f:
-            f.write(response.text)
+        response = self._request(self._topology_url(serial), method="GET")
+        self._save(f"cache/topology_{serial}.json", response)
 
-    def get_contract_systems(self) -> None:
+    def get_contract_systems(self) -> list | dict:
         """
         Get the contract systems
         """
-        contract_number = self._config.contract_number
-
-        url = f"{self._config.contract_systems_endpoint}/{contract_number}/systems"
-        response = self._request(url, method="GET")
+        response = self._request(self._contract_systems_url(), method="GET")
+        self._save(
+            f"cache/contract_systems_{self._config.contract_number}.json", response
+        )
+        return response.json()
 
-        # FIXME: impelement the response parsing
-        with open(f"cache/contract_systems_{contract_number}.json", "w") as f:
-            f.write(response.text)
+    def get_contract_serials(self) -> List[str]:
+        """Serial numbers of all the systems of the contract."""
+        return self._contract_serials(self.get_contract_systems())
 
     def register_client(self, serial: str, email: str, country: str = "GB") -> None:
         """
         Register a client
         """
-        contract_number = self._config.contract_number
-
-        url = f"{self._config.contract_systems_endpoint}/{contract_number}/systems"
-
         response = self._request(
-            url,
+            self._contract_systems_url(),
             method="POST",
             data={"serialNumber": serial, "email": email, "country": country},
         )
+        self._save(f"register_client_{response.status_code}_{serial}.json", response)
 
-        # FIXME: impelement the response parsing
-        with open(f"register_client_{response.status_code}_{serial}.json", "w") as f:
-            f.write(response.text)
+
+class AsyncVaillantApi(BaseVaillantApi):
+    """
+    Async variant of `VaillantApi` on a pooled `httpx.AsyncClient`, with the
+    same methods as coroutines, to query many systems concurrently. Use it
+    as an async context manager, or call `aclose()`.
+    """
+
+    def __init__(
+        self,
+        config: VaillantApiConfig,
+        serials: List[str],
+        client: httpx.AsyncClient | None = None,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        token_cache: TokenCache | None = None,
+    ) -> None:
+        super().__init__(config, serials, token_cache)
+        self._client = client or httpx.AsyncClient(
+            **self._client_options(max_connections)
+        )
+        # concurrent requests wait for a single token request
+        self._token_lock = asyncio.Lock()
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    async def __aenter__(self) -> "AsyncVaillantApi":
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.aclose()
+
+    async def _request(
+        self, url: str, method: Literal["GET", "POST"] = "GET", data: dict = None
+    ) -> httpx.Response:
+        token = await self.get_token()
+
+        try:
+            response = await self._client.request(
+                **self._request_params(token, url, method, data)
+            )
+            response.raise_for_status()
+            return response
+        except httpx.HTTPError as e:
+            raise self._request_failed(e)
+
+    async def get_token(self) -> str:
+        """See `VaillantApi.get_token`."""
+        token = self._cached_token()
+        if token is not None:
+            return token
+
+        async with self._token_lock:
+            # the file lock blocks, so it is taken off the event loop
+            lock_file = await asyncio.to_thread(self._token_cache.acquire)
+            try:
+                # another task or process may have fetched it while this one waited
+                token = self._cached_token()
+                if token is not None:
+                    return token
+
+                response = await self._client.request(**self._token_request_params())
+                return self._store_token(response)
+            finally:
+                self._token_cache.release(lock_file)
+
+    async def get_components_consumption(
+        self,
+        serial: str,
+        scale: Literal["hourly", "daily", "monthly"] = "hourly",
+        from_datetime: datetime | None = None,
+        to_datetime: datetime | None = None,
+    ) -> SystemComponentsConsumption:
+        """See `VaillantApi.get_components_consumption`."""
+        url = self._consumption_url(
+            serial, "system-components/consumption", scale, from_datetime, to_datetime
+        )
+        response = await self._request(url, method="GET")
+        return self._parse(SystemComponentsConsumption, response)
+
+    async def get_single_consumption(
+        self,
+        serial: str,
+        scale: Literal["hourly", "daily", "monthly"] = "hourly",
+        from_datetime: datetime | None = None,
+        to_datetime: datetime | None = None,
+    ) -> SystemConsumption:
+        """See `VaillantApi.get_single_consumption`."""
+        url = self._consumption_url(
+            serial, "consumption", scale, from_datetime, to_datetime
+        )
+        response = await self._request(url, method="GET")
+        return self._parse(SystemConsumption, response)
+
+    async def _save_async(self, path: str, response: httpx.Response) -> None:
+        # file writes would block the event loop
+        await asyncio.to_thread(self._save, path, response)
+
+    async def get_system_settings(
+        self, system_id: str, include_metadata: bool = True
+    ) -> None:
+        """See `VaillantApi.get_system_settings`."""
+        url = self._settings_url(system_id, include_metadata)
+        response = await self._request(url, method="GET")
+        await self._save_async(f"cache/sys_set_{system_id}.json", response)
+
+    async def get_topology(self, serial: str) -> None:
+        """See `VaillantApi.get_topology`."""
+        response = await self._request(self._topology_url(serial), method="GET")
+        await self._save_async(f"cache/topology_{serial}.json", response)
+
+    async def get_contract_systems(self) -> list | dict:
+        """See `VaillantApi.get_contract_systems`."""
+        response = await self._request(self._contract_systems_url(), method="GET")
+        await self._save_async(
+            f"cache/contract_systems_{self._config.contract_number}.json", response
+        )
+        return response.json()
+
+    async def get_contract_serials(self) -> List[str]:
+        """See `VaillantApi.get_contract_serials`."""
+        return self._contract_serials(await self.get_contract_systems())
+
+    async def register_client(
+        self, serial: str, email: str, country: str = "GB"
+    ) -> None:
+        """See `VaillantApi.register_client`."""
+        response = await self._request(
+            self._contract_systems_url(),
+            method="POST",
+            data={"serialNumber": serial, "email": email, "country": country},
+        )
+        await self._save_async(
+            f"register_client_{response.status_code}_{serial}.json", response
+        )
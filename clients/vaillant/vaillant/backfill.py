@@ -0,0 +1,262 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Literal, Sequence
+
+from vaillant.api import AsyncVaillantApi, VaillantApiConfig
+from vaillant.fleet import (
+    DEFAULT_BURST,
+    DEFAULT_CONCURRENCY,
+    DEFAULT_MAX_RETRIES,
+    DEFAULT_RATE,
+    FleetCall,
+    FleetCollector,
+    FleetSummary,
+    SerialResult,
+)
+from vaillant.store import ConsumptionStore
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+"""Type for the time scale of consumption data"""
+Scale = Literal["hourly", "daily", "monthly"]
+
+# longest window requested per call for each scale; pass a shorter `window`
+# if the API rejects them
+MAX_WINDOWS: dict[Scale, timedelta] = {
+    "hourly": timedelta(days=7),
+    "daily": timedelta(days=31),
+    "monthly": timedelta(days=366),
+}
+
+DEFAULT_BACKFILL_DIR = "cache/backfill"
+
+
+def split_windows(
+    start: datetime, end: datetime, scale: Scale, window: timedelta | None = None
+) -> List[tuple[datetime, datetime]]:
+    """
+    Consecutive windows of at most `window` (the scale's maximum by
+    default) covering [start, end). The same range always gives the same
+    windows, so a backfill can be resumed.
+    """
+    if end <= start:
+        raise ValueError("end must be after start")
+    if scale not in MAX_WINDOWS:
+        raise ValueError(f"scale must be one of {', '.join(MAX_WINDOWS)}")
+
+    window = window or MAX_WINDOWS[scale]
+    if window <= timedelta(0):
+        raise ValueError("window must be positive")
+
+    windows = []
+    while start < end:
+        windows.append((start, min(start + window, end)))
+        start += window
+    return windows
+
+
+def merge_periods(periods: List[dict]) -> List[dict]:
+    """Periods in time order, those returned by two windows only once."""
+    merged = {(period.get("from"), period.get("to")): period for period in periods}
+    return sorted(merged.values(), key=lambda period: period.get("from") or 0)
+
+
+def stitch(call: FleetCall, responses: List[list | dict]) -> list | dict:
+    """
+    One response for the whole range from those of its windows, in order:
+    the periods of a system, or of each of its components.
+    """
+    if call == "single_consumption":
+        return {
+            "consumptions": merge_periods(
+                [
+                    period
+                    for response in responses
+                    for period in response["consumptions"]
+                ]
+            )
+        }
+
+    components: dict[str, dict] = {}
+    for response in responses:
+        for component in response:
+            serial = component["systemComponentSerialNumber"]
+            if serial not in components:
+                components[serial] = {**component, "consumptions": []}
+            else:
+                stitched = components[serial]
+                stitched["from"] = min(stitched["from"], component["from"])
+                stitched["to"] = max(stitched["to"], component["to"])
+                stitched["totalConsumption"] += component["totalConsumption"]
+            components[serial]["consumptions"] += component["consumptions"]
+
+    for component in components.values():
+        component["consumptions"] = merge_periods(component["consumptions"])
+    return list(components.values())
+
+
+class BackfillStore:
+    """
+    The responses of completed windows, one JSON file each under
+    `directory`/<serial>/windows, and the stitched series of each serial.
+    Files are written whole (renamed into place), so a window is either
+    complete or absent.
+    """
+
+    def __init__(self, directory: str | Path = DEFAULT_BACKFILL_DIR) -> None:
+        self.directory = Path(directory)
+
+    def window_path(
+        self,
+        serial: str,
+        call: FleetCall,
+        scale: Scale,
+        start: datetime,
+        end: datetime,
+    ) -> Path:
+        return (
+            self.directory
+            / serial
+            / "windows"
+            / f"{call}_{scale}_{int(start.timestamp())}_{int(end.timestamp())}.json"
+        )
+
+    def series_path(
+        self,
+        serial: str,
+        call: FleetCall,
+        scale: Scale,
+        start: datetime,
+        end: datetime,
+    ) -> Path:
+        return (
+            self.directory
+            / serial
+            / f"{call}_{scale}_{start:%Y%m%d%H%M}_{end:%Y%m%d%H%M}.json"
+        )
+
+    @staticmethod
+    def write(path: Path, data: list | dict) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_suffix(".tmp")
+        temporary.write_text(json.dumps(data))
+        os.replace(temporary, path)
+
+    @staticmethod
+    def read(path: Path) -> list | dict:
+        return json.loads(path.read_text())
+
+
+async def backfill_serial(
+    collector: FleetCollector,
+    store: BackfillStore,
+    serial: str,
+    calls: Sequence[FleetCall],
+    scale: Scale,
+    windows: List[tuple[datetime, datetime]],
+) -> SerialResult:
+    """
+    Fetch the windows of `serial` not yet in `store`, concurrently, then
+    stitch each call's windows into one series. Windows fetched before a
+    failure are kept for the next run.
+    """
+    result = SerialResult(serial)
+
+    async def fetch(call: FleetCall, start: datetime, end: datetime) -> None:
+        method = getattr(collector.api, f"get_{call}")
+        consumption = await collector.request(
+            result, lambda: method(serial, scale, start, end)
+        )
+        if collector.consumption_store is not None:
+            collector.consumption_store.upsert(serial, scale, consumption)
+        store.write(
+            store.window_path(serial, call, scale, start, end),
+            consumption.model_dump(mode="json", by_alias=True, exclude_none=True),
+        )
+
+    pending = [
+        (call, start, end)
+        for call in calls
+        for start, end in windows
+        if not store.window_path(serial, call, scale, start, end).exists()
+    ]
+    if len(pending) < len(calls) * len(windows):
+        logger.info(
+            f"{serial}: resuming, {len(pending)} of {len(calls) * len(windows)} windows left"
+        )
+
+    outcomes = await asyncio.gather(
+        *(fetch(call, start, end) for call, start, end in pending),
+        return_exceptions=True,
+    )
+    errors = [outcome for outcome in outcomes if isinstance(outcome, Exception)]
+    if errors:
+        result.error = f"{len(errors)} of {len(pending)} windows failed: {errors[0]}"
+        logger.error(f"Failed to backfill {serial}: {result.error}")
+        return result
+
+    for call in calls:
+        responses = [
+            store.read(store.window_path(serial, call, scale, start, end))
+            for start, end in windows
+        ]
+        store.write(
+            store.series_path(serial, call, scale, windows[0][0], windows[-1][1]),
+            stitch(call, responses),
+        )
+
+    return result
+
+
+async def backfill(
+    config: VaillantApiConfig,
+    start: datetime,
+    end: datetime,
+    serials: List[str] | None = None,
+    calls: Sequence[FleetCall] = ("single_consumption",),
+    scale: Scale = "hourly",
+    directory: str | Path = DEFAULT_BACKFILL_DIR,
+    window: timedelta | None = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    rate: float = DEFAULT_RATE,
+    burst: int = DEFAULT_BURST,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    consumption_store: ConsumptionStore | None = None,
+) -> FleetSummary:
+    """
+    Backfill the consumption of `serials` (every system of the contract if
+    not given) from `start` to `end`, split into windows
+    fetched under the limits of `FleetCollector`, and added to
+    `consumption_store` if given. Run it again with the same range to
+    resume: completed windows are read from `directory`.
+    """
+    windows = split_windows(start, end, scale, window)
+    store = BackfillStore(directory)
+
+    async with AsyncVaillantApi(
+        config, serials or [], max_connections=concurrency
+    ) as api:
+        collector = FleetCollector(
+            api, concurrency, rate, burst, max_retries, consumption_store
+        )
+        if serials is None:
+            serials = await collector.contract_serials()
+
+        logger.info(
+            f"Backfilling {len(serials)} systems, {len(windows)} {scale} windows each"
+        )
+        summary_start = time.monotonic()
+        results = await asyncio.gather(
+            *(
+                backfill_serial(collector, store, serial, calls, scale, windows)
+                for serial in serials
+            )
+        )
+
+    return FleetSummary(list(results), time.monotonic() - summary_start)
@@ -0,0 +1,255 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, List, Literal, Sequence, TypeVar
+
+from vaillant.api import AsyncVaillantApi, VaillantApiConfig
+from vaillant.schemas import VaillantApiException
+from vaillant.store import ConsumptionStore
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# tune the rate to the APIM subscription quota, e.g. 600 calls a minute
+DEFAULT_CONCURRENCY = 16
+DEFAULT_RATE = 10.0
+DEFAULT_BURST = 10
+DEFAULT_MAX_RETRIES = 5
+# first backoff when a 429/503 response has no Retry-After, doubled per retry
+DEFAULT_BACKOFF = 1.0
+RETRY_STATUS_CODES = {429, 503}
+
+T = TypeVar("T")
+
+"""Type for the consumption calls made for each system"""
+FleetCall = Literal["single_consumption", "components_consumption"]
+
+
+class TokenBucket:
+    """
+    Rate limiter shared by concurrent tasks: `rate` requests per second on
+    average, with bursts of up to `capacity`. `pause()` holds every task
+    back, e.g. for the Retry-After of a throttled response.
+    """
+
+    def __init__(self, rate: float, capacity: int) -> None:
+        if rate <= 0 or capacity < 1:
+            raise ValueError("rate must be positive and capacity at least 1")
+
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        # waiting tasks are served in order
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+@dataclass
+class SerialResult:
+    """Outcome of the calls made for one system."""
+
+    serial: str
+    calls: int = 0
+    retries: int = 0
+    # time spent in its requests
+    seconds: float = 0.0
+    error: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class FleetSummary:
+    results: List[SerialResult] = field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def succeeded(self) -> List[SerialResult]:
+        return [result for result in self.results if result.ok]
+
+    @property
+    def failed(self) -> List[SerialResult]:
+        return [result for result in self.results if not result.ok]
+
+    def __str__(self) -> str:
+        retries = sum(result.retries for result in self.results)
+        lines = [
+            f"{len(self.succeeded)}/{len(self.results)} systems collected "
+            f"in {self.seconds:.1f}s ({retries} retries)"
+        ]
+        lines += [f"  {result.serial}: {result.error}" for result in self.failed]
+        return "\n".join(lines)
+
+
+class FleetCollector:
+    """
+    Collects the consumption of many systems at once: at most `concurrency`
+    requests in flight, every request through a shared `TokenBucket`, and
+    429/503 responses retried after their Retry-After (or an exponential
+    backoff) up to `max_retries` times. Responses are added to
+    `consumption_store` if given.
+    """
+
+    def __init__(
+        self,
+        api: AsyncVaillantApi,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        rate: float = DEFAULT_RATE,
+        burst: int = DEFAULT_BURST,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        consumption_store: ConsumptionStore | None = None,
+    ) -> None:
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+
+        self.api = api
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.consumption_store = consumption_store
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def _call(self, result: SerialResult, call: Callable[[], Awaitable[T]]) -> T:
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            try:
+                response = await call()
+                result.calls += 1
+                return response
+            except VaillantApiException as e:
+                if (
+                    e.status_code not in RETRY_STATUS_CODES
+                    or attempt == self.max_retries
+                ):
+                    raise
+
+                delay = (
+                    e.retry_after
+                    if e.retry_after is not None
+                    else DEFAULT_BACKOFF * 2**attempt
+                )
+                logger.warning(
+                    f"{result.serial}: throttled ({e.status_code}), retrying in {delay:.1f}s"
+                )
+                # the quota is shared, so every task backs off
+                self.bucket.pause(delay)
+                result.retries += 1
+
+    async def request(
+        self, result: SerialResult, call: Callable[[], Awaitable[T]]
+    ) -> T:
+        """Make one call within the concurrency and rate limits, retrying it."""
+        async with self._semaphore:
+            start = time.monotonic()
+            try:
+                return await self._call(result, call)
+            finally:
+                result.seconds += time.monotonic() - start
+
+    async def contract_serials(self) -> List[str]:
+        """Serials of every system of the contract, throttled like the rest."""
+        result = SerialResult(self.api._config.contract_number)
+        return await self.request(result, self.api.get_contract_serials)
+
+    async def collect_serial(
+        self,
+        serial: str,
+        calls: Sequence[FleetCall],
+        scale: Literal["hourly", "daily", "monthly"],
+        from_datetime: datetime,
+        to_datetime: datetime,
+    ) -> SerialResult:
+        result = SerialResult(serial)
+
+        try:
+            for name in calls:
+                method = getattr(self.api, f"get_{name}")
+                consumption = await self.request(
+                    result,
+                    lambda: method(serial, scale, from_datetime, to_datetime),
+                )
+                if self.consumption_store is not None:
+                    self.consumption_store.upsert(serial, scale, consumption)
+        except Exception as e:
+            logger.error(f"Failed to collect {serial}: {e}")
+            result.error = str(e)
+
+        return result
+
+    async def collect(
+        self,
+        serials: List[str],
+        calls: Sequence[FleetCall] = ("single_consumption",),
+        scale: Literal["hourly", "daily", "monthly"] = "hourly",
+        from_datetime: datetime | None = None,
+        to_datetime: datetime | None = None,
+    ) -> FleetSummary:
+        """Make `calls` for every serial; failures are reported, not raised."""
+        to_datetime = to_datetime or datetime.now()
+        from_datetime = from_datetime or to_datetime - timedelta(days=1)
+
+        start = time.monotonic()
+        results = await asyncio.gather(
+            *(
+                self.collect_serial(serial, calls, scale, from_datetime, to_datetime)
+                for serial in serials
+            )
+        )
+        return FleetSummary(list(results), time.monotonic() - start)
+
+
+async def collect_fleet(
+    config: VaillantApiConfig,
+    serials: List[str] | None = None,
+    calls: Sequence[FleetCall] = ("single_consumption",),
+    scale: Literal["hourly", "daily", "monthly"] = "hourly",
+    from_datetime: datetime | None = None,
+    to_datetime: datetime | None = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    rate: float = DEFAULT_RATE,
+    burst: int = DEFAULT_BURST,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    consumption_store: ConsumptionStore | None = None,
+) -> FleetSummary:
+    """
+    Collect the consumption of `serials`, or of every system of the
+    contract if not given, over one connection pool.
+    """
+    async with AsyncVaillantApi(
+        config, serials or [], max_connections=concurrency
+    ) as api:
+        collector = FleetCollector(
+            api, concurrency, rate, burst, max_retries, consumption_store
+        )
+        if serials is None:
+            serials = await collector.contract_serials()
+            logger.info(f"{len(serials)} systems in contract {config.contract_number}")
+
+        return await collector.collect(
+            serials, calls, scale, from_datetime, to_datetime
+        )
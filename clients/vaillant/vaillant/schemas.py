@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import List, Literal
 
-from pydantic import BaseModel, RootModel
+from pydantic import BaseModel, ConfigDict, Field, RootModel
 
 
 class TokenResponse(BaseModel):
@@ -23,8 +23,16 @@ class TokenErrorResponse(BaseModel):
 
 
 class VaillantApiException(Exception):
-    def __init__(self, error_response: TokenErrorResponse):
+    def __init__(
+        self,
+        error_response: TokenErrorResponse,
+        status_code: int | None = None,
+        retry_after: float | None = None,
+    ):
         self.error_response = error_response
+        # HTTP status of the failed request, and its Retry-After in seconds
+        self.status_code = status_code
+        self.retry_after = retry_after
         super().__init__(str(error_response))
 
 
@@ -36,7 +44,9 @@ class ConsumptionDetail(BaseModel):
 
 
 class ConsumptionPeriod(BaseModel):
-    from_: int
+    model_config = ConfigDict(populate_by_name=True)
+
+    from_: int = Field(alias="from")
     to: int
     centralHeating: ConsumptionDetail | None = None
     domesticHotWater: ConsumptionDetail | None = None
@@ -45,14 +55,24 @@ class ConsumptionPeriod(BaseModel):
 
 
 class SystemComponentConsumption(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
     systemComponentSerialNumber: str
     deviceType: str
     totalConsumption: int
-    from_: int
+    from_: int = Field(alias="from")
     to: int
     consumptions: List[ConsumptionPeriod]
 
 
+class SystemConsumption(BaseModel):
+    consumptions: List[ConsumptionPeriod]
+
+
+class SystemComponentsConsumption(RootModel):
+    root: List[SystemComponentConsumption]
+
+
 class ConsumptionErrorResponse(BaseModel):
     status: int | None = None
     reason: str | None = None
@@ -0,0 +1,191 @@
+import logging
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Literal
+
+import duckdb
+from vaillant.schemas import (
+    ConsumptionDetail,
+    ConsumptionPeriod,
+    SystemComponentsConsumption,
+    SystemConsumption,
+)
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+DEFAULT_STORE_PATH = "cache/consumption.duckdb"
+
+# component_serial is '' for the consumption of the whole system; times are UTC
+CREATE_CONSUMPTION = """
+    CREATE TABLE IF NOT EXISTS consumption (
+        serial VARCHAR NOT NULL,
+        component_serial VARCHAR NOT NULL,
+        device_type VARCHAR,
+        scale VARCHAR NOT NULL,
+        period_from TIMESTAMP NOT NULL,
+        period_to TIMESTAMP NOT NULL,
+        central_heating_electricity BIGINT,
+        central_heating_gas BIGINT,
+        central_heating_environmental_yield BIGINT,
+        central_heating_generated BIGINT,
+        domestic_hot_water_electricity BIGINT,
+        domestic_hot_water_gas BIGINT,
+        domestic_hot_water_environmental_yield BIGINT,
+        domestic_hot_water_generated BIGINT,
+        cooling_electricity BIGINT,
+        cooling_gas BIGINT,
+        cooling_environmental_yield BIGINT,
+        cooling_generated BIGINT,
+        solar_yield BIGINT,
+        updated_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (serial, component_serial, scale, period_from)
+    )"""
+
+COLUMN_TYPES = {
+    "serial": "VARCHAR",
+    "component_serial": "VARCHAR",
+    "device_type": "VARCHAR",
+    "scale": "VARCHAR",
+    "period_from": "TIMESTAMP",
+    "period_to": "TIMESTAMP",
+    **{
+        f"{use}_{commodity}": "BIGINT"
+        for use in ("central_heating", "domestic_hot_water", "cooling")
+        for commodity in ("electricity", "gas", "environmental_yield", "generated")
+    },
+    "solar_yield": "BIGINT",
+    "updated_at": "TIMESTAMP",
+}
+
+# the rows are bound as one list per column, unnested side by side; a period
+# fetched again (e.g. the last, incomplete hour) replaces the old row
+UPSERT_CONSUMPTION = "INSERT OR REPLACE INTO consumption SELECT " + ", ".join(
+    f"unnest(${i}::{column_type}[])"
+    for i, column_type in enumerate(COLUMN_TYPES.values(), start=1)
+)
+
+
+def utc(timestamp: int) -> datetime:
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None)
+
+
+def detail_values(detail: ConsumptionDetail | None) -> tuple:
+    if detail is None:
+        return (None, None, None, None)
+    return (
+        detail.electricity,
+        detail.gas,
+        detail.environmentalYield,
+        detail.generated,
+    )
+
+
+def period_row(
+    serial: str,
+    component_serial: str,
+    device_type: str | None,
+    scale: str,
+    period: ConsumptionPeriod,
+    updated_at: datetime,
+) -> tuple:
+    return (
+        serial,
+        component_serial,
+        device_type,
+        scale,
+        utc(period.from_),
+        utc(period.to),
+        *detail_values(period.centralHeating),
+        *detail_values(period.domesticHotWater),
+        *detail_values(period.cooling),
+        period.solarYield,
+        updated_at,
+    )
+
+
+def consumption_rows(
+    serial: str,
+    scale: Literal["hourly", "daily", "monthly"],
+    consumption: SystemConsumption | SystemComponentsConsumption,
+) -> List[tuple]:
+    """Rows of the consumption table, one per period (and component)."""
+    updated_at = datetime.now(timezone.utc).replace(tzinfo=None)
+
+    if isinstance(consumption, SystemConsumption):
+        return [
+            period_row(serial, "", None, scale, period, updated_at)
+            for period in consumption.consumptions
+        ]
+
+    return [
+        period_row(
+            serial,
+            component.systemComponentSerialNumber,
+            component.deviceType,
+            scale,
+            period,
+            updated_at,
+        )
+        for component in consumption.root
+        for period in component.consumptions
+    ]
+
+
+class ConsumptionStore:
+    """
+    Consumption periods of every system in one DuckDB table, keyed by
+    serial, component, scale and period start, so that fetching a period
+    again updates it instead of adding a row.
+    """
+
+    def __init__(self, db_path: str | Path = DEFAULT_STORE_PATH) -> None:
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.db = duckdb.connect(str(db_path))
+        self.db.execute(CREATE_CONSUMPTION)
+
+    def close(self) -> None:
+        self.db.close()
+
+    def __enter__(self) -> "ConsumptionStore":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def upsert(
+        self,
+        serial: str,
+        scale: Literal["hourly", "daily", "monthly"],
+        consumption: SystemConsumption | SystemComponentsConsumption,
+    ) -> int:
+        """Store the periods of a consumption response; returns their number."""
+        # one row per key, or the statement would conflict with itself
+        rows = list(
+            {
+                row[:5]: row for row in consumption_rows(serial, scale, consumption)
+            }.values()
+        )
+        if not rows:
+            return 0
+
+        self.db.execute(UPSERT_CONSUMPTION, [list(column) for column in zip(*rows)])
+
+        logger.debug(f"Stored {len(rows)} {scale} periods of {serial}")
+        return len(rows)
+
+    def export_parquet(self, output_dir: str | Path) -> None:
+        """
+        Write the table as Parquet files partitioned by serial and month
+        (serial=.../month=YYYY-MM/), replacing a previous export.
+        """
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+        path = str(output_dir).replace("'", "''")
+        self.db.execute(
+            f"""
+            COPY (
+                SELECT *, strftime(period_from, '%Y-%m') AS month
+                FROM consumption
+                ORDER BY serial, component_serial, scale, period_from
+            ) TO '{path}' (FORMAT parquet, PARTITION_BY (serial, month), OVERWRITE)"""
+        )
@@ -0,0 +1,108 @@
+import fcntl
+import json
+import logging
+import os
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import IO, Iterator
+
+from vaillant.schemas import TokenResponse
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+DEFAULT_TOKEN_CACHE = os.getenv("VAILLANT_TOKEN_CACHE", "cache/vaillant_token.json")
+# tokens this close to expiry are refreshed, so none expires mid-request
+DEFAULT_EXPIRY_MARGIN = 60.0
+
+
+class TokenCache:
+    """
+    Access tokens shared by every process using the same file, one per
+    client id. The file is only readable by its owner and is replaced
+    atomically, so readers never see a partial write. Refreshes take an
+    exclusive lock (`locked()`), so only one process requests a new token
+    while the others wait for it.
+    """
+
+    def __init__(
+        self,
+        path: str | Path = DEFAULT_TOKEN_CACHE,
+        expiry_margin: float = DEFAULT_EXPIRY_MARGIN,
+    ) -> None:
+        self.path = Path(path)
+        self.expiry_margin = expiry_margin
+
+    @property
+    def lock_path(self) -> Path:
+        return self.path.with_name(f"{self.path.name}.lock")
+
+    def is_valid(self, token: TokenResponse | None) -> bool:
+        return (
+            token is not None
+            and token.expires_at is not None
+            and token.expires_at - self.expiry_margin > datetime.now().timestamp()
+        )
+
+    def _read(self) -> dict:
+        try:
+            return json.loads(self.path.read_text())
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            logger.warning(f"Ignoring the unreadable token cache {self.path}")
+            return {}
+
+    def get(self, client_id: str) -> TokenResponse | None:
+        """The cached token of `client_id`, if it is still valid."""
+        data = self._read().get(client_id)
+        if data is None:
+            return None
+
+        try:
+            token = TokenResponse(**data)
+        except ValueError:
+            return None
+        return token if self.is_valid(token) else None
+
+    def put(self, client_id: str, token: TokenResponse) -> None:
+        """Store the token of `client_id`; call it while `locked()`."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = self._read()
+        data[client_id] = token.model_dump()
+
+        # mkstemp creates the file readable by its owner only
+        fd, temporary = tempfile.mkstemp(dir=self.path.parent, prefix=".token-")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f)
+            os.replace(temporary, self.path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def acquire(self) -> IO:
+        """Block until this process holds the refresh lock."""
+        self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+        lock_file = open(self.lock_path, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        except BaseException:
+            lock_file.close()
+            raise
+        return lock_file
+
+    @staticmethod
+    def release(lock_file: IO) -> None:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        lock_file = self.acquire()
+        try:
+            yield
+        finally:
+            self.release(lock_file)
@@ -1,27 +1,87 @@
 import calendar
 import logging
+import time
 from datetime import date, datetime, timedelta
 from pathlib import Path
 from typing import List, Optional, Tuple
 
 import typer
+from copernicus_cds.batch import find_zip_files, process_zip_files
+from copernicus_cds.cache import DownloadCache
 from copernicus_cds.netcdf_utils import NetCDFProcessor, ProcessingConfig
-from copernicus_cds.request import request_era5_files
+from copernicus_cds.request import (
+    DEFAULT_MAX_FIELDS,
+    ERA5_HOURS,
+    Demand,
+    plan_requests,
+    request_era5_files,
+)
+from copernicus_cds.scheduler import DownloadJob, DownloadScheduler
 from copernicus_cds.schemas import (
     Default_CDS_Request_Variable_List,
     Default_CDS_Request_Variables,
 )
+from copernicus_cds.writers import OUTPUT_FORMATS, PARTITION_COLUMNS
 from edol_cli.commands.climate_config import config as climate_config
 
 logger = logging.getLogger(__name__)
 app = typer.Typer()
 
+DOWNLOAD_CACHE_DIR = ".cds-cache"
+
 
 def get_days_in_month(date: datetime) -> int:
     """Get the number of days in a month."""
     return calendar.monthrange(date.year, date.month)[1]
 
 
+def get_download_cache(
+    cache_dir: Path, enabled: bool, max_size_gb: float
+) -> DownloadCache | None:
+    """Helper function to create the download cache inside the cache directory."""
+    if not enabled:
+        return None
+    return DownloadCache(
+        cache_dir / DOWNLOAD_CACHE_DIR, max_size_bytes=int(max_size_gb * 1024**3)
+    )
+
+
+def get_processing_config(
+    output_format: Optional[str],
+    partition_by: Optional[List[str]],
+    stream: bool,
+    group_by: str,
+    chunk_size: int,
+    dask_chunk_size: Optional[int],
+) -> ProcessingConfig:
+    """Helper function to validate the report options and build the config."""
+    if output_format is not None and output_format not in OUTPUT_FORMATS:
+        logger.error(f"Invalid --format {output_format}. Use one of {OUTPUT_FORMATS}")
+        raise typer.Exit(code=1)
+
+    if partition_by and not set(partition_by).issubset(PARTITION_COLUMNS):
+        logger.error(
+            f"Invalid --partition-by {partition_by}. Use any of {PARTITION_COLUMNS}"
+        )
+        raise typer.Exit(code=1)
+
+    if group_by not in ("grid_cell", "day"):
+        logger.error(f"Invalid --group-by {group_by}. Use grid_cell or day")
+        raise typer.Exit(code=1)
+
+    return ProcessingConfig(
+        output_columns=climate_config["output_columns"],
+        netcdf_field_mapping=climate_config["netcdf_field_mapping"],
+        grid_cells_of_interest=climate_config["grid_cells_of_interest"],
+        streaming=stream,
+        stream_group_by=group_by,
+        stream_chunk_size=chunk_size,
+        output_format=output_format,
+        partition_by=partition_by or None,
+        dask_chunk_size=dask_chunk_size,
+    )
+
+
 @app.command()
 def serl_fetch(
     month: Optional[datetime] = typer.Option(
@@ -39,6 +99,17 @@ def serl_fetch(
         exists=True,
         file_okay=False,
     ),
+    download_cache: bool = typer.Option(
+        True,
+        "--download-cache/--no-download-cache",
+        help=f"Serve requests from previous downloads kept in <cache-dir>/{DOWNLOAD_CACHE_DIR}",
+    ),
+    max_cache_size: float = typer.Option(
+        20.0,
+        "--max-cache-size",
+        min=0,
+        help="Maximum size of the download cache in GB. Least recently used downloads are evicted first",
+    ),
 ) -> None:
     """
     Generate SERL report.
@@ -59,6 +130,7 @@ def serl_fetch(
         path=cache_dir / file_name,
         year=month.year,
         month=month.month,
+        cache=get_download_cache(cache_dir, download_cache, max_cache_size),
     )
 
     logger.info(f"Saved files to disk {cache_dir / file_name}")
@@ -100,9 +172,49 @@ def fetch(
         exists=True,
         file_okay=False,
     ),
+    hours: Optional[List[str]] = typer.Option(
+        None,
+        "--hour",
+        help="Hour of the day to retrieve, e.g. '06:00'. Can be given several times. Default is all 24 hours",
+    ),
+    max_fields: int = typer.Option(
+        DEFAULT_MAX_FIELDS,
+        "--max-fields",
+        min=1,
+        help="Maximum number of fields (variables x days x hours) per CDS request. Larger requests are split",
+    ),
+    concurrency: int = typer.Option(
+        4,
+        "--concurrency",
+        "-j",
+        min=1,
+        help="Number of monthly requests submitted to the CDS API at once",
+    ),
+    retries: int = typer.Option(
+        3,
+        "--retries",
+        min=0,
+        help="Number of times a failed monthly request is retried, with exponential backoff",
+    ),
+    download_cache: bool = typer.Option(
+        True,
+        "--download-cache/--no-download-cache",
+        help=f"Serve requests from previous downloads kept in <cache-dir>/{DOWNLOAD_CACHE_DIR}",
+    ),
+    max_cache_size: float = typer.Option(
+        20.0,
+        "--max-cache-size",
+        min=0,
+        help="Maximum size of the download cache in GB. Least recently used downloads are evicted first",
+    ),
 ) -> None:
     """
     Fetch data from the CDS API.
+
+    The date range is planned into as few requests as the CDS field limit
+    allows, skipping days already in the download cache. Requests run
+    concurrently. Progress is saved to fetch_state.json in
+    the cache directory, so re-running the same command resumes a partial run.
     """
     logger.info(f"Fetching data for parameters {parameters}")
 
@@ -123,44 +235,55 @@ def fetch(
         f"Fetching {",".join(parameters)} data for period {start_date} to {end_date} for bbox {bbox}"
     )
 
-    # split in months
-    months = [
-        start_date.replace(day=1),
-    ]
-    while months[-1] < end_date.replace(day=1):
-        months.append((months[-1] + timedelta(days=32)).replace(day=1))
-
-    logger.debug(f"Months to fetch: {months}")
-
-    for i, m in enumerate(months):
-        start_day = 1
-        end_day = get_days_in_month(m)
-
-        if i == 0:
-            start_day = start_date.day
-
-        if i == len(months) - 1:
-            end_day = end_date.day
+    cache = get_download_cache(cache_dir, download_cache, max_cache_size)
+    plan = plan_requests(
+        [
+            Demand(
+                start=start_date,
+                end=end_date,
+                area=bbox,
+                variables=parameters,
+                times=hours or list(ERA5_HOURS),
+            )
+        ],
+        max_fields=max_fields,
+        cache=cache,
+    )
 
-        days = list(range(start_day, end_day + 1))
+    jobs = []
+    for i, request in enumerate(plan):
+        file_name = request.file_name()
+        logger.debug(
+            f"Request {i+1}/{len(plan)} {request.year}-{request.month:02d}: "
+            f"{request.days}, {request.fields} fields"
+            f"{' (cached)' if request.cached else ''}, saving to {file_name}"
+        )
 
-        logger.info(f"Fetching {i+1}/{len(months)} for {m:%Y-%m}: {days}")
+        jobs.append(
+            DownloadJob(
+                path=cache_dir / file_name,
+                year=request.year,
+                month=request.month,
+                day=request.days,
+                area=request.area,
+                variables=request.variables,
+                times=request.times,
+            )
+        )
 
-        bbox_str = "_".join(map(str, bbox))
+    scheduler = DownloadScheduler(
+        jobs,
+        max_workers=concurrency,
+        max_retries=retries,
+        state_path=cache_dir / "fetch_state.json",
+        cache=cache,
+    )
+    failed = [job for job in scheduler.run() if job.state == "failed"]
 
-        file_name = (
-            f"era5_{bbox_str}_{m:%Y-%m}-{start_day:02d}_to_{m:%Y-%m}-{end_day:02d}.zip"
-        )
-        logger.debug(f"Saving to {cache_dir / file_name}")
-
-        request_era5_files(
-            path=cache_dir / file_name,
-            year=m.year,
-            month=m.month,
-            day=days,
-            area=bbox,
-            variables=parameters,
-        )
+    if failed:
+        for job in failed:
+            logger.error(f"Failed to fetch {job.path.name}: {job.error}")
+        raise typer.Exit(code=1)
 
 
 @app.command()
@@ -176,10 +299,43 @@ def serl_report(
     ),
     output_file: Path = typer.Argument(
         None,
-        help="Path to the output CSV file",
+        help="Path to the output file, or directory when partitioning. The format is inferred from the suffix (.csv, .parquet, .arrow) unless --format is given",
         writable=True,
         resolve_path=True,
     ),
+    output_format: Optional[str] = typer.Option(
+        None,
+        "--format",
+        "-f",
+        help=f"Output format. One of: {", ".join(OUTPUT_FORMATS)}. Default is inferred from the output file suffix",
+    ),
+    partition_by: Optional[List[str]] = typer.Option(
+        None,
+        "--partition-by",
+        help=f"Write a hive-partitioned parquet dataset, partitioned by any of: {", ".join(PARTITION_COLUMNS)}",
+    ),
+    stream: bool = typer.Option(
+        False,
+        "--stream/--no-stream",
+        help="Write the output chunk by chunk to keep memory usage bounded",
+    ),
+    group_by: str = typer.Option(
+        "grid_cell",
+        "--group-by",
+        help="How to chunk the output when streaming. One of: grid_cell (default) or day. Grouping by day orders the output by day first",
+    ),
+    chunk_size: int = typer.Option(
+        32,
+        "--chunk-size",
+        min=1,
+        help="Number of grid cells or days per chunk when streaming",
+    ),
+    dask_chunk_size: Optional[int] = typer.Option(
+        None,
+        "--dask-chunks",
+        min=1,
+        help="Open the NetCDF files lazily with dask, in chunks of this many hourly time steps, to process them out-of-core on all cores",
+    ),
 ):
     """
     Generate SERL report.
@@ -190,15 +346,17 @@ def serl_report(
         logger.error("Only zip files are supported")
         raise typer.Abort("Only zip files are supported")
 
+    edol_processor_config = get_processing_config(
+        output_format, partition_by, stream, group_by, chunk_size, dask_chunk_size
+    )
+
     if output_file is None:
-        output_file = zip_nc_file.with_suffix(".csv")
+        if partition_by:
+            output_file = zip_nc_file.with_suffix("")
+        else:
+            output_file = zip_nc_file.with_suffix(f".{output_format or "csv"}")
 
     try:
-        edol_processor_config = ProcessingConfig(
-            output_columns=climate_config["output_columns"],
-            netcdf_field_mapping=climate_config["netcdf_field_mapping"],
-            grid_cells_of_interest=climate_config["grid_cells_of_interest"],
-        )
         processor = NetCDFProcessor(edol_processor_config)
 
         processor.process_zip_file(zip_nc_file, output_file)
@@ -207,3 +365,91 @@ def serl_report(
     except Exception as e:
         logger.error(f"Error during processing: {e}")
         raise typer.Exit(code=1)
+
+
+@app.command()
+def serl_report_batch(
+    inputs: str = typer.Argument(
+        ...,
+        help="Directory of zipped netCDF files returned by the CDS API (e.g. uk_2024_01.zip), or a glob pattern matching them",
+    ),
+    output_dir: Path = typer.Argument(
+        ...,
+        file_okay=False,
+        resolve_path=True,
+        help="Directory to write the reports to. Partitioned outputs of all files share one dataset in this directory",
+    ),
+    workers: Optional[int] = typer.Option(
+        None,
+        "--workers",
+        "-j",
+        min=1,
+        help="Number of files processed in parallel. Default is one per CPU",
+    ),
+    output_format: Optional[str] = typer.Option(
+        None,
+        "--format",
+        "-f",
+        help=f"Output format, one of: {", ".join(OUTPUT_FORMATS)}. Default is csv, or parquet when partitioned",
+    ),
+    partition_by: Optional[List[str]] = typer.Option(
+        None,
+        "--partition-by",
+        help=f"Write a hive-partitioned parquet dataset, partitioned by any of: {", ".join(PARTITION_COLUMNS)}",
+    ),
+    stream: bool = typer.Option(
+        False,
+        "--stream/--no-stream",
+        help="Write the output chunk by chunk to keep memory usage bounded",
+    ),
+    group_by: str = typer.Option(
+        "grid_cell",
+        "--group-by",
+        help="How to chunk the output when streaming. One of: grid_cell (default) or day",
+    ),
+    chunk_size: int = typer.Option(
+        32,
+        "--chunk-size",
+        min=1,
+        help="Number of grid cells or days per chunk when streaming",
+    ),
+    dask_chunk_size: Optional[int] = typer.Option(
+        None,
+        "--dask-chunks",
+        min=1,
+        help="Open the NetCDF files lazily with dask, in chunks of this many hourly time steps",
+    ),
+):
+    """
+    Generate SERL reports for many monthly zip files in parallel.
+
+    Each file is processed in its own worker process. A summary of the time
+    taken by every file is printed at the end.
+    """
+    zip_files = find_zip_files(inputs)
+    if not zip_files:
+        logger.error(f"No zip files found in {inputs}")
+        raise typer.Exit(code=1)
+
+    edol_processor_config = get_processing_config(
+        output_format, partition_by, stream, group_by, chunk_size, dask_chunk_size
+    )
+
+    logger.info(f"Generating SERL reports for {len(zip_files)} files in {output_dir}")
+    start = time.perf_counter()
+    results = process_zip_files(
+        zip_files, output_dir, edol_processor_config, max_workers=workers
+    )
+    elapsed = time.perf_counter() - start
+
+    for result in results:
+        status = "ok" if result.ok else f"failed: {result.error}"
+        typer.echo(f"{result.input_path.name:<32} {result.seconds:8.1f}s  {status}")
+
+    failed = [result for result in results if not result.ok]
+    typer.echo(
+        f"Processed {len(results) - len(failed)}/{len(results)} files in {elapsed:.1f}s "
+        f"({sum(r.seconds for r in results):.1f}s of work)"
+    )
+    if failed:
+        raise typer.Exit(code=1)
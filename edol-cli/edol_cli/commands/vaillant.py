@@ -1,11 +1,24 @@
+import asyncio
 import logging
 import os
+from contextlib import nullcontext
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import List, Literal, Optional
+from typing import List, Literal, Optional, get_args
 
 import typer
 from vaillant.api import VaillantApi, VaillantApiConfig
+from vaillant.backfill import DEFAULT_BACKFILL_DIR, Scale
+from vaillant.backfill import backfill as run_backfill
+from vaillant.fleet import (
+    DEFAULT_BURST,
+    DEFAULT_CONCURRENCY,
+    DEFAULT_MAX_RETRIES,
+    DEFAULT_RATE,
+    collect_fleet,
+)
+from vaillant.schemas import SystemComponentsConsumption, SystemConsumption
+from vaillant.store import DEFAULT_STORE_PATH, ConsumptionStore
 
 logger = logging.getLogger(__name__)
 app = typer.Typer()
@@ -16,38 +29,56 @@ default_serials_argument = typer.Argument(
     help="Serial numbers of the systems. If not provided, uses VAILLANT_TEST_SERIALS env var.",
 )
 
+
+def validate_scale(scale: str) -> str:
+    if scale not in get_args(Scale):
+        raise typer.BadParameter(f"Should be one of {', '.join(get_args(Scale))}")
+    return scale
+
+
+# -s is the short flag of --start-date
 default_scale_option = typer.Option(
     "hourly",
     "--scale",
-    "-s",
+    "-t",
+    callback=validate_scale,
     help="Time scale for consumption data. One of: hourly (default), daily or monthly",
 )
 
+# the dates default to the last day as of the call, not of the import
 default_start_date_option = typer.Option(
-    (datetime.now() - timedelta(days=1)),
+    None,
     "--start-date",
     "-s",
     formats=["%Y-%m-%d", "%Y-%m-%d %H:%M:%S"],
-    help="Start date (YYYY-MM-DD or YYYY-MM-DD HH:MM:SS)",
+    help="Start date (YYYY-MM-DD or YYYY-MM-DD HH:MM:SS). Default: a day before the end date",
 )
 
 default_end_date_option = typer.Option(
-    datetime.now(),
+    None,
     "--end-date",
     "-e",
     formats=["%Y-%m-%d", "%Y-%m-%d %H:%M:%S"],
-    help="End date (YYYY-MM-DD or YYYY-MM-DD HH:MM:SS)",
+    help="End date (YYYY-MM-DD or YYYY-MM-DD HH:MM:SS). Default: now",
 )
 
+default_db_option = typer.Option(
+    None,
+    "--db",
+    help=f"DuckDB file to upsert the consumption periods into, e.g. {DEFAULT_STORE_PATH}",
+)
 
-def get_vaillant_client(ctx: typer.Context, serials: List[str]) -> VaillantApi:
-    """Helper function to create VaillantApi client using context configuration."""
-    config = (
+
+def get_vaillant_config(ctx: typer.Context) -> VaillantApiConfig:
+    return (
         ctx.obj.get("config.vaillant", VaillantApiConfig())
         if ctx.obj
         else VaillantApiConfig()
     )
 
+
+def get_serials(serials: List[str]) -> List[str]:
+    """The given serials, or those of the VAILLANT_TEST_SERIALS env var."""
     if not serials:
         # Fallback to environment variable if no serials provided
         env_serials = os.getenv("VAILLANT_TEST_SERIALS", "").split(",")
@@ -57,7 +88,19 @@ def get_vaillant_client(ctx: typer.Context, serials: List[str]) -> VaillantApi:
             )
         serials = env_serials
 
-    return VaillantApi(config=config, serials=serials)
+    return serials
+
+
+def get_vaillant_client(ctx: typer.Context, serials: List[str]) -> VaillantApi:
+    """Helper function to create VaillantApi client using context configuration."""
+    return VaillantApi(config=get_vaillant_config(ctx), serials=get_serials(serials))
+
+
+def save_consumption(
+    path: str, consumption: SystemConsumption | SystemComponentsConsumption
+) -> None:
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    Path(path).write_text(consumption.model_dump_json(by_alias=True, exclude_none=True))
 
 
 @app.command()
@@ -65,8 +108,8 @@ def get_consumption(
     ctx: typer.Context,
     serials: List[str] = default_serials_argument,
     scale: str = default_scale_option,
-    start_date: datetime = default_start_date_option,
-    end_date: datetime = default_end_date_option,
+    start_date: Optional[datetime] = default_start_date_option,
+    end_date: Optional[datetime] = default_end_date_option,
 ) -> None:
     """Get consumption data for specific systems."""
     client = get_vaillant_client(ctx, serials)
@@ -74,12 +117,13 @@ def get_consumption(
     for serial in client._serials:
         try:
             logger.info(f"Getting consumption data for system {serial}")
-            client.get_single_consumption(
+            consumption = client.get_single_consumption(
                 serial=serial,
                 scale=scale,
                 from_datetime=start_date,
                 to_datetime=end_date,
             )
+            save_consumption(f"cache/single_cons_{serial}.json", consumption)
             logger.info(f"Consumption data saved to cache/single_cons_{serial}.json")
         except Exception as e:
             logger.error(f"Failed to get consumption data for {serial}: {e}")
@@ -90,8 +134,8 @@ def get_component_consumption(
     ctx: typer.Context,
     serials: List[str] = default_serials_argument,
     scale: str = default_scale_option,
-    start_date: datetime = default_start_date_option,
-    end_date: datetime = default_end_date_option,
+    start_date: Optional[datetime] = default_start_date_option,
+    end_date: Optional[datetime] = default_end_date_option,
 ) -> None:
     """Get component-level consumption data for specific systems."""
     client = get_vaillant_client(ctx, serials)
@@ -99,12 +143,13 @@ def get_component_consumption(
     for serial in client._serials:
         try:
             logger.info(f"Getting component consumption data for system {serial}")
-            client.get_components_consumption(
+            consumption = client.get_components_consumption(
                 serial=serial,
                 scale=scale,
                 from_datetime=start_date,
                 to_datetime=end_date,
             )
+            save_consumption(f"cache/sys_cons_{serial}.json", consumption)
             logger.info(
                 f"Component consumption data saved to cache/sys_cons_{serial}.json"
             )
@@ -112,6 +157,155 @@ def get_component_consumption(
             logger.error(f"Failed to get component consumption data for {serial}: {e}")
 
 
+@app.command()
+def collect(
+    ctx: typer.Context,
+    serials: List[str] = default_serials_argument,
+    contract: bool = typer.Option(
+        False, "--contract", help="Collect every system of the contract"
+    ),
+    components: bool = typer.Option(
+        False, "--components", help="Also get component-level consumption"
+    ),
+    scale: str = default_scale_option,
+    start_date: Optional[datetime] = default_start_date_option,
+    end_date: Optional[datetime] = default_end_date_option,
+    concurrency: int = typer.Option(
+        DEFAULT_CONCURRENCY, "--concurrency", help="Requests in flight at once"
+    ),
+    rate: float = typer.Option(
+        DEFAULT_RATE,
+        "--rate",
+        help="Requests per second allowed by the API subscription quota",
+    ),
+    burst: int = typer.Option(DEFAULT_BURST, "--burst", help="Burst of requests"),
+    max_retries: int = typer.Option(
+        DEFAULT_MAX_RETRIES, "--max-retries", help="Retries of throttled requests"
+    ),
+    db: Optional[Path] = default_db_option,
+) -> None:
+    """Get consumption data for many systems concurrently, within the rate limit."""
+    calls = ["single_consumption"]
+    if components:
+        calls.append("components_consumption")
+
+    with ConsumptionStore(db) if db else nullcontext() as consumption_store:
+        summary = asyncio.run(
+            collect_fleet(
+                get_vaillant_config(ctx),
+                serials=None if contract else get_serials(serials),
+                calls=calls,
+                scale=scale,
+                from_datetime=start_date,
+                to_datetime=end_date,
+                concurrency=concurrency,
+                rate=rate,
+                burst=burst,
+                max_retries=max_retries,
+                consumption_store=consumption_store,
+            )
+        )
+    typer.echo(str(summary))
+
+    if summary.failed:
+        raise typer.Exit(code=1)
+
+
+@app.command()
+def backfill(
+    ctx: typer.Context,
+    serials: List[str] = default_serials_argument,
+    start_date: datetime = typer.Option(
+        ...,
+        "--start-date",
+        "-s",
+        formats=["%Y-%m-%d", "%Y-%m-%d %H:%M:%S"],
+        help="Start date (YYYY-MM-DD or YYYY-MM-DD HH:MM:SS)",
+    ),
+    end_date: datetime = typer.Option(
+        ...,
+        "--end-date",
+        "-e",
+        formats=["%Y-%m-%d", "%Y-%m-%d %H:%M:%S"],
+        help="End date (YYYY-MM-DD or YYYY-MM-DD HH:MM:SS)",
+    ),
+    contract: bool = typer.Option(
+        False, "--contract", help="Backfill every system of the contract"
+    ),
+    components: bool = typer.Option(
+        False, "--components", help="Also backfill component-level consumption"
+    ),
+    scale: str = default_scale_option,
+    window_days: Optional[int] = typer.Option(
+        None,
+        "--window-days",
+        help="Days per request. Default: the longest window for the scale",
+    ),
+    directory: Path = typer.Option(
+        DEFAULT_BACKFILL_DIR,
+        "--directory",
+        "-d",
+        help="Where completed windows and the stitched series are kept",
+    ),
+    concurrency: int = typer.Option(
+        DEFAULT_CONCURRENCY, "--concurrency", help="Requests in flight at once"
+    ),
+    rate: float = typer.Option(
+        DEFAULT_RATE,
+        "--rate",
+        help="Requests per second allowed by the API subscription quota",
+    ),
+    burst: int = typer.Option(DEFAULT_BURST, "--burst", help="Burst of requests"),
+    max_retries: int = typer.Option(
+        DEFAULT_MAX_RETRIES, "--max-retries", help="Retries of throttled requests"
+    ),
+    db: Optional[Path] = default_db_option,
+) -> None:
+    """
+    Get consumption data over a long period, in windows fetched concurrently.
+    Rerun with the same dates to resume an interrupted backfill.
+    """
+    calls = ["single_consumption"]
+    if components:
+        calls.append("components_consumption")
+
+    with ConsumptionStore(db) if db else nullcontext() as consumption_store:
+        summary = asyncio.run(
+            run_backfill(
+                get_vaillant_config(ctx),
+                start=start_date,
+                end=end_date,
+                serials=None if contract else get_serials(serials),
+                calls=calls,
+                scale=scale,
+                directory=directory,
+                window=timedelta(days=window_days) if window_days else None,
+                concurrency=concurrency,
+                rate=rate,
+                burst=burst,
+                max_retries=max_retries,
+                consumption_store=consumption_store,
+            )
+        )
+    typer.echo(str(summary))
+
+    if summary.failed:
+        raise typer.Exit(code=1)
+
+
+@app.command()
+def export_consumption(
+    output_dir: Path = typer.Argument(..., help="Directory of the Parquet dataset"),
+    db: Path = typer.Option(
+        DEFAULT_STORE_PATH, "--db", help="DuckDB file of the consumption periods"
+    ),
+) -> None:
+    """Export stored consumption to Parquet, partitioned by serial and month."""
+    with ConsumptionStore(db) as consumption_store:
+        consumption_store.export_parquet(output_dir)
+    logger.info(f"Consumption exported to {output_dir}")
+
+
 @app.command()
 def get_settings(
     ctx: typer.Context,